@@ -1,23 +1,27 @@
-from fastapi import FastAPI, BackgroundTasks, Body, File, UploadFile, Query, Form, HTTPException, Request, APIRouter
+from fastapi import FastAPI, Body, File, UploadFile, Query, Form, HTTPException, Request, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from pathlib import Path
 import logging
 import json
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import uuid
 from datetime import datetime
+import os
 import sys
-import time
+import asyncio
 
 # Add project root to Python path
 sys.path.append(str(Path(__file__).parent.parent))
 
 # Import modules
 from modules.task_history_manager import TaskHistoryManager
-from modules.video_cache import VideoCache
+from modules.clip_catalog import get_clip_catalog
+from modules.clip_indexer import ClipIndexer
 from modules.video_cutter_processor import VideoCutterProcessor
 from modules.video_processor import VideoProcessor
+from modules.ffmpeg_runner import report_progress
+from modules.job_control import PRIORITIES, JobHandle, JobCancelledError
 from MC_video.api import router as mc_router
 
 # Initialize paths
@@ -49,10 +53,60 @@ app.add_middleware(
 )
 
 # Initialize processors and managers
-video_processor = VideoProcessor(BASE_PATH)
+clip_catalog = get_clip_catalog(CACHE_DIR / 'clip_catalog.db')
+clip_indexer = ClipIndexer(clip_catalog, [CUT_DIR])
+video_processor = VideoProcessor(BASE_PATH, clip_indexer=clip_indexer)
 video_cutter = VideoCutterProcessor(raw_dir=RAW_DIR, cut_dir=CUT_DIR)
 task_history = TaskHistoryManager(BASE_PATH)
-video_cache = VideoCache(cache_file=CACHE_DIR / 'video_cache.json')
+
+@app.on_event("startup")
+def collect_orphaned_workspaces():
+    """Remove job workspaces left behind by a previous crash"""
+    removed = video_processor.scratch.collect_orphans()
+    if removed:
+        logging.info(f"Removed {removed} orphaned job workspaces")
+
+@app.on_event("startup")
+def start_clip_indexer():
+    """Start watching the cut directory"""
+    clip_indexer.start()
+
+@app.on_event("shutdown")
+def stop_clip_indexer():
+    clip_indexer.stop()
+
+# Render tasks running on the event loop, by task id
+render_tasks: Dict[str, Tuple[asyncio.Task, JobHandle]] = {}
+# Limit in seconds for each ffmpeg step of a render (0: no limit)
+FFMPEG_TIMEOUT = float(os.getenv('FFMPEG_TIMEOUT', '0')) or None
+
+def start_render_task(task_id: str, coro, priority: str = "normal") -> asyncio.Task:
+    """Run a render coroutine on the event loop and keep it cancellable by task id
+
+    The task starts in the context of its JobHandle, so ffmpeg runs in
+    worker threads (subtitle overlay) are killed with it as well, and the
+    job's priority orders its waits for encoder slots.
+    """
+    job = JobHandle(task_id, priority)
+    with job.activate():
+        task = asyncio.create_task(coro, name=f"render-{task_id}")
+    render_tasks[task_id] = (task, job)
+    task.add_done_callback(lambda _: render_tasks.pop(task_id, None))
+    return task
+
+async def cancel_render_task(task: asyncio.Task, job: JobHandle):
+    # Killing processes waits for them to exit, keep that off the event loop
+    await asyncio.to_thread(job.cancel)
+    task.cancel()
+
+@app.on_event("shutdown")
+async def cancel_render_tasks():
+    """Kill running renders so no ffmpeg outlives the server"""
+    running = list(render_tasks.values())
+    for task, job in running:
+        await cancel_render_task(task, job)
+    if running:
+        await asyncio.gather(*(task for task, _ in running), return_exceptions=True)
 
 def update_task_status(task_id: str, status_data: dict):
     """Update task status and save to history"""
@@ -62,6 +116,13 @@ def update_task_status(task_id: str, status_data: dict):
     # Save to history
     task_history.save_task(task_id, status_data)
 
+def update_render_progress(task_id: str, update: dict):
+    """Publish live ffmpeg progress (percent, fps, speed, ETA) in the task status
+
+    Progress is kept in memory; only state changes are written to the history file.
+    """
+    task_history.set_progress(task_id, update)
+
 def get_task_status(task_id: str) -> dict:
     """Get task status from history"""
     status = task_history.get_task(task_id)
@@ -74,14 +135,14 @@ process_router = APIRouter()
 
 @process_router.post("/make")
 async def make_final_video(
-    background_tasks: BackgroundTasks,
     request: Optional[str] = Form(None),
     audio_path: str = Form(None),
     subtitle_path: str = Form(None),
     overlay1_path: str = Form(None),
     overlay2_path: str = Form(None),
     preset_name: str = Form(None),
-    output_name: str = Form(None)
+    output_name: str = Form(None),
+    priority: str = Form("normal", description="Encoder slot priority: urgent, normal or batch")
 ):
     """
     Create final video with:
@@ -104,6 +165,7 @@ async def make_final_video(
                 overlay2_path = request_data.get('overlay2_path', overlay2_path)
                 preset_name = request_data.get('preset_name', preset_name)
                 output_name = request_data.get('output_name', output_name)
+                priority = request_data.get('priority', priority)
             except json.JSONDecodeError:
                 raise HTTPException(status_code=400, detail="Invalid JSON in request")
         
@@ -113,6 +175,11 @@ async def make_final_video(
                 status_code=400,
                 detail="Missing required parameters: audio_path, subtitle_path, preset_name"
             )
+        if priority not in PRIORITIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid priority '{priority}'. Expected one of: {', '.join(PRIORITIES)}"
+            )
             
         # Load preset
         preset_path = BASE_PATH / 'presets' / f"{preset_name}.json"
@@ -143,6 +210,7 @@ async def make_final_video(
             "status": "processing",
             "progress": 0,
             "message": "Starting video processing",
+            "priority": priority,
             "created_at": datetime.now().isoformat(),
             "input_files": {
                 "audio": str(paths['audio']),
@@ -153,8 +221,7 @@ async def make_final_video(
         })
         
         # Start processing in background
-        background_tasks.add_task(
-            make_video_background,
+        start_render_task(task_id, make_video_background(
             processor=video_processor,
             task_id=task_id,
             output_name=output_name,
@@ -163,7 +230,7 @@ async def make_final_video(
             overlay1_path=paths['overlay1'],
             overlay2_path=paths['overlay2'],
             subtitle_config=subtitle_config
-        )
+        ), priority=priority)
         
         return {
             "task_id": task_id,
@@ -171,6 +238,8 @@ async def make_final_video(
             "message": "Video processing started"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in make_final_video: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -195,17 +264,19 @@ async def make_video_background(
         })
         
         # Process video
-        output_path = processor.process_video(
-            audio_path=audio_path,
-            subtitle_path=subtitle_path,
-            overlay1_path=overlay1_path,
-            overlay2_path=overlay2_path,
-            subtitle_config=subtitle_config,
-            output_name=output_name
-        )
+        with report_progress(lambda update: update_render_progress(task_id, update)):
+            output_path = await processor.process_video_async(
+                audio_path=audio_path,
+                subtitle_path=subtitle_path,
+                overlay1_path=overlay1_path,
+                overlay2_path=overlay2_path,
+                subtitle_config=subtitle_config,
+                output_name=output_name,
+                timeout=FFMPEG_TIMEOUT
+            )
         
         # Wait for ffmpeg to fully release files
-        time.sleep(2)  # Đợi 2 giây sau khi xử lý xong
+        await asyncio.sleep(2)  # Đợi 2 giây sau khi xử lý xong
         
         # Update status on success
         update_task_status(task_id, {
@@ -216,6 +287,15 @@ async def make_video_background(
             "completed_at": datetime.now().isoformat()
         })
         
+    except (asyncio.CancelledError, JobCancelledError) as e:
+        update_task_status(task_id, {
+            "status": "cancelled",
+            "progress": 0,
+            "message": "Video processing cancelled",
+            "cancelled_at": datetime.now().isoformat()
+        })
+        if isinstance(e, asyncio.CancelledError):
+            raise
     except Exception as e:
         logging.error(f"Error in make_video_background: {str(e)}")
         update_task_status(task_id, {
@@ -224,6 +304,8 @@ async def make_video_background(
             "message": str(e),
             "error_at": datetime.now().isoformat()
         })
+    finally:
+        task_history.clear_progress(task_id)
 
 @process_router.get("/status/{task_id}")
 async def get_process_status(task_id: str):
@@ -233,6 +315,27 @@ async def get_process_status(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     return status
 
+@process_router.delete("/tasks/{task_id}")
+async def cancel_process_task(task_id: str):
+    """Cancel a running render: kills its ffmpeg, frees the encoder slot and removes its temp files"""
+    running = render_tasks.get(task_id)
+    if running is None:
+        status = get_task_status(task_id)
+        if status["status"] == "not_found":
+            raise HTTPException(status_code=404, detail="Task not found")
+        raise HTTPException(status_code=409, detail=f"Task is not running (status: {status['status']})")
+
+    task, job = running
+    await cancel_render_task(task, job)
+    # Wait for the render to unwind so the response reflects the final state
+    await asyncio.wait({task}, timeout=30)
+    return {"task_id": task_id, "status": get_task_status(task_id)["status"]}
+
+@app.get("/api/scratch")
+async def get_scratch_status():
+    """Scratch volumes, free space and workspace size of recent jobs at cleanup"""
+    return video_processor.scratch.stats()
+
 @app.get("/api/status/{task_id}")
 async def get_status(task_id: str):
     """Get processing status from /api/status endpoint (legacy support)"""
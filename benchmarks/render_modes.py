@@ -0,0 +1,122 @@
+"""Benchmark VideoProcessor single-pass vs two-pass rendering
+
+Renders the same job (same audio, subtitle and clip selection seed) with both
+render modes, then scores each output against a lossless single-pass
+reference with ffmpeg's SSIM and PSNR filters. Clip use counts are neither
+applied nor updated, so every run renders the same clips.
+
+Usage:
+    python benchmarks/render_modes.py --audio a.mp3 --subtitle a.srt [--preset 1] [--runs 2]
+"""
+import argparse
+import json
+import logging
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_PATH = Path(__file__).parent.parent
+sys.path.append(str(BASE_PATH))
+
+from modules.clip_selector import ClipSelector
+from modules.video_processor import VideoProcessor
+
+class _UnmarkedCatalog:
+    """Clip catalog view that does not record clip usage"""
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def mark_used(self, paths):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._catalog, name)
+
+class BenchmarkVideoProcessor(VideoProcessor):
+    """Selects the same clips for a given seed on every run
+
+    Without a repeat penalty the selection depends only on the seed, and
+    not marking clips as used keeps the benchmark out of the shared catalog.
+    """
+
+    def __init__(self, base_path: Path):
+        super().__init__(base_path)
+        self.clip_selector = ClipSelector(fps=30, repeat_penalty=0)
+        self.catalog = _UnmarkedCatalog(self.catalog)
+
+class LosslessVideoProcessor(BenchmarkVideoProcessor):
+    """Renders the reference output with lossless x264"""
+
+    def get_encoding_settings(self) -> dict:
+        return {
+            'hwaccel': [],
+            'video_codec': ['-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0']
+        }
+
+def measure_quality(distorted: Path, reference: Path) -> dict:
+    """Return SSIM (All) and average PSNR of distorted against reference"""
+    cmd = [
+        'ffmpeg', '-hide_banner',
+        '-i', str(distorted),
+        '-i', str(reference),
+        '-lavfi', '[0:v]split[a][b];[1:v]split[c][d];[a][c]ssim;[b][d]psnr',
+        '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    ssim = re.search(r'SSIM .*All:([\d.]+)', result.stderr)
+    psnr = re.search(r'PSNR .*average:([\d.]+|inf)', result.stderr)
+    return {
+        'ssim': float(ssim.group(1)) if ssim else None,
+        'psnr': float(psnr.group(1)) if psnr else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--audio', required=True, type=Path)
+    parser.add_argument('--subtitle', required=True, type=Path)
+    parser.add_argument('--preset', default=None, help='Preset name in presets/')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--runs', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    subtitle_config = {}
+    if args.preset:
+        with open(BASE_PATH / 'presets' / f"{args.preset}.json", 'r') as f:
+            subtitle_config = json.load(f)
+
+    common = dict(
+        audio_path=args.audio,
+        subtitle_path=args.subtitle,
+        subtitle_config=subtitle_config,
+        seed=args.seed
+    )
+
+    reference = LosslessVideoProcessor(BASE_PATH).process_video(
+        output_name='bench_reference.mp4', render_mode='single_pass', **common
+    )
+
+    processor = BenchmarkVideoProcessor(BASE_PATH)
+    report = {}
+    for mode in ('two_pass', 'single_pass'):
+        timings = []
+        output = None
+        for run in range(args.runs):
+            start = time.perf_counter()
+            output = processor.process_video(output_name=f"bench_{mode}.mp4", render_mode=mode, **common)
+            timings.append(time.perf_counter() - start)
+        report[mode] = {
+            'wall_clock_s': round(min(timings), 2),
+            'size_mb': round(output.stat().st_size / 1024 / 1024, 2),
+            **measure_quality(output, reference)
+        }
+
+    report['speedup'] = round(report['two_pass']['wall_clock_s'] / report['single_pass']['wall_clock_s'], 2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,8 @@ from datetime import datetime
 import sys
 import time
 import os
+import asyncio
+import threading
 
 # Add project root to Python path
 BASE_PATH = Path(__file__).parent.parent
@@ -18,6 +20,13 @@ sys.path.append(str(BASE_PATH))
 # Import modules
 from modules import HookVideoProcessor, FileManager, SettingsManager
 from modules.task_history_manager import TaskHistoryManager
+from modules.clip_catalog import get_clip_catalog
+from modules.clip_indexer import ClipIndexer
+from modules.render_queue import RenderQueue, QueueFullError
+from modules.batch_executor import BatchExecutor
+from modules.workspace import JobWorkspace
+from modules.ffmpeg_runner import report_progress
+from modules.job_control import JobCancelledError
 
 # Initialize paths
 BASE_PATH = Path(__file__).parent.parent
@@ -48,23 +57,106 @@ app.add_middleware(
 )
 
 # Initialize processors and managers
+clip_catalog = get_clip_catalog(BASE_PATH / 'cache' / 'clip_catalog.db')
 hook_processor = HookVideoProcessor(BASE_PATH)
+clip_indexer = ClipIndexer(
+    clip_catalog,
+    [
+        hook_processor.background_processor.input_16_9_dir,
+        hook_processor.background_processor.input_9_16_dir,
+        hook_processor.background_processor.pool_16_9_dir,
+        hook_processor.background_processor.pool_9_16_dir,
+        CUT_DIR
+    ],
+    poll_interval=float(os.getenv("CLIP_INDEX_INTERVAL", "5")),
+    max_workers=int(os.getenv("CLIP_INDEX_WORKERS", "4"))
+)
+hook_processor.background_processor.clip_indexer = clip_indexer
 file_manager = FileManager(base_path=BASE_PATH, raw_dir=INPUT_16_9_DIR, cut_dir=CUT_DIR)
 settings_manager = SettingsManager(base_path=BASE_PATH)
 task_history = TaskHistoryManager(BASE_PATH)
+batch_executor = BatchExecutor(
+    max_workers=int(os.getenv("HOOK_BATCH_WORKERS", "2")),
+    retries=int(os.getenv("HOOK_BATCH_RETRIES", "1"))
+)
+render_queue = RenderQueue(
+    workers=int(os.getenv("HOOK_RENDER_WORKERS", "2")),
+    max_queue=int(os.getenv("HOOK_MAX_QUEUE", "20")),
+    urgent_workers=int(os.getenv("HOOK_URGENT_WORKERS", "1"))
+)
+
+@app.on_event("startup")
+def collect_orphaned_workspaces():
+    """Remove job workspaces left behind by a previous crash"""
+    removed = hook_processor.scratch.collect_orphans()
+    if removed:
+        logging.info(f"Removed {removed} orphaned job workspaces")
+
+@app.on_event("startup")
+def start_clip_indexer():
+    """Start watching background clip directories"""
+    clip_indexer.start()
+
+@app.on_event("startup")
+def start_render_queue():
+    """Start the render workers"""
+    render_queue.start()
+
+@app.on_event("shutdown")
+def stop_clip_indexer():
+    clip_indexer.stop()
+
+@app.on_event("shutdown")
+def stop_render_queue():
+    """Cancel running renders so no ffmpeg outlives the server, and close out jobs that never started"""
+    for task_id in render_queue.stop(timeout=10, cancel_running=True):
+        update_task_status(task_id, {"status": "cancelled", "error": "Server shut down before the job started"})
+        JobWorkspace(TEMP_DIR, job_id=task_id).cleanup()
 
 def update_task_status(task_id: str, status_data: dict):
-    """Update task status and save to history"""
+    """Update task status and save to history (fields not in status_data are kept)"""
     status_data['updated_at'] = datetime.now().isoformat()
-    task_history.save_task(task_id, status_data)
+    task_history.update_task(task_id, status_data)
 
 def get_task_status(task_id: str) -> dict:
     """Get task status from history"""
     status = task_history.get_task(task_id)
     if not status:
         return {"status": "not_found"}
+    position = render_queue.position(task_id)
+    if position:
+        status["queue_position"] = position
     return status
 
+def enqueue_render(task_id: str, func, priority: str = "normal", **kwargs) -> int:
+    """Queue a render job, rejecting it with 429 when the queue is full
+
+    Args:
+        priority: 'urgent', 'normal' or 'batch'; waiting jobs start in that order
+
+    Returns:
+        Position of the job in the queue
+    """
+    if priority not in RenderQueue.PRIORITIES:
+        JobWorkspace(TEMP_DIR, job_id=task_id).cleanup()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid priority '{priority}'. Expected one of: {', '.join(RenderQueue.PRIORITIES)}"
+        )
+    # Status is written before submitting so a fast worker cannot be overwritten by it
+    update_task_status(task_id, {
+        "task_id": task_id,
+        "status": "queued",
+        "priority": priority,
+        "created_at": datetime.now().isoformat()
+    })
+    try:
+        return render_queue.submit(task_id, func, task_id=task_id, priority=priority, **kwargs)
+    except QueueFullError as e:
+        update_task_status(task_id, {"status": "rejected", "error": str(e)})
+        JobWorkspace(TEMP_DIR, job_id=task_id).cleanup()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+
 def normalize_settings(settings: Dict) -> Dict:
     """Normalize settings to ensure consistent field names and types"""
     normalized = {}
@@ -94,13 +186,13 @@ def normalize_settings(settings: Dict) -> Dict:
 
 @app.post("/api/v1/hook/process")
 async def process_hook_video(
-    background_tasks: BackgroundTasks,
     hook_audio: UploadFile = File(..., description="Hook audio file (.mp3 or .wav)"),
     main_audio: UploadFile = File(..., description="Main audio file (.mp3 or .wav)"),
     subtitle_file: UploadFile = File(..., description="Subtitle file (.srt)"),
     thumbnail_file: UploadFile = File(..., description="Thumbnail image (.png)"),
     preset_name: Optional[str] = Form(None),
-    subtitle_settings: Optional[str] = Form(None)
+    subtitle_settings: Optional[str] = Form(None),
+    priority: str = Form("normal", description="Queue priority: urgent, normal or batch")
 ):
     """
     Process a single hook video with all required components:
@@ -124,11 +216,12 @@ async def process_hook_video(
         # Generate task ID
         task_id = str(uuid.uuid4())
         
-        # Save uploaded files
-        hook_path = INPUT_16_9_DIR / hook_audio.filename
-        main_path = INPUT_16_9_DIR / main_audio.filename
-        subtitle_path = INPUT_16_9_DIR / subtitle_file.filename
-        thumbnail_path = INPUT_16_9_DIR / thumbnail_file.filename
+        # Save uploaded files into the task's workspace
+        upload_dir = JobWorkspace(TEMP_DIR, job_id=task_id).create().path
+        hook_path = upload_dir / hook_audio.filename
+        main_path = upload_dir / main_audio.filename
+        subtitle_path = upload_dir / subtitle_file.filename
+        thumbnail_path = upload_dir / thumbnail_file.filename
         
         for file, path in [
             (hook_audio, hook_path),
@@ -175,9 +268,10 @@ async def process_hook_video(
             raise HTTPException(status_code=400, detail=f"Missing required subtitle settings: {required_fields}")
         
         # Process video in background
-        background_tasks.add_task(
+        position = enqueue_render(
+            task_id,
             process_hook_video_background,
-            task_id=task_id,
+            priority=priority,
             hook_path=hook_path,
             main_path=main_path,
             subtitle_path=subtitle_path,
@@ -187,8 +281,9 @@ async def process_hook_video(
         
         return {
             "task_id": task_id,
-            "status": "processing",
-            "message": "Hook video processing started",
+            "status": "queued",
+            "queue_position": position,
+            "message": "Hook video processing queued",
             "input": {
                 "hook_audio": hook_audio.filename,
                 "main_audio": main_audio.filename,
@@ -206,7 +301,6 @@ async def process_hook_video(
 
 @app.post("/api/v1/hook/batch")
 async def process_batch_hooks(
-    background_tasks: BackgroundTasks,
     input_folder: str = Form(...),
     preset_name: str = Form(...)
 ):
@@ -247,17 +341,19 @@ async def process_batch_hooks(
         task_id = str(uuid.uuid4())
         
         # Process videos in background
-        background_tasks.add_task(
+        position = enqueue_render(
+            task_id,
             process_batch_videos_background,
-            task_id=task_id,
+            priority="batch",
             input_folder=input_path,
             subtitle_settings=settings
         )
         
         return {
             "task_id": task_id,
-            "status": "processing",
-            "message": "Batch processing started",
+            "status": "queued",
+            "queue_position": position,
+            "message": "Batch processing queued",
             "input": {
                 "folder": str(input_path),
                 "preset": preset_name
@@ -270,6 +366,16 @@ async def process_batch_hooks(
         logging.error(f"Error in batch processing: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/hook/queue")
+async def get_queue_status():
+    """Render queue load: workers, running and waiting jobs"""
+    return render_queue.stats()
+
+@app.get("/api/v1/hook/scratch")
+async def get_scratch_status():
+    """Scratch volumes, free space and workspace size of recent jobs at cleanup"""
+    return hook_processor.scratch.stats()
+
 @app.get("/api/v1/hook/status/{task_id}")
 async def get_hook_status(task_id: str):
     """Get status of a hook processing task"""
@@ -278,6 +384,64 @@ async def get_hook_status(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     return status
 
+@app.delete("/api/v1/hook/tasks/{task_id}")
+async def cancel_hook_task(task_id: str):
+    """Cancel a queued or running render task
+
+    A queued task is removed from the queue. A running task has its ffmpeg
+    process trees killed, which frees its encoder slots; the worker then
+    removes the task's temp files and marks it cancelled.
+    """
+    status = get_task_status(task_id)
+    if status["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    # Killing processes waits for them to exit, keep that off the event loop
+    state = await asyncio.to_thread(render_queue.cancel, task_id)
+    if state == "queued":
+        JobWorkspace(TEMP_DIR, job_id=task_id).cleanup()
+        update_task_status(task_id, {
+            "status": "cancelled",
+            "cancelled_at": datetime.now().isoformat()
+        })
+        return {"task_id": task_id, "status": "cancelled", "message": "Task removed from the queue"}
+    if state == "running":
+        # The worker records "cancelled" once the job has unwound
+        return {"task_id": task_id, "status": "cancelling", "message": "Stopping running render"}
+    raise HTTPException(status_code=409, detail=f"Task is not queued or running (status: {status['status']})")
+
+def normalize_backgrounds_task(task_id: str, orientation: Optional[str]):
+    """Convert background clips into the stream-copy pool"""
+    update_task_status(task_id, {"status": "processing", "type": "normalize_backgrounds"})
+    try:
+        report = hook_processor.background_processor.normalizer.normalize(orientation)
+        clip_indexer.refresh()
+        update_task_status(task_id, {
+            "status": "completed",
+            "type": "normalize_backgrounds",
+            "report": report
+        })
+    except Exception as e:
+        logging.error(f"Error normalizing backgrounds: {e}")
+        update_task_status(task_id, {
+            "status": "failed",
+            "type": "normalize_backgrounds",
+            "error": str(e)
+        })
+
+@app.post("/api/v1/hook/backgrounds/normalize")
+async def normalize_backgrounds(
+    background_tasks: BackgroundTasks,
+    orientation: Optional[str] = Form(None)
+):
+    """Bring the normalized background pool up to date (horizontal, vertical or both)"""
+    if orientation not in (None, "horizontal", "vertical"):
+        raise HTTPException(status_code=400, detail="orientation must be 'horizontal' or 'vertical'")
+    task_id = str(uuid.uuid4())
+    update_task_status(task_id, {"status": "pending", "type": "normalize_backgrounds"})
+    background_tasks.add_task(normalize_backgrounds_task, task_id, orientation)
+    return {"task_id": task_id, "status": "pending"}
+
 @app.get("/api/v1/hook/presets")
 async def get_presets():
     """Get list of available presets"""
@@ -341,13 +505,13 @@ async def delete_preset(preset_name: str):
 
 @app.post("/api/v1/hook/process-paths")
 async def process_hook_video_paths(
-    background_tasks: BackgroundTasks,
     hook_audio_path: str = Form(..., description="Path to hook audio file (.mp3 or .wav)"),
     main_audio_path: str = Form(..., description="Path to main audio file (.mp3 or .wav)"),
     subtitle_path: str = Form(..., description="Path to subtitle file (.srt)"),
     thumbnail_path: str = Form(..., description="Path to thumbnail image (.png)"),
     preset_name: Optional[str] = Form(None),
-    subtitle_settings: Optional[str] = Form(None)
+    subtitle_settings: Optional[str] = Form(None),
+    priority: str = Form("normal", description="Queue priority: urgent, normal or batch")
 ):
     """
     Process a single hook video with paths to all required components:
@@ -414,9 +578,10 @@ async def process_hook_video_paths(
             raise HTTPException(status_code=400, detail=f"Missing required subtitle settings: {required_fields}")
         
         # Process video in background
-        background_tasks.add_task(
+        position = enqueue_render(
+            task_id,
             process_hook_video_background,
-            task_id=task_id,
+            priority=priority,
             hook_path=hook_path,
             main_path=main_path,
             subtitle_path=subtitle_path,
@@ -426,8 +591,9 @@ async def process_hook_video_paths(
         
         return {
             "task_id": task_id,
-            "status": "processing",
-            "message": "Hook video processing started",
+            "status": "queued",
+            "queue_position": position,
+            "message": "Hook video processing queued",
             "input": {
                 "hook_audio": str(hook_path),
                 "main_audio": str(main_path),
@@ -445,7 +611,6 @@ async def process_hook_video_paths(
 
 @app.post("/api/v1/hook/batch-paths")
 async def process_batch_hooks_paths(
-    background_tasks: BackgroundTasks,
     input_folder: str = Form(...),
     preset_name: str = Form(...)
 ):
@@ -486,17 +651,19 @@ async def process_batch_hooks_paths(
         task_id = str(uuid.uuid4())
         
         # Process videos in background
-        background_tasks.add_task(
+        position = enqueue_render(
+            task_id,
             process_batch_videos_background,
-            task_id=task_id,
+            priority="batch",
             input_folder=input_path,
             subtitle_settings=settings
         )
         
         return {
             "task_id": task_id,
-            "status": "processing",
-            "message": "Batch processing started",
+            "status": "queued",
+            "queue_position": position,
+            "message": "Batch processing queued",
             "input": {
                 "folder": str(input_path),
                 "preset": preset_name
@@ -511,13 +678,13 @@ async def process_batch_hooks_paths(
 
 @app.post("/api/v1/hook/process_vertical")
 async def process_vertical_hook_video(
-    background_tasks: BackgroundTasks,
     hook_audio: UploadFile = File(..., description="Hook audio file (.mp3 or .wav)"),
     main_audio: UploadFile = File(..., description="Main audio file (.mp3 or .wav)"),
     subtitle_file: UploadFile = File(..., description="Subtitle file (.srt)"),
     thumbnail_file: UploadFile = File(..., description="Thumbnail image (.png)"),
     preset_name: Optional[str] = Form(None),
-    subtitle_settings: Optional[str] = Form(None)
+    subtitle_settings: Optional[str] = Form(None),
+    priority: str = Form("normal", description="Queue priority: urgent, normal or batch")
 ):
     """
     Process a single vertical (9:16) hook video with all required components:
@@ -548,9 +715,8 @@ async def process_vertical_hook_video(
         # Update initial status
         update_task_status(task_id, status_data)
         
-        # Save uploaded files to vertical temp directory
-        temp_dir = TEMP_DIR / "vertical" / task_id
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        # Save uploaded files into the task's workspace
+        temp_dir = JobWorkspace(TEMP_DIR, job_id=task_id).create().path
         
         hook_path = temp_dir / hook_audio.filename
         main_path = temp_dir / main_audio.filename
@@ -586,9 +752,10 @@ async def process_vertical_hook_video(
         output_path = FINAL_DIR / output_filename
         
         # Process video in background
-        background_tasks.add_task(
+        position = enqueue_render(
+            task_id,
             process_hook_video_background,
-            task_id=task_id,
+            priority=priority,
             hook_path=hook_path,
             main_path=main_path,
             subtitle_path=subtitle_path,
@@ -597,15 +764,16 @@ async def process_vertical_hook_video(
             is_vertical=True  # Flag for vertical video processing
         )
         
-        return {"task_id": task_id, "status": "processing"}
+        return {"task_id": task_id, "status": "queued", "queue_position": position}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in process_vertical_hook_video: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/v1/hook/process_batch_vertical")
 async def process_batch_vertical_hooks(
-    background_tasks: BackgroundTasks,
     input_folder: str = Form(...),
     preset_name: str = Form(...)
 ):
@@ -654,21 +822,24 @@ async def process_batch_vertical_hooks(
         update_task_status(task_id, status_data)
         
         # Process videos in background
-        background_tasks.add_task(
+        position = enqueue_render(
+            task_id,
             process_batch_videos_background,
-            task_id=task_id,
+            priority="batch",
             input_folder=input_path,
             subtitle_settings=settings,
             is_vertical=True  # Flag for vertical video processing
         )
         
-        return {"task_id": task_id, "status": "processing"}
+        return {"task_id": task_id, "status": "queued", "queue_position": position}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in process_batch_vertical_hooks: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def process_hook_video_background(
+def process_hook_video_background(
     task_id: str,
     hook_path: Path,
     main_path: Path,
@@ -677,22 +848,29 @@ async def process_hook_video_background(
     subtitle_settings: Dict,
     is_vertical: bool = False
 ):
-    """Background task for processing single hook video"""
+    """Render job for a single hook video (runs on a render worker thread)"""
     try:
-        # Generate output filename
-        output_filename = f"{main_path.stem}_{int(time.time())}.mp4"
+        update_task_status(task_id, {
+            "status": "processing",
+            "queue_position": 0,
+            "started_at": datetime.now().isoformat()
+        })
+        
+        # Generate output filename (task id keeps concurrent renders of the same name apart)
+        output_filename = f"{main_path.stem}_{int(time.time())}_{task_id[:8]}.mp4"
         output_path = FINAL_DIR / output_filename
         
-        # Process video
-        hook_processor.process_hook_video(
-            hook_audio=hook_path,
-            audio_path=main_path,
-            subtitle_path=subtitle_path,
-            thumbnail_path=thumbnail_path,
-            output_path=output_path,
-            subtitle_settings=subtitle_settings,
-            is_vertical=is_vertical
-        )
+        # Process video, ffmpeg progress (percent, fps, speed, ETA) goes into the task status
+        with report_progress(lambda update: task_history.set_progress(task_id, update)):
+            hook_processor.process_hook_video(
+                hook_audio=hook_path,
+                audio_path=main_path,
+                subtitle_path=subtitle_path,
+                thumbnail_path=thumbnail_path,
+                output_path=output_path,
+                subtitle_settings=subtitle_settings,
+                is_vertical=is_vertical
+            )
         
         # Update task status
         status_data = {
@@ -703,6 +881,12 @@ async def process_hook_video_background(
         }
         update_task_status(task_id, status_data)
         
+    except JobCancelledError:
+        logging.info(f"Hook video task {task_id} cancelled")
+        update_task_status(task_id, {
+            "status": "cancelled",
+            "cancelled_at": datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Error in hook video processing: {str(e)}")
         status_data = {
@@ -712,19 +896,24 @@ async def process_hook_video_background(
             "completed_at": datetime.now().isoformat()
         }
         update_task_status(task_id, status_data)
-        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        task_history.clear_progress(task_id)
+        # Uploaded inputs are kept only for the duration of the render
+        JobWorkspace(TEMP_DIR, job_id=task_id).cleanup()
 
-async def process_batch_videos_background(
+def process_batch_videos_background(
     task_id: str,
     input_folder: Path,
     subtitle_settings: Dict,
     is_vertical: bool = False
 ):
-    """Background task for processing multiple hook videos"""
+    """Render job for multiple hook videos (runs on a render worker thread)"""
     try:
         # Update initial status
         update_task_status(task_id, {
             "status": "processing",
+            "queue_position": 0,
+            "started_at": datetime.now().isoformat(),
             "message": "Starting batch processing...",
             "progress": 0,
             "processed": 0,
@@ -732,10 +921,6 @@ async def process_batch_videos_background(
             "results": []
         })
 
-        processed_count = 0
-        failed_count = 0
-        results = []
-        
         # Find matching files
         file_groups = {}
         for file in input_folder.glob("*"):
@@ -760,8 +945,9 @@ async def process_batch_videos_background(
             elif file.suffix.lower() == '.srt':
                 file_groups[stem]['subtitle'] = file
 
-        # Update total count
-        total_groups = len([g for g in file_groups.values() if len(g) >= 4])
+        # Only complete groups are processed
+        complete_groups = {name: group for name, group in file_groups.items() if len(group) >= 4}
+        total_groups = len(complete_groups)
         update_task_status(task_id, {
             "status": "processing",
             "message": f"Found {total_groups} video groups to process",
@@ -771,15 +957,27 @@ async def process_batch_videos_background(
             "results": []
         })
         
-        # Process complete groups
-        for name, group in file_groups.items():
-            if len(group) >= 4:  # Must have all required files
-                try:
-                    # Generate output filename
-                    output_filename = f"{name}_{int(time.time())}.mp4"
-                    output_path = FINAL_DIR / output_filename
-                    
-                    # Process video
+        # Live ffmpeg progress of the groups being rendered
+        render_progress = {}
+        progress_lock = threading.Lock()
+        
+        def report_group_progress(name: str, update: Optional[Dict]):
+            with progress_lock:
+                if update is None:
+                    render_progress.pop(name, None)
+                else:
+                    render_progress[name] = update
+                snapshot = dict(render_progress)
+            task_history.set_progress(task_id, snapshot)
+        
+        def render_group(name: str, group: Dict) -> Path:
+            # Generate output filename
+            output_filename = f"{name}_{int(time.time())}_{task_id[:8]}.mp4"
+            output_path = FINAL_DIR / output_filename
+            
+            # Process video
+            try:
+                with report_progress(lambda update: report_group_progress(name, update)):
                     hook_processor.process_hook_video(
                         hook_audio=group['hook_audio'],
                         audio_path=group['main_audio'],
@@ -789,32 +987,31 @@ async def process_batch_videos_background(
                         subtitle_settings=subtitle_settings,
                         is_vertical=is_vertical
                     )
-                    
-                    results.append({
-                        "name": name,
-                        "status": "success",
-                        "output_path": str(output_path)
-                    })
-                    processed_count += 1
-                    
-                except Exception as e:
-                    results.append({
-                        "name": name,
-                        "status": "failed",
-                        "error": str(e)
-                    })
-                    failed_count += 1
-
-                # Update progress
-                progress = int((processed_count + failed_count) / total_groups * 100)
-                update_task_status(task_id, {
-                    "status": "processing",
-                    "message": f"Processed {processed_count + failed_count} of {total_groups} videos",
-                    "progress": progress,
-                    "processed": processed_count + failed_count,
-                    "total": total_groups,
-                    "results": results
-                })
+            finally:
+                report_group_progress(name, None)
+            return output_path
+        
+        def group_duration(group: Dict) -> float:
+            media_probe = hook_processor.media_probe
+            return media_probe.get_duration(group['main_audio']) + media_probe.get_duration(group['hook_audio'])
+        
+        results = []
+        
+        def report_result(result: Dict, summary: Dict):
+            # Update progress after each finished group
+            results.append(result)
+            update_task_status(task_id, {
+                "status": "processing",
+                "message": f"Processed {summary['processed']} of {total_groups} videos",
+                "progress": int(summary['processed'] / total_groups * 100),
+                "processed": summary['processed'],
+                "total": total_groups,
+                "results": results
+            })
+        
+        batch_executor.run(complete_groups, render_group, weight=group_duration, on_result=report_result)
+        processed_count = sum(1 for r in results if r["status"] == "success")
+        failed_count = len(results) - processed_count
         
         # Update final status
         update_task_status(task_id, {
@@ -827,6 +1024,13 @@ async def process_batch_videos_background(
             "message": f"Batch processing completed. {processed_count} succeeded, {failed_count} failed."
         })
         
+    except JobCancelledError:
+        logging.info(f"Batch task {task_id} cancelled")
+        update_task_status(task_id, {
+            "status": "cancelled",
+            "message": "Batch processing cancelled",
+            "cancelled_at": datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Error in batch processing: {str(e)}")
         update_task_status(task_id, {
@@ -835,6 +1039,8 @@ async def process_batch_videos_background(
             "message": "Batch processing failed",
             "progress": 0
         })
+    finally:
+        task_history.clear_progress(task_id)
 
 if __name__ == "__main__":
     # Setup logging
@@ -4,9 +4,12 @@ from tkinter import ttk, filedialog, messagebox, colorchooser
 import logging
 import json
 from modules import FileManager, HookVideoProcessor, SubtitleProcessor, SettingsManager
+from modules.batch_executor import BatchExecutor
 from typing import Optional, List, Dict
 import os
 import time
+import queue
+import threading
 import winreg
 
 class HookMakerGUI:
@@ -77,6 +80,16 @@ class HookMakerGUI:
         
         # Initialize processors with optimized settings for hook videos
         self.video_processor = HookVideoProcessor(self.base_path)
+        # Dọn các thư mục tạm của job bị dừng đột ngột lần chạy trước
+        self.video_processor.scratch.collect_orphans()
+        
+        # Batch: các nhóm file được xử lý song song trên thread riêng
+        self.batch_executor = BatchExecutor(
+            max_workers=int(os.getenv("HOOK_BATCH_WORKERS", "2")),
+            retries=int(os.getenv("HOOK_BATCH_RETRIES", "1"))
+        )
+        self.batch_events = queue.Queue()
+        self.batch_thread = None
         
     def setup_ui(self):
         """Setup main UI"""
@@ -245,42 +258,89 @@ class HookMakerGUI:
                 messagebox.showinfo("Info", "No matching files found in the input directory")
                 return
 
+            if self.batch_thread and self.batch_thread.is_alive():
+                messagebox.showinfo("Info", "Batch processing is already running")
+                return
+
             # Chuẩn bị xử lý
             self.batch_progress['maximum'] = len(matching_files)
             self.batch_progress['value'] = 0
             self.clear_batch_log()
+            self.update_batch_log(
+                f"Processing {len(matching_files)} groups with {self.batch_executor.max_workers} workers"
+            )
 
-            # Xử lý từng nhóm file
-            for file_group in matching_files:
+            # Đặt tên nhóm theo thumbnail, nhóm dài nhất chạy trước
+            groups = {
+                file_group['thumbnail'].stem.replace('_hook', ''): file_group
+                for file_group in matching_files
+            }
+            subtitle_settings = dict(self.subtitle_settings)
+
+            def render_group(name: str, file_group: Dict[str, Path]) -> Path:
+                # Tạo tên file output
+                output_filename = f"{name}_{int(time.time())}.mp4"
+                output_path = output_dir / output_filename
+
+                # Xử lý video
+                self.video_processor.process_hook_video(
+                    hook_audio=file_group['hook_audio'],
+                    audio_path=file_group['main_audio'],
+                    thumbnail_path=file_group['thumbnail'],
+                    subtitle_path=file_group['subtitle'],
+                    output_path=output_path,
+                    subtitle_settings=subtitle_settings
+                )
+                return output_path
+
+            def group_duration(file_group: Dict[str, Path]) -> float:
+                media_probe = self.video_processor.media_probe
+                return (media_probe.get_duration(file_group['main_audio']) +
+                        media_probe.get_duration(file_group['hook_audio']))
+
+            def run_batch():
                 try:
-                    # Tạo tên file output
-                    output_filename = f"{file_group['thumbnail'].stem.replace('_hook', '')}_{int(time.time())}.mp4"
-                    output_path = output_dir / output_filename
-
-                    # Xử lý video
-                    self.video_processor.process_hook_video(
-                        hook_audio=file_group['hook_audio'],
-                        audio_path=file_group['main_audio'],
-                        thumbnail_path=file_group['thumbnail'],
-                        subtitle_path=file_group['subtitle'],
-                        output_path=output_path,
-                        subtitle_settings=self.subtitle_settings
+                    self.batch_executor.run(
+                        groups,
+                        render_group,
+                        weight=group_duration,
+                        on_result=lambda result, summary: self.batch_events.put(('result', result))
                     )
-
-                    # Cập nhật log và progress
-                    self.update_batch_log(f"Processed: {output_filename}")
-                    self.batch_progress['value'] += 1
-                    self.root.update_idletasks()
-
+                    self.batch_events.put(('done', None))
                 except Exception as e:
-                    self.update_batch_log(f"Error processing {file_group['thumbnail'].name}: {str(e)}")
+                    self.batch_events.put(('error', str(e)))
 
-            # Hoàn thành
-            messagebox.showinfo("Batch Processing", "Batch processing completed!")
+            # Tk chỉ được cập nhật từ main thread nên kết quả đi qua queue
+            self.batch_thread = threading.Thread(target=run_batch, name='hook-batch', daemon=True)
+            self.batch_thread.start()
+            self.root.after(200, self.poll_batch_events)
 
         except Exception as e:
             messagebox.showerror("Error", f"Batch processing failed: {str(e)}")
 
+    def poll_batch_events(self):
+        """Cập nhật log và progress từ các kết quả batch (chạy trên main thread)"""
+        while True:
+            try:
+                event, payload = self.batch_events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event == 'result':
+                if payload['status'] == 'success':
+                    self.update_batch_log(f"Processed: {Path(payload['output_path']).name}")
+                else:
+                    self.update_batch_log(f"Error processing {payload['name']}: {payload['error']}")
+                self.batch_progress['value'] += 1
+            elif event == 'done':
+                messagebox.showinfo("Batch Processing", "Batch processing completed!")
+                return
+            elif event == 'error':
+                messagebox.showerror("Error", f"Batch processing failed: {payload}")
+                return
+
+        self.root.after(200, self.poll_batch_events)
+
     def find_matching_batch_files(self, folder_path: Path) -> List[Dict[str, Path]]:
         """
         Tìm các file khớp nhau trong thư mục
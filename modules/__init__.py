@@ -6,6 +6,20 @@ from .settings_manager import SettingsManager
 from .video_cutter_processor import VideoCutterProcessor
 from .hook_video_processor import HookVideoProcessor
 from .hook_background_processor import HookBackgroundProcessor
+from .media_probe import MediaProbe, MediaInfo, get_media_probe
+from .clip_catalog import ClipCatalog, get_clip_catalog
+from .clip_indexer import ClipIndexer
+from .clip_selector import ClipSelector, ClipSelection
+from .background_normalizer import BackgroundNormalizer
+from .loudness import LoudnessNormalizer
+from .render_queue import RenderQueue, QueueFullError
+from .encoder_slots import EncoderSlots, get_encoder_slots
+from .ffmpeg_runner import run_ffmpeg, run_ffmpeg_async, report_progress
+from .batch_executor import BatchExecutor
+from .workspace import JobWorkspace
+from .scratch import ScratchAllocator
+from .subtitle_overlay import SubtitleOverlayRenderer
+from .job_control import JobHandle, JobCancelledError
 
 __all__ = [
     'FileManager', 
@@ -15,5 +29,28 @@ __all__ = [
     'SettingsManager',
     'VideoCutterProcessor',
     'HookVideoProcessor',
-    'HookBackgroundProcessor'
+    'HookBackgroundProcessor',
+    'MediaProbe',
+    'MediaInfo',
+    'get_media_probe',
+    'ClipCatalog',
+    'get_clip_catalog',
+    'ClipIndexer',
+    'ClipSelector',
+    'ClipSelection',
+    'BackgroundNormalizer',
+    'LoudnessNormalizer',
+    'RenderQueue',
+    'QueueFullError',
+    'EncoderSlots',
+    'get_encoder_slots',
+    'run_ffmpeg',
+    'run_ffmpeg_async',
+    'report_progress',
+    'BatchExecutor',
+    'JobWorkspace',
+    'ScratchAllocator',
+    'SubtitleOverlayRenderer',
+    'JobHandle',
+    'JobCancelledError'
 ]
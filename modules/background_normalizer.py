@@ -0,0 +1,218 @@
+import os
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .ffmpeg_runner import run_ffmpeg
+
+class BackgroundNormalizer:
+    """Offline conversion of background clips into a uniform pool
+
+    Clips from Input_16_9/ and Input_9_16/ are encoded once into Pool_16_9/
+    and Pool_9_16/ with identical codec, resolution, frame rate, GOP and
+    timebase, so per-job background assembly can be done with the concat
+    demuxer and -c copy. Keyframes are placed every GOP frames exactly, which
+    lets jobs start a piece on a known keyframe without re-encoding.
+    """
+
+    FPS = 30
+    GOP = 30                # one keyframe per second
+    TIMESCALE = 15360       # 512 ticks per frame at 30fps
+    EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.webm')
+    FORMATS = {
+        'horizontal': (1920, 1080),
+        'vertical': (1080, 1920)
+    }
+
+    def __init__(self, base_path: Path, gpu_enabled: Optional[bool] = None, max_workers: Optional[int] = None):
+        """
+        Args:
+            base_path: Project root containing the Input_* directories
+            gpu_enabled: Force NVENC on/off (default: detected)
+            max_workers: Concurrent encodes (default: NVENC_SESSIONS or CPU based)
+        """
+        self.base_path = Path(base_path)
+        self.max_workers = max_workers
+        self._gpu_enabled = gpu_enabled
+        self.source_dirs = {
+            'horizontal': self.base_path / 'Input_16_9',
+            'vertical': self.base_path / 'Input_9_16'
+        }
+        self.pool_dirs = {
+            'horizontal': self.base_path / 'Pool_16_9',
+            'vertical': self.base_path / 'Pool_9_16'
+        }
+
+    @property
+    def gop_seconds(self) -> float:
+        return self.GOP / self.FPS
+
+    def pool_dir(self, is_vertical: bool) -> Path:
+        return self.pool_dirs['vertical' if is_vertical else 'horizontal']
+
+    def gpu_enabled(self) -> bool:
+        if self._gpu_enabled is None:
+            try:
+                result = subprocess.run(
+                    ['ffmpeg', '-hide_banner', '-encoders'],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
+                self._gpu_enabled = 'h264_nvenc' in result.stdout
+            except Exception:
+                self._gpu_enabled = False
+        return self._gpu_enabled
+
+    def build_command(self, source: Path, output_path: Path, size: Tuple[int, int], gpu_enabled: bool) -> List[str]:
+        width, height = size
+        cmd = [
+            'ffmpeg', '-y',
+            '-i', str(source),
+            '-map', '0:v:0',
+            '-an',
+            '-vf', f'scale={width}:{height},setsar=1,fps={self.FPS},format=yuv420p'
+        ]
+        if gpu_enabled:
+            cmd.extend([
+                '-c:v', 'h264_nvenc',
+                '-preset', 'p4',
+                '-rc', 'vbr',
+                '-cq', '19',
+                '-b:v', '0',
+                '-forced-idr', '1'
+            ])
+        else:
+            cmd.extend([
+                '-c:v', 'libx264',
+                '-preset', 'medium',
+                '-crf', '18',
+                '-sc_threshold', '0'
+            ])
+        cmd.extend([
+            '-profile:v', 'high',
+            '-g', str(self.GOP),
+            '-keyint_min', str(self.GOP),
+            '-bf', '0',
+            '-force_key_frames', f'expr:gte(t,n_forced*{self.gop_seconds})',
+            '-video_track_timescale', str(self.TIMESCALE),
+            '-movflags', '+faststart',
+            '-f', 'mp4',
+            str(output_path)
+        ])
+        return cmd
+
+    def normalize_file(self, source: Path, output_path: Path, size: Tuple[int, int]) -> bool:
+        """Encode one clip into the pool
+
+        The output is written next to the target and renamed when complete,
+        so the clip indexer never sees a half-written file.
+        """
+        temp_path = output_path.with_name(f".{output_path.stem}.tmp")
+        gpu_enabled = self.gpu_enabled()
+        cmd = self.build_command(source, temp_path, size, gpu_enabled)
+        logging.info(f"Normalizing background: {source} -> {output_path}")
+        result = run_ffmpeg(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        if result.returncode != 0 and gpu_enabled:
+            logging.warning(f"NVENC failed for {source}, retrying with libx264")
+            cmd = self.build_command(source, temp_path, size, False)
+            result = run_ffmpeg(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            logging.error(f"Error normalizing {source}: {result.stderr}")
+            if temp_path.exists():
+                temp_path.unlink()
+            return False
+        os.replace(temp_path, output_path)
+        return True
+
+    def _pending(self, orientation: str) -> Tuple[List[Tuple[Path, Path]], int, List[Path]]:
+        """Return (source, output) pairs to encode, skipped count and stale pool files"""
+        source_dir = self.source_dirs[orientation]
+        pool_dir = self.pool_dirs[orientation]
+        pool_dir.mkdir(parents=True, exist_ok=True)
+        if not source_dir.exists():
+            return [], 0, []
+
+        pending = []
+        skipped = 0
+        expected = set()
+        for source in sorted(source_dir.iterdir()):
+            if not source.is_file() or source.suffix.lower() not in self.EXTENSIONS:
+                continue
+            output_path = pool_dir / f"{source.stem}.mp4"
+            expected.add(output_path.name)
+            if output_path.exists() and output_path.stat().st_mtime >= source.stat().st_mtime:
+                skipped += 1
+                continue
+            pending.append((source, output_path))
+
+        stale = [p for p in pool_dir.glob('*.mp4') if p.name not in expected]
+        return pending, skipped, stale
+
+    def normalize(self, orientation: Optional[str] = None, remove_stale: bool = True) -> Dict:
+        """Bring the pool of one (or both) orientations up to date
+
+        Only clips that are new or changed since their last conversion are
+        encoded.
+
+        Returns:
+            Dict with normalized/skipped/failed/removed counts per orientation
+        """
+        orientations = [orientation] if orientation else list(self.FORMATS)
+        report = {}
+        for name in orientations:
+            pending, skipped, stale = self._pending(name)
+            size = self.FORMATS[name]
+            workers = self.max_workers or (
+                int(os.getenv('NVENC_SESSIONS', '3')) if self.gpu_enabled()
+                else max(1, (os.cpu_count() or 1) // 4)
+            )
+
+            failed = []
+            if pending:
+                logging.info(f"Normalizing {len(pending)} {name} backgrounds with {workers} workers")
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = executor.map(lambda job: self.normalize_file(job[0], job[1], size), pending)
+                    failed = [str(source) for (source, _), ok in zip(pending, results) if not ok]
+
+            removed = 0
+            if remove_stale:
+                for path in stale:
+                    try:
+                        path.unlink()
+                        removed += 1
+                    except OSError as e:
+                        logging.warning(f"Could not remove stale pool clip {path}: {e}")
+
+            report[name] = {
+                'normalized': len(pending) - len(failed),
+                'skipped': skipped,
+                'failed': failed,
+                'removed': removed
+            }
+            logging.info(f"Background pool {name}: {report[name]}")
+        return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize background clips into the stream-copy pool")
+    parser.add_argument('--base-path', type=Path, default=Path(__file__).parent.parent)
+    parser.add_argument('--orientation', choices=list(BackgroundNormalizer.FORMATS), default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cpu', action='store_true', help='Use libx264 instead of NVENC')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    normalizer = BackgroundNormalizer(
+        args.base_path,
+        gpu_enabled=False if args.cpu else None,
+        max_workers=args.workers
+    )
+    report = normalizer.normalize(args.orientation)
+    for name, counts in report.items():
+        print(f"{name}: {counts['normalized']} normalized, {counts['skipped']} up to date, "
+              f"{len(counts['failed'])} failed, {counts['removed']} removed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+from .job_control import JobCancelledError, current_job
+
+class BatchExecutor:
+    """Runs the groups of a batch concurrently
+
+    Groups are started longest-first (by the weight function) so the longest
+    renders do not end up alone at the tail of the batch. Every group is
+    retried independently and its result is reported as soon as it is done.
+    Groups run in the caller's context, so cancelling the job running the
+    batch stops every group; run() then raises JobCancelledError.
+    """
+
+    def __init__(self, max_workers: int = 1, retries: int = 1, retry_delay: float = 5.0):
+        """
+        Args:
+            max_workers: Number of groups processed at the same time
+            retries: Extra attempts for a failed group
+            retry_delay: Seconds to wait before retrying a group
+        """
+        self.max_workers = max(1, max_workers)
+        self.retries = max(0, retries)
+        self.retry_delay = retry_delay
+
+    def _wait_retry(self):
+        """Sleep before a retry; a job cancelled meanwhile stops instead of retrying"""
+        job = current_job()
+        if job:
+            job.raise_if_cancelled()
+        time.sleep(self.retry_delay)
+        if job:
+            job.raise_if_cancelled()
+
+    def _run_group(self, name: str, group: Any, func: Callable[[str, Any], Any]) -> Dict:
+        started = time.time()
+        error = None
+        for attempt in range(1, self.retries + 2):
+            try:
+                output = func(name, group)
+                return {
+                    "name": name,
+                    "status": "success",
+                    "output_path": str(output) if output is not None else None,
+                    "attempts": attempt,
+                    "elapsed": round(time.time() - started, 1)
+                }
+            except JobCancelledError:
+                raise
+            except Exception as e:
+                error = str(e)
+                logging.error(f"Batch group {name} failed (attempt {attempt}/{self.retries + 1}): {e}")
+                if attempt <= self.retries:
+                    self._wait_retry()
+        return {
+            "name": name,
+            "status": "failed",
+            "error": error,
+            "attempts": self.retries + 1,
+            "elapsed": round(time.time() - started, 1)
+        }
+
+    def run(self, groups: Dict[str, Any], func: Callable[[str, Any], Any],
+            weight: Optional[Callable[[Any], float]] = None,
+            on_result: Optional[Callable[[Dict, Dict], None]] = None) -> List[Dict]:
+        """Process every group
+
+        Args:
+            groups: Group name -> group data
+            func: Called as func(name, group), returns the output path
+            weight: Estimated cost of a group; heavier groups start first
+            on_result: Called as on_result(result, summary) after each group
+
+        Returns:
+            Results in completion order
+        """
+        names = list(groups)
+        if weight:
+            costs = {}
+            for name in names:
+                try:
+                    costs[name] = weight(groups[name])
+                except Exception:
+                    costs[name] = 0.0
+            names.sort(key=lambda name: costs[name], reverse=True)
+
+        results = []
+        summary = {"total": len(names), "processed": 0, "succeeded": 0, "failed": 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='batch') as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._run_group, name, groups[name], func)
+                for name in names
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                summary["processed"] += 1
+                summary["succeeded" if result["status"] == "success" else "failed"] += 1
+                if on_result:
+                    try:
+                        on_result(result, dict(summary))
+                    except Exception as e:
+                        logging.warning(f"Batch result callback error: {e}")
+        return results
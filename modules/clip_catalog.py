@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from .media_probe import MediaInfo, MediaProbe, get_media_probe
+
+# Columns copied 1:1 from MediaInfo
+_INFO_COLUMNS = [
+    'path', 'size', 'mtime', 'duration', 'width', 'height', 'fps',
+    'video_codec', 'pix_fmt', 'profile', 'audio_codec', 'audio_sample_rate',
+    'audio_channels', 'audio_layout', 'keyframe_interval'
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clips (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    duration REAL NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    fps REAL,
+    video_codec TEXT,
+    pix_fmt TEXT,
+    profile TEXT,
+    audio_codec TEXT,
+    audio_sample_rate INTEGER,
+    audio_channels INTEGER,
+    audio_layout TEXT,
+    keyframe_interval REAL,
+    orientation TEXT,
+    content_hash TEXT,
+    use_count INTEGER NOT NULL DEFAULT 0,
+    last_used REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_clips_duration ON clips(duration);
+CREATE INDEX IF NOT EXISTS idx_clips_orientation ON clips(orientation, duration);
+CREATE INDEX IF NOT EXISTS idx_clips_directory ON clips(directory);
+CREATE INDEX IF NOT EXISTS idx_clips_hash ON clips(content_hash);
+"""
+
+class ClipCatalog:
+    """Clip catalog stored in a WAL-mode SQLite database
+
+    Holds probe metadata, orientation, content hash and usage counts for every
+    indexed clip. Writes are batched so indexing N clips is one transaction
+    instead of N full-file rewrites.
+    """
+
+    HASH_CHUNK_SIZE = 1024 * 1024  # 1MB from the head and the tail of each file
+    BATCH_SIZE = 500
+
+    def __init__(self, db_path: Path, media_probe: Optional[MediaProbe] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.media_probe = media_probe or get_media_probe()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    @staticmethod
+    def compute_content_hash(path: Path, size: int) -> Optional[str]:
+        """Cheap content hash: file size plus the first and last megabyte"""
+        try:
+            digest = hashlib.sha1(str(size).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read(ClipCatalog.HASH_CHUNK_SIZE))
+                if size > ClipCatalog.HASH_CHUNK_SIZE * 2:
+                    f.seek(-ClipCatalog.HASH_CHUNK_SIZE, os.SEEK_END)
+                    digest.update(f.read(ClipCatalog.HASH_CHUNK_SIZE))
+            return digest.hexdigest()
+        except OSError as e:
+            logging.warning(f"Could not hash {path}: {e}")
+            return None
+
+    @staticmethod
+    def row_to_info(row) -> MediaInfo:
+        return MediaInfo(**{column: row[column] for column in _INFO_COLUMNS})
+
+    def _build_record(self, info: MediaInfo) -> Dict:
+        path = Path(info.path)
+        record = info.to_dict()
+        record.update(
+            directory=str(path.parent),
+            filename=path.name,
+            orientation=info.orientation,
+            content_hash=self.compute_content_hash(path, info.size),
+            updated_at=time.time()
+        )
+        return record
+
+    def upsert_many(self, infos: Iterable[MediaInfo]) -> int:
+        """Insert or update probe results in batches, keeping usage counters"""
+        records = [self._build_record(info) for info in infos if info]
+        if not records:
+            return 0
+
+        columns = _INFO_COLUMNS + ['directory', 'filename', 'orientation', 'content_hash', 'updated_at']
+        updates = ', '.join(f"{c}=excluded.{c}" for c in columns if c != 'path')
+        sql = (
+            f"INSERT INTO clips ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + c for c in columns)}) "
+            f"ON CONFLICT(path) DO UPDATE SET {updates}"
+        )
+        with self._lock:
+            for start in range(0, len(records), self.BATCH_SIZE):
+                self._conn.executemany(sql, records[start:start + self.BATCH_SIZE])
+            self._conn.commit()
+        return len(records)
+
+    def delete_paths(self, paths: Iterable[str]) -> int:
+        keys = [(str(p),) for p in paths]
+        if not keys:
+            return 0
+        with self._lock:
+            self._conn.executemany("DELETE FROM clips WHERE path = ?", keys)
+            self._conn.commit()
+        for (key,) in keys:
+            self.media_probe.invalidate(Path(key))
+        return len(keys)
+
+    def get_clip(self, path: Path) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM clips WHERE path = ?", (str(Path(path).resolve()),)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_clips(self, directory: Optional[Path] = None, orientation: Optional[str] = None,
+                  min_duration: float = 0.0) -> List[Dict]:
+        """Query indexed clips, optionally filtered by directory and orientation"""
+        sql = "SELECT * FROM clips WHERE duration > ?"
+        params: list = [min_duration]
+        if directory is not None:
+            sql += " AND directory = ?"
+            params.append(str(Path(directory).resolve()))
+        if orientation is not None:
+            sql += " AND orientation = ?"
+            params.append(orientation)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_durations(self, directory: Optional[Path] = None,
+                      orientation: Optional[str] = None) -> Dict[Path, float]:
+        return {
+            Path(clip['path']): clip['duration']
+            for clip in self.get_clips(directory, orientation)
+        }
+
+    def get_use_counts(self, paths: Iterable[Path]) -> Dict[Path, int]:
+        keys = [str(Path(p)) for p in paths]
+        if not keys:
+            return {}
+        counts = {}
+        with self._lock:
+            for start in range(0, len(keys), self.BATCH_SIZE):
+                chunk = keys[start:start + self.BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT path, use_count FROM clips WHERE path IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                counts.update({Path(row['path']): row['use_count'] for row in rows})
+        return counts
+
+    def mark_used(self, paths: Iterable[Path]):
+        """Increase usage counters of clips that went into a render"""
+        now = time.time()
+        keys = [(now, str(Path(p))) for p in paths]
+        if not keys:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE clips SET use_count = use_count + 1, last_used = ? WHERE path = ?", keys
+            )
+            self._conn.commit()
+
+    def index_files(self, paths: Iterable[Path]) -> List[MediaInfo]:
+        """Probe the given files and store the results"""
+        infos = [self.media_probe.probe(p) for p in paths]
+        infos = [info for info in infos if info and info.duration > 0]
+        self.upsert_many(infos)
+        return infos
+
+    def sync_directory(self, directory: Path, extensions: tuple = ('.mp4',)) -> Dict[Path, float]:
+        """Bring the catalog in line with a directory
+
+        Only files whose size or mtime changed since they were indexed are
+        probed; rows of deleted files are dropped.
+
+        Returns:
+            Dict[Path, float]: Duration of every usable clip in the directory
+        """
+        directory = Path(directory).resolve()
+        if not directory.exists():
+            return {}
+
+        known = {clip['path']: clip for clip in self.get_clips(directory)}
+        on_disk = {}
+        changed = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not entry.name.lower().endswith(extensions):
+                        continue
+                    stat = entry.stat()
+                    path = str(directory / entry.name)
+                    on_disk[path] = stat
+                    row = known.get(path)
+                    if row and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+                        self.media_probe.remember(self.row_to_info(row))
+                    else:
+                        changed.append(Path(path))
+        except OSError as e:
+            logging.error(f"Error scanning {directory}: {e}")
+            return self.get_durations(directory)
+
+        if changed:
+            logging.info(f"Indexing {len(changed)} new or changed clips in {directory}")
+            self.index_files(changed)
+
+        removed = [path for path in known if path not in on_disk]
+        if removed:
+            self.delete_paths(removed)
+            logging.info(f"Removed {len(removed)} missing clips from catalog")
+
+        return self.get_durations(directory)
+
+    def remove_missing(self) -> int:
+        with self._lock:
+            paths = [row['path'] for row in self._conn.execute("SELECT path FROM clips").fetchall()]
+        return self.delete_paths([p for p in paths if not Path(p).exists()])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_catalogs: Dict[str, ClipCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+def get_clip_catalog(db_path: Path) -> ClipCatalog:
+    """Return the process-wide catalog for a database file"""
+    key = str(Path(db_path).resolve())
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = ClipCatalog(Path(key))
+        return _catalogs[key]
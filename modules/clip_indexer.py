@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from .clip_catalog import ClipCatalog
+
+class ClipIndexer:
+    """Long-lived background indexer for clip directories
+
+    Polls the watched directories, probes only new or changed files in a
+    bounded worker pool, stores results in the ClipCatalog and keeps an
+    in-memory duration table so jobs can pick clips without scanning or
+    probing on the request path.
+    """
+
+    def __init__(self, catalog: ClipCatalog, directories: Iterable[Path],
+                 poll_interval: float = 5.0, max_workers: int = 4,
+                 settle_seconds: float = 2.0, extensions: tuple = ('.mp4',)):
+        """
+        Args:
+            catalog: Catalog used to persist probe results
+            directories: Directories to watch
+            poll_interval: Seconds between two scans
+            max_workers: Maximum number of concurrent ffprobe processes
+            settle_seconds: Files modified more recently than this are still
+                being written and are indexed on a later scan
+            extensions: File extensions to index
+        """
+        self.catalog = catalog
+        self.directories = [Path(d).resolve() for d in directories]
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self.settle_seconds = settle_seconds
+        self.extensions = extensions
+
+        self._lock = threading.Lock()
+        self._durations: Dict[Path, Dict[Path, float]] = {d: {} for d in self.directories}
+        self._stats: Dict[Path, Dict[str, tuple]] = {d: {} for d in self.directories}
+        self._ready: Dict[Path, threading.Event] = {d: threading.Event() for d in self.directories}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        """Load known clips from the catalog and start watching"""
+        if self._thread and self._thread.is_alive():
+            return
+        for directory in self.directories:
+            directory.mkdir(parents=True, exist_ok=True)
+            clips = self.catalog.get_clips(directory)
+            with self._lock:
+                self._durations[directory] = {Path(c['path']): c['duration'] for c in clips}
+                self._stats[directory] = {c['path']: (c['size'], c['mtime']) for c in clips}
+            for clip in clips:
+                self.catalog.media_probe.remember(self.catalog.row_to_info(clip))
+
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='clip-indexer')
+        self._thread = threading.Thread(target=self._run, name='clip-indexer', daemon=True)
+        self._thread.start()
+        logging.info(f"Clip indexer started for: {[str(d) for d in self.directories]}")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        logging.info("Clip indexer stopped")
+
+    def watches(self, directory: Path) -> bool:
+        return Path(directory).resolve() in self._durations
+
+    def is_ready(self, directory: Path) -> bool:
+        event = self._ready.get(Path(directory).resolve())
+        return bool(event and event.is_set())
+
+    def wait_ready(self, directory: Path, timeout: Optional[float] = None) -> bool:
+        event = self._ready.get(Path(directory).resolve())
+        return bool(event and event.wait(timeout))
+
+    def get_durations(self, directory: Path) -> Dict[Path, float]:
+        """Snapshot of the duration table of a watched directory"""
+        with self._lock:
+            return dict(self._durations.get(Path(directory).resolve(), {}))
+
+    def refresh(self, directory: Optional[Path] = None):
+        """Scan one (or every) watched directory immediately"""
+        targets = [Path(directory).resolve()] if directory else self.directories
+        for target in targets:
+            if target in self._durations:
+                self._scan(target)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            for directory in self.directories:
+                if self._stop_event.is_set():
+                    break
+                try:
+                    self._scan(directory)
+                except Exception as e:
+                    logging.error(f"Clip indexer error in {directory}: {e}")
+            self._stop_event.wait(self.poll_interval)
+
+    def _scan(self, directory: Path):
+        now = time.time()
+        on_disk: Dict[str, tuple] = {}
+        changed: List[Path] = []
+
+        with self._lock:
+            known = dict(self._stats[directory])
+
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not entry.name.lower().endswith(self.extensions):
+                        continue
+                    stat = entry.stat()
+                    path = str(directory / entry.name)
+                    signature = (stat.st_size, stat.st_mtime)
+                    on_disk[path] = signature
+                    if known.get(path) == signature:
+                        continue
+                    if now - stat.st_mtime < self.settle_seconds or stat.st_size == 0:
+                        continue
+                    changed.append(Path(path))
+        except OSError as e:
+            logging.error(f"Error scanning {directory}: {e}")
+            return
+
+        removed = [path for path in known if path not in on_disk]
+        if removed:
+            self.catalog.delete_paths(removed)
+            with self._lock:
+                for path in removed:
+                    self._stats[directory].pop(path, None)
+                    self._durations[directory].pop(Path(path), None)
+            logging.info(f"Clip indexer: {len(removed)} clips removed from {directory}")
+
+        if changed:
+            executor = self._executor
+            if executor is None:
+                infos = [self.catalog.media_probe.probe(p) for p in changed]
+            else:
+                infos = list(executor.map(self.catalog.media_probe.probe, changed))
+            infos = [info for info in infos if info and info.duration > 0]
+            self.catalog.upsert_many(infos)
+            with self._lock:
+                # Unreadable files are remembered too so they are not re-probed every scan
+                for path in changed:
+                    self._stats[directory][str(path)] = on_disk[str(path)]
+                    self._durations[directory].pop(path, None)
+                for info in infos:
+                    self._durations[directory][Path(info.path)] = info.duration
+            logging.info(f"Clip indexer: indexed {len(infos)}/{len(changed)} clips in {directory}")
+
+        self._ready[directory].set()
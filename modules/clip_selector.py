@@ -0,0 +1,197 @@
+import logging
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+@dataclass
+class ClipSelection:
+    """Result of a clip selection"""
+    clips: List[Path] = field(default_factory=list)
+    durations: List[float] = field(default_factory=list)
+    target: float = 0.0
+    tolerance: float = 0.0
+
+    @property
+    def total_duration(self) -> float:
+        return sum(self.durations)
+
+    @property
+    def overshoot(self) -> float:
+        return self.total_duration - self.target
+
+    @property
+    def needs_trim(self) -> bool:
+        """True when the last clip must be cut to reach the target length"""
+        return self.overshoot > self.tolerance
+
+class ClipSelector:
+    """Duration-aware random clip selection
+
+    Fills most of the target with randomly ordered clips, then solves a
+    subset-sum over the remaining candidates so the total lands within one
+    frame of the target and no trim pass is needed. Clips that were used often
+    get a lower weight, and a seed makes the selection reproducible.
+    """
+
+    MAX_CANDIDATES = 256   # clips considered by the subset-sum step
+    RESOLUTION = 1000      # durations are compared in milliseconds
+    MAX_UNITS = 200000     # upper bound of the subset-sum table size
+
+    def __init__(self, fps: float = 30.0, seed: Optional[int] = None, repeat_penalty: float = 1.0):
+        """
+        Args:
+            fps: Output frame rate, one frame is the accepted error
+            seed: Seed for reproducible selections
+            repeat_penalty: How strongly frequently used clips are avoided (0 disables)
+        """
+        self.fps = fps
+        self.repeat_penalty = repeat_penalty
+        self.rng = random.Random(seed)
+
+    def _weighted_order(self, clips: List[Path], use_counts: Dict[Path, int], rng: random.Random) -> List[Path]:
+        """Random permutation where rarely used clips tend to come first"""
+        def key(clip: Path) -> float:
+            weight = 1.0 / (1.0 + self.repeat_penalty * use_counts.get(clip, 0))
+            return rng.random() ** (1.0 / weight)
+        return sorted(clips, key=key, reverse=True)
+
+    def _subset_sum(self, candidates: List[Path], durations: Dict[Path, float],
+                    gap: float, tolerance: float) -> Optional[List[Path]]:
+        """Find a subset of candidates whose total is within tolerance of gap"""
+        # Coarser units for long gaps keep the bitsets small
+        resolution = min(self.RESOLUTION, self.MAX_UNITS / max(gap, 1e-3))
+        goal = int(round(gap * resolution))
+        slack = max(1, int(tolerance * resolution))
+        limit = goal + slack
+        weights = [max(1, int(round(durations[c] * resolution))) for c in candidates]
+        mask = (1 << (limit + 1)) - 1
+
+        # Bitset DP: bit s of reach is set when total s is reachable
+        reach = 1
+        history = []
+        for weight in weights:
+            history.append(reach)
+            reach = (reach | (reach << weight)) & mask
+
+        best = None
+        for offset in range(slack + 1):
+            for total in (goal - offset, goal + offset):
+                if 0 <= total <= limit and (reach >> total) & 1:
+                    best = total
+                    break
+            if best is not None:
+                break
+        if best is None:
+            return None
+
+        chosen = []
+        remaining = best
+        for index in range(len(candidates) - 1, -1, -1):
+            if remaining == 0:
+                break
+            if not (history[index] >> remaining) & 1:
+                chosen.append(candidates[index])
+                remaining -= weights[index]
+        chosen.reverse()
+        return chosen
+
+    def select(self, durations: Dict[Path, float], target: float,
+               use_counts: Optional[Dict[Path, int]] = None,
+               seed: Optional[int] = None) -> ClipSelection:
+        """Select clips whose total duration matches target
+
+        Args:
+            durations: Duration of every available clip
+            target: Wanted total duration in seconds
+            use_counts: How often each clip was used before
+            seed: Per-call seed, overrides the selector's own generator
+
+        Returns:
+            ClipSelection; needs_trim is set when no exact fit was found and
+            the last clip overshoots the target
+        """
+        clips = [clip for clip, duration in durations.items() if duration > 0]
+        if not clips:
+            raise ValueError("No clips available for selection")
+
+        rng = random.Random(seed) if seed is not None else self.rng
+        use_counts = use_counts or {}
+        tolerance = 1.0 / self.fps
+        selection = ClipSelection(target=target, tolerance=tolerance)
+        if target <= 0:
+            return selection
+
+        # Leave a window at the end that the subset-sum step fills exactly
+        longest = max(durations[c] for c in clips)
+        shortest = min(durations[c] for c in clips)
+        fill_to = target - min(target, 3 * longest)
+
+        order = self._weighted_order(clips, use_counts, rng)
+        used = set()
+        while selection.total_duration < fill_to:
+            added = False
+            for clip in order:
+                if clip in used or selection.total_duration + durations[clip] > fill_to:
+                    continue
+                selection.clips.append(clip)
+                selection.durations.append(durations[clip])
+                used.add(clip)
+                added = True
+            if added:
+                continue
+            if len(used) == len(clips) and fill_to - selection.total_duration >= shortest:
+                # Pool exhausted, allow repeats
+                logging.warning(f"Reusing clips to reach target duration {target:.2f}s")
+                order = self._weighted_order(clips, use_counts, rng)
+                used.clear()
+                continue
+            break
+
+        gap = target - selection.total_duration
+        if gap <= tolerance:
+            return selection
+
+        candidates = [c for c in order if c not in used and durations[c] <= gap + tolerance]
+        if not candidates:
+            candidates = [c for c in order if durations[c] <= gap + tolerance]
+        candidates = candidates[:self.MAX_CANDIDATES]
+
+        subset = self._subset_sum(candidates, durations, gap, tolerance) if candidates else None
+        if subset is not None:
+            for clip in subset:
+                selection.clips.append(clip)
+                used.add(clip)
+                selection.durations.append(durations[clip])
+            # The subset-sum works on rounded durations; the error of many
+            # clips can add up, so check the real total
+            if selection.total_duration >= target - tolerance:
+                logging.info(
+                    f"Selected {len(selection.clips)} clips, total {selection.total_duration:.3f}s "
+                    f"for target {target:.3f}s"
+                )
+                return selection
+            logging.info(
+                f"Clip combination is {target - selection.total_duration:.3f}s short of the target "
+                f"after rounding, last clip will be trimmed"
+            )
+        else:
+            # No exact fit: keep adding clips and let the caller trim the last one
+            logging.info(f"No exact clip combination for {gap:.3f}s, last clip will be trimmed")
+
+        self._pad(selection, [c for c in order if c not in used] or order, clips, durations, rng)
+        return selection
+
+    @staticmethod
+    def _pad(selection: ClipSelection, fallback: List[Path], clips: List[Path],
+             durations: Dict[Path, float], rng: random.Random):
+        """Append clips until the selection reaches the target (needs_trim then covers the overshoot)"""
+        for clip in fallback:
+            if selection.total_duration >= selection.target - selection.tolerance:
+                return
+            selection.clips.append(clip)
+            selection.durations.append(durations[clip])
+        while selection.total_duration < selection.target - selection.tolerance:
+            clip = rng.choice(clips)
+            selection.clips.append(clip)
+            selection.durations.append(durations[clip])
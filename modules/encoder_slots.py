@@ -0,0 +1,271 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from .job_control import PRIORITIES
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+HARDWARE = 'hw'
+SOFTWARE = 'sw'
+
+class EncoderSlots:
+    """Encoder session budgets shared by every pipeline
+
+    Each ffmpeg process that encodes video holds one slot while it runs:
+    hardware (NVENC) and software (x264/x265) encoders have separate
+    budgets. When lock_dir is set every slot is also backed by a lock file,
+    so several processes on the host (API servers, cutter pools, GUI) share
+    the same budget.
+
+    A freed slot goes to the waiter with the best priority ('urgent' before
+    'normal' before 'batch', first come within a priority). Across processes
+    waiters leave a marker file in lock_dir, and lower priorities do not
+    take a host slot while a fresh marker of a better priority exists.
+    Running batch jobs therefore yield to urgent ones at their next ffmpeg
+    step.
+    """
+
+    POLL_INTERVAL = 0.2
+    # Wait markers not refreshed for this long belong to a dead process
+    MARKER_STALE_SECONDS = 5.0
+
+    def __init__(self, hw_slots: int = 3, sw_slots: int = 2, lock_dir: Optional[Path] = None):
+        """
+        Args:
+            hw_slots: Concurrent NVENC sessions
+            sw_slots: Concurrent software encodes
+            lock_dir: Directory for host-wide slot lock files (None: process-wide only)
+        """
+        self.limits = {HARDWARE: max(1, hw_slots), SOFTWARE: max(1, sw_slots)}
+        self._in_use = {kind: 0 for kind in self.limits}
+        # Waiters of this process per kind, heap of (rank, sequence)
+        self._waiting: Dict[str, List[Tuple[int, int]]] = {kind: [] for kind in self.limits}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.lock_dir = Path(lock_dir) if lock_dir else None
+        if self.lock_dir:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _try_lock(handle) -> bool:
+        try:
+            if os.name == 'nt':
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _unlock(handle):
+        try:
+            if os.name == 'nt':
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        finally:
+            handle.close()
+
+    def _try_host_slot(self, kind: str):
+        """Lock a free slot file of this kind, None if all are taken"""
+        for index in range(self.limits[kind]):
+            handle = open(self.lock_dir / f"{kind}_{index}.lock", 'a+')
+            if self._try_lock(handle):
+                return handle
+            handle.close()
+        return None
+
+    def _marker_path(self, kind: str, entry: Tuple[int, int]) -> Path:
+        rank, sequence = entry
+        return self.lock_dir / f"wait_{kind}_{rank}_{os.getpid()}_{sequence}"
+
+    def _host_turn(self, kind: str, rank: int) -> bool:
+        """False while a process on the host waits for this kind with a better priority"""
+        now = time.time()
+        for marker in self.lock_dir.glob(f"wait_{kind}_*"):
+            try:
+                if now - marker.stat().st_mtime >= self.MARKER_STALE_SECONDS:
+                    # Left behind by a process that died while waiting
+                    marker.unlink()
+                elif int(marker.name.split('_')[2]) < rank:
+                    return False
+            except (OSError, ValueError, IndexError):
+                continue
+        return True
+
+    def _try_slot(self, kind: str, entry: Tuple[int, int], wait_marker: bool):
+        """One attempt to take a slot for a registered waiter
+
+        Returns:
+            (True, host lock handle or None) when the slot was taken
+        """
+        if self.lock_dir and wait_marker:
+            # Refresh the marker so other processes keep yielding to us
+            self._marker_path(kind, entry).touch()
+        with self._condition:
+            if self._in_use[kind] >= self.limits[kind] or self._waiting[kind][0] != entry:
+                return False, None
+            handle = None
+            if self.lock_dir:
+                if not self._host_turn(kind, entry[0]):
+                    return False, None
+                handle = self._try_host_slot(kind)
+                if handle is None:
+                    return False, None
+            self._in_use[kind] += 1
+            return True, handle
+
+    def _register(self, kind: str, rank: int) -> Tuple[int, int]:
+        with self._condition:
+            entry = (rank, next(self._sequence))
+            heapq.heappush(self._waiting[kind], entry)
+            return entry
+
+    def _unregister(self, kind: str, entry: Tuple[int, int]):
+        with self._condition:
+            self._waiting[kind].remove(entry)
+            heapq.heapify(self._waiting[kind])
+            self._condition.notify_all()
+        if self.lock_dir:
+            try:
+                self._marker_path(kind, entry).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _release(self, kind: str, handle):
+        if handle:
+            self._unlock(handle)
+        with self._condition:
+            self._in_use[kind] -= 1
+            self._condition.notify_all()
+
+    @staticmethod
+    def _announces(entry: Tuple[int, int]) -> bool:
+        """Whether the first attempt already leaves a wait marker
+
+        Jobs above batch priority announce themselves before the first host
+        lock attempt, so lower priorities in other processes yield to them
+        from the start. Batch jobs only leave one once they actually wait,
+        since nothing has to yield to them.
+        """
+        return entry[0] < PRIORITIES['batch']
+
+    @staticmethod
+    def _rank(priority: Optional[str]) -> int:
+        return PRIORITIES.get(priority or 'normal', PRIORITIES['normal'])
+
+    @contextmanager
+    def acquire(self, kind: Optional[str], timeout: Optional[float] = None,
+                priority: Optional[str] = None) -> Iterator[None]:
+        """Hold an encoder slot of the given kind ('hw', 'sw' or None for no slot)
+
+        Args:
+            priority: 'urgent', 'normal' (default) or 'batch'
+
+        Raises:
+            TimeoutError: No slot became free within timeout seconds
+        """
+        if kind is None:
+            yield
+            return
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        entry = self._register(kind, self._rank(priority))
+        try:
+            taken, handle = self._try_slot(kind, entry, wait_marker=self._announces(entry))
+            if not taken:
+                logging.info(f"Waiting for a free {kind} encoder slot ({self.limits[kind]} in use)")
+            while not taken:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"No {kind} encoder slot available")
+                with self._condition:
+                    # Woken by local releases; host slots are polled
+                    self._condition.wait(self.POLL_INTERVAL)
+                taken, handle = self._try_slot(kind, entry, wait_marker=True)
+        finally:
+            self._unregister(kind, entry)
+
+        try:
+            yield
+        finally:
+            self._release(kind, handle)
+
+    @asynccontextmanager
+    async def acquire_async(self, kind: Optional[str], timeout: Optional[float] = None,
+                            priority: Optional[str] = None) -> AsyncIterator[None]:
+        """acquire() for coroutines: waits with asyncio.sleep instead of blocking the event loop
+
+        Cancelling the waiting coroutine leaves no slot held.
+        """
+        if kind is None:
+            yield
+            return
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        entry = self._register(kind, self._rank(priority))
+        try:
+            taken, handle = self._try_slot(kind, entry, wait_marker=self._announces(entry))
+            if not taken:
+                logging.info(f"Waiting for a free {kind} encoder slot ({self.limits[kind]} in use)")
+            while not taken:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"No {kind} encoder slot available")
+                await asyncio.sleep(self.POLL_INTERVAL)
+                taken, handle = self._try_slot(kind, entry, wait_marker=True)
+        finally:
+            self._unregister(kind, entry)
+
+        try:
+            yield
+        finally:
+            self._release(kind, handle)
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                kind: {
+                    "limit": self.limits[kind],
+                    "in_use": self._in_use[kind],
+                    "waiting": len(self._waiting[kind])
+                }
+                for kind in self.limits
+            }
+
+# Project-wide default, so every process started from this checkout shares one budget
+DEFAULT_LOCK_DIR = Path(__file__).resolve().parent.parent / 'temp' / 'encoder_locks'
+
+_shared_slots: Optional[EncoderSlots] = None
+_shared_slots_lock = threading.Lock()
+
+def get_encoder_slots() -> EncoderSlots:
+    """Process-wide EncoderSlots configured from the environment
+
+    NVENC_SESSIONS: hardware slots (default 3)
+    X264_SESSIONS: software slots (default one per 4 CPU cores)
+    ENCODER_LOCK_DIR: directory for host-wide slot locks (default temp/encoder_locks
+        in the project, shared by the API servers, the GUI and cutter pool workers)
+    """
+    global _shared_slots
+    with _shared_slots_lock:
+        if _shared_slots is None:
+            lock_dir = os.getenv('ENCODER_LOCK_DIR', '').strip()
+            sw_slots = os.getenv('X264_SESSIONS', '').strip()
+            _shared_slots = EncoderSlots(
+                hw_slots=int(os.getenv('NVENC_SESSIONS', '3')),
+                sw_slots=int(sw_slots) if sw_slots else max(1, (os.cpu_count() or 1) // 4),
+                lock_dir=Path(lock_dir) if lock_dir else DEFAULT_LOCK_DIR
+            )
+        return _shared_slots
@@ -0,0 +1,302 @@
+import time
+import asyncio
+import logging
+import threading
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+from .encoder_slots import HARDWARE, SOFTWARE, get_encoder_slots
+from .job_control import JobHandle, current_job, kill_process_tree
+from .workspace import JobWorkspace
+
+SOFTWARE_ENCODERS = ('libx264', 'libx265', 'libvpx', 'libaom', 'libsvtav1')
+# Lines of stderr kept from a captured run (ffmpeg can log for hours)
+STDERR_TAIL_LINES = 200
+
+def classify_encoder(cmd: List[str]) -> Optional[str]:
+    """Encoder slot kind needed by an ffmpeg command
+
+    Returns:
+        'hw' for NVENC encodes, 'sw' for software video encodes, None for
+        stream copy, audio-only or analysis runs
+    """
+    args = [str(arg).lower() for arg in cmd]
+    if any('nvenc' in arg for arg in args):
+        return HARDWARE
+    if any(arg.startswith(SOFTWARE_ENCODERS) for arg in args):
+        return SOFTWARE
+    return None
+
+class ProgressReporter:
+    """Turns ffmpeg -progress blocks into throttled progress updates
+
+    Updates are dicts with stage, percent, out_time, duration, fps, speed
+    and eta (seconds, None while unknown). At most one update per
+    min_interval is passed to the callback, plus the final one of every run.
+    """
+
+    def __init__(self, callback: Callable[[Dict], None], min_interval: float = 2.0):
+        self.callback = callback
+        self.min_interval = min_interval
+        self._last_emit = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _number(value: Optional[str]) -> Optional[float]:
+        try:
+            return float(str(value).rstrip('x'))
+        except (TypeError, ValueError):
+            return None
+
+    def update(self, block: Dict[str, str], duration: float, stage: Optional[str] = None):
+        """Handle one -progress block (key=value lines up to 'progress=')"""
+        finished = block.get('progress') == 'end'
+        now = time.monotonic()
+        with self._lock:
+            if not finished and now - self._last_emit < self.min_interval:
+                return
+            self._last_emit = now
+
+        out_time_us = self._number(block.get('out_time_us')) or self._number(block.get('out_time_ms'))
+        out_time = max(out_time_us or 0.0, 0.0) / 1_000_000
+        speed = self._number(block.get('speed'))
+        percent = 100.0 if finished else min(out_time / duration * 100, 99.9)
+        eta = None
+        if speed and speed > 0:
+            eta = round(max(duration - out_time, 0.0) / speed, 1)
+
+        update = {
+            'stage': stage,
+            'percent': round(percent, 1),
+            'out_time': round(out_time, 2),
+            'duration': round(duration, 2),
+            'fps': self._number(block.get('fps')),
+            'speed': speed,
+            'eta': 0.0 if finished else eta
+        }
+        try:
+            self.callback(update)
+        except Exception as e:
+            logging.warning(f"Progress callback error: {e}")
+
+_job_progress: ContextVar[Optional[ProgressReporter]] = ContextVar('ffmpeg_job_progress', default=None)
+
+@contextmanager
+def report_progress(callback: Callable[[Dict], None], min_interval: float = 2.0) -> Iterator[ProgressReporter]:
+    """Send progress of every run_ffmpeg call with a known duration in this context to callback
+
+    The context does not follow work handed to other threads; submit such
+    work with contextvars.copy_context().run to keep reporting.
+    """
+    reporter = ProgressReporter(callback, min_interval)
+    token = _job_progress.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _job_progress.reset(token)
+
+def _drain(stream, sink):
+    for line in stream:
+        sink.append(line)
+
+def _feed_progress(line: str, block: Dict[str, str], reporter: ProgressReporter,
+                   duration: float, stage: Optional[str]):
+    """Collect one -progress key=value line, reporting when a block is complete"""
+    key, _, value = line.strip().partition('=')
+    block[key] = value
+    if key == 'progress':
+        reporter.update(block, duration, stage)
+        block.clear()
+
+def _run_streaming(cmd: List[str], timeout: Optional[float], duration: Optional[float], stage: Optional[str],
+                   reporter: Optional[ProgressReporter], job: Optional[JobHandle] = None,
+                   capture_output: bool = False, check: bool = False,
+                   text: bool = False, encoding: Optional[str] = None, errors: Optional[str] = None,
+                   **kwargs) -> subprocess.CompletedProcess:
+    """Run ffmpeg reading its output incrementally
+
+    -progress pipe:1 is parsed from stdout when a reporter is given; stderr
+    is only kept as its last STDERR_TAIL_LINES lines. The process is
+    registered with job so cancelling the job kills it.
+    """
+    args = list(cmd)
+    if reporter:
+        args[1:1] = ['-progress', 'pipe:1', '-nostats']
+
+    process = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE if (capture_output or reporter) else None,
+        stderr=subprocess.PIPE if capture_output else None,
+        text=True, encoding=encoding or 'utf-8', errors=errors or 'replace',
+        **kwargs
+    )
+    if job:
+        job.attach(process.pid)
+    stdout_lines: List[str] = []
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    readers = []
+    if process.stderr:
+        readers.append(threading.Thread(target=_drain, args=(process.stderr, stderr_tail), daemon=True))
+    if process.stdout and not reporter:
+        readers.append(threading.Thread(target=_drain, args=(process.stdout, stdout_lines), daemon=True))
+    for reader in readers:
+        reader.start()
+
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        process.kill()
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        if reporter and process.stdout:
+            block = {}
+            for line in process.stdout:
+                _feed_progress(line, block, reporter, duration, stage)
+        process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        if job:
+            job.detach(process.pid)
+        for reader in readers:
+            reader.join()
+        _record_output(args)
+
+    stdout = ''.join(stdout_lines) if capture_output else None
+    stderr = ''.join(stderr_tail) if capture_output else None
+    if capture_output and not (text or encoding or errors):
+        # Same types as subprocess.run without text mode
+        stdout, stderr = stdout.encode('utf-8'), stderr.encode('utf-8')
+
+    if job:
+        job.raise_if_cancelled()
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(args, timeout, output=stdout, stderr=stderr)
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+def _record_output(cmd: List[str]):
+    """Count the output of a finished ffmpeg step in the job workspace holding it
+
+    ffmpeg takes its output file as the last argument.
+    """
+    if cmd:
+        JobWorkspace.record_output(cmd[-1])
+
+def run_ffmpeg(cmd: List[str], timeout: Optional[float] = None, duration: Optional[float] = None,
+               stage: Optional[str] = None, **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run for ffmpeg that holds an encoder slot while encoding
+
+    Accepts the same keyword arguments as subprocess.run. The slot wait is
+    not counted in timeout. Captured output keeps only the tail of stderr.
+
+    Args:
+        duration: Length of the output in seconds; enables progress updates
+            when called inside report_progress()
+        stage: Name of the step, included in progress updates
+
+    Raises:
+        JobCancelledError: The job running this call was cancelled
+    """
+    reporter = _job_progress.get() if duration and duration > 0 else None
+    job = current_job()
+    if job:
+        job.raise_if_cancelled()
+    with get_encoder_slots().acquire(classify_encoder(cmd), priority=job.priority if job else None):
+        if job:
+            # Cancelled while waiting for the slot
+            job.raise_if_cancelled()
+        elif reporter is None and not kwargs.get('capture_output'):
+            try:
+                return subprocess.run(cmd, timeout=timeout, **kwargs)
+            finally:
+                _record_output(cmd)
+        return _run_streaming(cmd, timeout, duration, stage, reporter, job, **kwargs)
+
+async def _read_lines(stream: asyncio.StreamReader, on_line: Callable[[str], None]):
+    """Read a subprocess pipe in chunks, splitting on \n and \r (ffmpeg stats lines end in \r)"""
+    pending = ''
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        pending += chunk.decode('utf-8', errors='replace').replace('\r', '\n')
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            if line:
+                on_line(line + '\n')
+    if pending:
+        on_line(pending)
+
+async def _kill(process: asyncio.subprocess.Process):
+    if process.returncode is None:
+        await asyncio.shield(asyncio.to_thread(kill_process_tree, process.pid))
+    await asyncio.shield(process.wait())
+
+async def run_ffmpeg_async(cmd: List[str], timeout: Optional[float] = None, duration: Optional[float] = None,
+                           stage: Optional[str] = None, check: bool = False,
+                           capture_output: bool = False) -> subprocess.CompletedProcess:
+    """run_ffmpeg for coroutines, built on asyncio subprocesses
+
+    Waiting for an encoder slot and for ffmpeg never blocks the event loop.
+    Cancelling the coroutine or its job, or exceeding timeout kills ffmpeg.
+    Captured output is text and keeps only the tail of stderr.
+    """
+    reporter = _job_progress.get() if duration and duration > 0 else None
+    job = current_job()
+    if job:
+        job.raise_if_cancelled()
+    async with get_encoder_slots().acquire_async(classify_encoder(cmd), priority=job.priority if job else None):
+        if job:
+            job.raise_if_cancelled()
+        args = [str(arg) for arg in cmd]
+        if reporter:
+            args[1:1] = ['-progress', 'pipe:1', '-nostats']
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE if (capture_output or reporter) else None,
+            stderr=asyncio.subprocess.PIPE if capture_output else None
+        )
+        if job:
+            job.attach(process.pid)
+
+        stdout_lines: List[str] = []
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        readers = []
+        if process.stdout:
+            if reporter:
+                block = {}
+                readers.append(_read_lines(
+                    process.stdout, lambda line: _feed_progress(line, block, reporter, duration, stage)
+                ))
+            else:
+                readers.append(_read_lines(process.stdout, stdout_lines.append))
+        if process.stderr:
+            readers.append(_read_lines(process.stderr, stderr_tail.append))
+
+        try:
+            await asyncio.wait_for(asyncio.gather(*readers, process.wait()), timeout)
+        except asyncio.TimeoutError:
+            await _kill(process)
+            raise subprocess.TimeoutExpired(args, timeout, stderr=''.join(stderr_tail) or None)
+        except asyncio.CancelledError:
+            await _kill(process)
+            raise
+        finally:
+            if job:
+                job.detach(process.pid)
+            _record_output(args)
+
+    if job:
+        job.raise_if_cancelled()
+
+    stdout = ''.join(stdout_lines) if capture_output else None
+    stderr = ''.join(stderr_tail) if capture_output else None
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
@@ -1,15 +1,25 @@
 import os
+import math
+import uuid
 from pathlib import Path
 import logging
 import subprocess
-import random
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from .file_manager import FileManager
+from .media_probe import get_media_probe
+from .clip_catalog import get_clip_catalog
+from .clip_selector import ClipSelector
+from .background_normalizer import BackgroundNormalizer
+from .ffmpeg_runner import run_ffmpeg
 
 class HookBackgroundProcessor:
-    def __init__(self, base_path: Path):
+    def __init__(self, base_path: Path, clip_indexer=None):
         self.base_path = base_path
+        self.clip_indexer = clip_indexer
         self.file_manager = FileManager(base_path)
+        self.media_probe = get_media_probe()
+        self.catalog = get_clip_catalog(base_path / 'cache' / 'clip_catalog.db')
+        self.clip_selector = ClipSelector(fps=30)
         self.temp_dir = base_path / 'temp'
         self.temp_dir.mkdir(exist_ok=True)
         
@@ -19,76 +29,77 @@ class HookBackgroundProcessor:
         self.input_9_16_dir = base_path / 'Input_9_16'
         self.input_9_16_dir.mkdir(exist_ok=True)
         
+        # Pre-normalized pools (python -m modules.background_normalizer)
+        self.normalizer = BackgroundNormalizer(base_path)
+        self.pool_16_9_dir = self.normalizer.pool_dir(False)
+        self.pool_9_16_dir = self.normalizer.pool_dir(True)
+
+    def get_clip_durations(self, input_dir: Path) -> dict:
+        """Get durations of all usable clips in a directory
+
+        Uses the in-memory table of the background indexer when it watches the
+        directory, otherwise syncs the directory against the clip catalog.
+        """
+        if self.clip_indexer and self.clip_indexer.watches(input_dir) and self.clip_indexer.is_ready(input_dir):
+            durations = self.clip_indexer.get_durations(input_dir)
+            if durations:
+                return durations
+        return self.catalog.sync_directory(input_dir)
+        
     def get_video_duration(self, video_path: Path) -> float:
         """Get video duration in seconds"""
-        try:
-            cmd = [
-                'ffprobe', 
-                '-v', 'error', 
-                '-show_entries', 'format=duration', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                str(video_path)
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return float(result.stdout.strip())
-        except Exception as e:
-            logging.error(f"Error getting video duration: {e}")
-            return 0.0
+        duration = self.media_probe.get_duration(video_path)
+        if duration <= 0:
+            logging.error(f"Error getting video duration: {video_path}")
+        return duration
             
-    def select_random_videos(self, total_duration: float, input_dir: Path) -> List[Path]:
-        """Select random videos that add up to the target duration"""
+    def select_random_videos(self, total_duration: float, input_dir: Path, seed: Optional[int] = None,
+                             temp_dir: Optional[Path] = None) -> List[Path]:
+        """Select random videos that add up to the target duration
+
+        The trimmed last clip is written to temp_dir (default: the shared temp directory).
+        """
         if not input_dir.exists():
             raise FileNotFoundError(f"Input directory not found: {input_dir}")
             
-        available_videos = list(input_dir.glob('*.mp4'))
-        if not available_videos:
+        clip_durations = self.get_clip_durations(input_dir)
+        if not clip_durations:
             raise ValueError(f"No videos found in {input_dir}")
             
-        selected_videos = []
-        current_duration = 0
+        selection = self.clip_selector.select(
+            clip_durations,
+            total_duration,
+            use_counts=self.catalog.get_use_counts(clip_durations.keys()),
+            seed=seed
+        )
+        self.catalog.mark_used(selection.clips)
+        selected_videos = list(selection.clips)
         
-        while current_duration < total_duration and available_videos:
-            video = random.choice(available_videos)
-            available_videos.remove(video)
+        if selection.needs_trim:
+            # Cut the last video to fit
+            cut_duration = selection.durations[-1] - selection.overshoot
+            cut_video = Path(temp_dir or self.temp_dir) / f"cut_{uuid.uuid4().hex[:8]}.mp4"
             
-            video_duration = self.get_video_duration(video)
-            if video_duration <= 0:
-                continue
-                
-            if current_duration + video_duration > total_duration:
-                # Cut the last video to fit
-                cut_duration = total_duration - current_duration
-                cut_video = self.temp_dir / f"cut_{len(selected_videos):04d}.mp4"
-                
-                cmd = [
-                    'ffmpeg', '-y',
-                    '-i', str(video),
-                    '-t', str(cut_duration),
-                    '-c', 'copy',
-                    str(cut_video)
-                ]
-                subprocess.run(cmd, check=True)
-                
-                selected_videos.append(cut_video)
-                current_duration += cut_duration
-                break
-            else:
-                selected_videos.append(video)
-                current_duration += video_duration
-                
-            if current_duration < total_duration and not available_videos:
-                available_videos = list(input_dir.glob('*.mp4'))
+            cmd = [
+                'ffmpeg', '-y',
+                '-i', str(selected_videos[-1]),
+                '-t', str(cut_duration),
+                '-c', 'copy',
+                str(cut_video)
+            ]
+            run_ffmpeg(cmd, check=True)
+            selected_videos[-1] = cut_video
                 
         return selected_videos
         
-    def concatenate_videos(self, video_paths: List[Path], output_path: Path):
+    def concatenate_videos(self, video_paths: List[Path], output_path: Path, temp_dir: Optional[Path] = None):
         """Concatenate multiple videos into one"""
         if not video_paths:
             raise ValueError("No videos to concatenate")
             
         try:
             # Create concat file
-            concat_file = self.temp_dir / "concat.txt"
+            concat_file = Path(temp_dir or self.temp_dir) / f"concat_{uuid.uuid4().hex[:8]}.txt"
             with open(concat_file, 'w', encoding='utf-8') as f:
                 for video in video_paths:
                     f.write(f"file '{video.absolute()}'\n")
@@ -105,73 +116,206 @@ class HookBackgroundProcessor:
                 .overwrite_output()
             )
             
-            stream.run(capture_stdout=True, capture_stderr=True)
+            # Through run_ffmpeg so the process belongs to the running job
+            run_ffmpeg(stream.compile(), check=True, capture_output=True,
+                       text=True, encoding='utf-8', errors='replace')
             
             # Cleanup concat file
             if concat_file.exists():
                 concat_file.unlink()
                 
-        except ffmpeg.Error as e:
-            logging.error(f"Error concatenating videos: {e.stderr.decode() if e.stderr else str(e)}")
+        except subprocess.CalledProcessError as e:
+            logging.error(f"Error concatenating videos: {e.stderr or e}")
             raise
         except Exception as e:
             logging.error(f"Error concatenating videos: {e}")
             raise
             
-    def process_background_videos(self, hook_duration: float, audio_duration: float, temp_dir: Path, is_vertical: bool = False) -> Tuple[Path, Path]:
+    def _take_pieces(self, clips: List[Path], durations: List[float], position: Tuple[int, float],
+                     length: float) -> Tuple[List[Tuple[Path, float, Optional[float]]], Tuple[int, float]]:
+        """Take `length` seconds from the clip sequence starting at position
+
+        Returns:
+            (pieces, new position); a piece is (clip, inpoint, outpoint or None)
+        """
+        tolerance = 1.0 / self.normalizer.FPS
+        index, offset = position
+        pieces = []
+        remaining = length
+        while remaining > tolerance:
+            if index == len(clips) and offset == 0:
+                logging.warning("Background selection too short, reusing clips from the start")
+            clip = clips[index % len(clips)]
+            available = durations[index % len(clips)] - offset
+            if available <= tolerance:
+                index, offset = index + 1, 0.0
+                continue
+            if available > remaining:
+                pieces.append((clip, offset, offset + remaining))
+                offset += remaining
+                remaining = 0
+            else:
+                pieces.append((clip, offset, None))
+                index, offset = index + 1, 0.0
+                remaining -= available
+        return pieces, (index, offset)
+
+    def _write_concat_list(self, list_path: Path, pieces: List[Tuple[Path, float, Optional[float]]]):
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for clip, inpoint, outpoint in pieces:
+                safe_path = str(Path(clip).absolute()).replace('\\', '/').replace("'", "'\\''")
+                f.write(f"file '{safe_path}'\n")
+                if inpoint > 0:
+                    f.write(f"inpoint {inpoint:.6f}\n")
+                if outpoint is not None:
+                    f.write(f"outpoint {outpoint:.6f}\n")
+
+    def _copy_pieces(self, pieces: List[Tuple[Path, float, Optional[float]]], output_path: Path):
+        """Join pool pieces with the concat demuxer, without re-encoding"""
+        list_path = output_path.with_suffix('.txt')
+        self._write_concat_list(list_path, pieces)
+        try:
+            cmd = [
+                'ffmpeg', '-y',
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', str(list_path),
+                '-map', '0:v:0',
+                '-c', 'copy',
+                '-an',
+                str(output_path)
+            ]
+            run_ffmpeg(cmd, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        except subprocess.CalledProcessError as e:
+            logging.error(f"Error assembling background {output_path}: {e.stderr}")
+            raise
+        finally:
+            if list_path.exists():
+                list_path.unlink()
+
+    def _plan_pool_pieces(self, clip_durations: dict, hook_duration: float, audio_duration: float,
+                          seed: Optional[int] = None) -> Tuple[list, list]:
+        """Select pool clips and split them into hook and main pieces
+
+        The hook piece starts at the beginning of the first clip. Every pool
+        clip has a keyframe each GOP, so the main piece starts on the first
+        keyframe after the hook ends instead of exactly where the hook ended.
+        Trailing cuts are exact because pool clips have no B-frames.
+        """
+        gop = self.normalizer.gop_seconds
+        selection = self.clip_selector.select(
+            clip_durations,
+            hook_duration + audio_duration + gop,
+            use_counts=self.catalog.get_use_counts(clip_durations.keys()),
+            seed=seed
+        )
+        self.catalog.mark_used(selection.clips)
+        clips, durations = selection.clips, selection.durations
+
+        hook_pieces, (index, offset) = self._take_pieces(clips, durations, (0, 0.0), hook_duration)
+        if offset > 0:
+            keyframe = math.ceil(offset / gop - 1e-6) * gop
+            if keyframe < durations[index % len(clips)] - 1.0 / self.normalizer.FPS:
+                offset = keyframe
+            else:
+                index, offset = index + 1, 0.0
+        main_pieces, _ = self._take_pieces(clips, durations, (index, offset), audio_duration)
+        return hook_pieces, main_pieces
+
+    def _assemble_from_pool(self, clip_durations: dict, hook_duration: float, audio_duration: float,
+                            temp_dir: Path, seed: Optional[int] = None) -> Tuple[Path, Path]:
+        """Build hook and main backgrounds from the normalized pool with stream copy only"""
+        hook_pieces, main_pieces = self._plan_pool_pieces(clip_durations, hook_duration, audio_duration, seed)
+
+        hook_output = temp_dir / "hook_background.mp4"
+        main_output = temp_dir / "main_background.mp4"
+        self._copy_pieces(hook_pieces, hook_output)
+        self._copy_pieces(main_pieces, main_output)
+        logging.info(
+            f"Assembled backgrounds from pool with stream copy: "
+            f"{len(hook_pieces)} hook pieces, {len(main_pieces)} main pieces"
+        )
+        return hook_output, main_output
+
+    def prepare_background_inputs(self, hook_duration: float, audio_duration: float, temp_dir: Path,
+                                  is_vertical: bool = False, seed: Optional[int] = None
+                                  ) -> Tuple[List[str], List[str], List[Path]]:
+        """Prepare hook and main backgrounds as ffmpeg input arguments
+
+        With a normalized pool the backgrounds are passed as concat lists and
+        no intermediate video is written. Otherwise they are rendered with
+        process_background_videos.
+
+        Returns:
+            (hook input args, main input args, temp files to clean up)
+        """
+        pool_dir = self.normalizer.pool_dir(is_vertical)
+        pool_durations = self.get_clip_durations(pool_dir) if pool_dir.exists() else {}
+        if pool_durations:
+            hook_pieces, main_pieces = self._plan_pool_pieces(pool_durations, hook_duration, audio_duration, seed)
+            hook_list = temp_dir / "hook_background.txt"
+            main_list = temp_dir / "main_background.txt"
+            self._write_concat_list(hook_list, hook_pieces)
+            self._write_concat_list(main_list, main_pieces)
+            return (
+                ['-f', 'concat', '-safe', '0', '-i', str(hook_list)],
+                ['-f', 'concat', '-safe', '0', '-i', str(main_list)],
+                [hook_list, main_list]
+            )
+
+        hook_bg, main_bg = self.process_background_videos(
+            hook_duration, audio_duration, temp_dir, is_vertical, seed=seed
+        )
+        return ['-i', str(hook_bg)], ['-i', str(main_bg)], [Path(hook_bg), Path(main_bg)]
+
+    def process_background_videos(self, hook_duration: float, audio_duration: float, temp_dir: Path,
+                                  is_vertical: bool = False, seed: Optional[int] = None) -> Tuple[Path, Path]:
         """Process background videos for hook and main parts
         
+        Uses the normalized pool when it has clips (pure stream copy), otherwise
+        cuts and re-encodes clips from the Input_* directories.
+        
         Args:
             hook_duration: Duration of hook audio in seconds
             audio_duration: Duration of main audio in seconds
             temp_dir: Directory to store temporary files
             is_vertical: Whether to use vertical videos from input_9_16 directory
+            seed: Optional seed for reproducible background selection
             
         Returns:
             Tuple[Path, Path]: Paths to hook background and main background videos
         """
         try:
+            pool_dir = self.normalizer.pool_dir(is_vertical)
+            if pool_dir.exists():
+                pool_durations = self.get_clip_durations(pool_dir)
+                if pool_durations:
+                    return self._assemble_from_pool(pool_durations, hook_duration, audio_duration, temp_dir, seed)
+            logging.warning(
+                f"Background pool {pool_dir} is empty, re-encoding from source clips. "
+                f"Run 'python -m modules.background_normalizer' to enable stream copy."
+            )
+            
             total_duration = hook_duration + audio_duration
             
             # Select input directory based on video orientation
             input_dir = self.input_9_16_dir if is_vertical else self.input_16_9_dir
             
-            # Get all mp4 files from input directory
-            available_videos = list(input_dir.glob('*.mp4'))
+            # Get all indexed clips from input directory
+            clip_durations = self.get_clip_durations(input_dir)
+            available_videos = list(clip_durations.keys())
             if not available_videos:
                 raise ValueError(f"No videos found in {input_dir}")
             
-            # Randomize video list
-            random.shuffle(available_videos)
-            
-            selected_videos = []
-            current_duration = 0
+            selection = self.clip_selector.select(
+                clip_durations,
+                total_duration,
+                use_counts=self.catalog.get_use_counts(available_videos),
+                seed=seed
+            )
+            selected_videos = selection.clips
             
-            # Select videos until we have enough duration
-            for video in available_videos:
-                video_duration = self.get_video_duration(video)
-                if video_duration <= 0:
-                    continue
-                    
-                selected_videos.append(video)
-                current_duration += video_duration
-                
-                if current_duration >= total_duration:
-                    break
-                    
-            if current_duration < total_duration:
-                # If we don't have enough duration, reuse videos
-                while current_duration < total_duration:
-                    for video in available_videos:
-                        video_duration = self.get_video_duration(video)
-                        if video_duration <= 0:
-                            continue
-                            
-                        selected_videos.append(video)
-                        current_duration += video_duration
-                        
-                        if current_duration >= total_duration:
-                            break
+            self.catalog.mark_used(selected_videos)
             
             # Now we have enough videos, let's process them
             hook_output = temp_dir / "hook_background.mp4"
@@ -179,7 +323,7 @@ class HookBackgroundProcessor:
             
             # Process first video for hook part
             first_video = selected_videos[0]
-            first_duration = self.get_video_duration(first_video)
+            first_duration = clip_durations[first_video]
             
             # Cut first video into hook part
             if is_vertical:
@@ -202,7 +346,7 @@ class HookBackgroundProcessor:
                     '-c', 'copy',
                     str(hook_output)
                 ]
-            subprocess.run(cmd, check=True)
+            run_ffmpeg(cmd, check=True)
             
             # If first video has enough duration for main part
             remaining_first = first_duration - hook_duration
@@ -230,7 +374,7 @@ class HookBackgroundProcessor:
                         '-c', 'copy',
                         str(main_output)
                     ]
-                subprocess.run(cmd, check=True)
+                run_ffmpeg(cmd, check=True)
             else:
                 # Need to use more videos for main part
                 temp_parts = []
@@ -259,13 +403,13 @@ class HookBackgroundProcessor:
                             '-c', 'copy',
                             str(temp_part)
                         ]
-                    subprocess.run(cmd, check=True)
+                    run_ffmpeg(cmd, check=True)
                     temp_parts.append(temp_part)
                     current_main_duration += remaining_first
                 
                 # Process remaining videos
                 for i, video in enumerate(selected_videos[1:], 1):
-                    video_duration = self.get_video_duration(video)
+                    video_duration = clip_durations[video]
                     remaining_needed = audio_duration - current_main_duration
                     
                     if remaining_needed <= 0:
@@ -315,12 +459,12 @@ class HookBackgroundProcessor:
                                 str(temp_part)
                             ]
                     
-                    subprocess.run(cmd, check=True)
+                    run_ffmpeg(cmd, check=True)
                     temp_parts.append(temp_part)
                     current_main_duration += min(video_duration, remaining_needed)
                 
                 # Concatenate all parts for main video
-                self.concatenate_videos(temp_parts, main_output)
+                self.concatenate_videos(temp_parts, main_output, temp_dir)
                 
                 # Cleanup temp parts
                 for temp_part in temp_parts:
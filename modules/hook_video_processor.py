@@ -3,22 +3,51 @@ from pathlib import Path
 import logging
 import subprocess
 import time
+import uuid
 import random
+import math
 import psutil
-from typing import Dict, List, Optional
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from .file_manager import FileManager
 from .subtitle_processor import SubtitleProcessor
 from .hook_background_processor import HookBackgroundProcessor
+from .media_probe import get_media_probe
+from .loudness import LoudnessNormalizer
+from .ffmpeg_runner import run_ffmpeg
+from .job_control import JobCancelledError
+from .scratch import ScratchAllocator
+from .subtitle_overlay import SubtitleOverlayRenderer
 import ffmpeg
 
 class HookVideoProcessor:
-    def __init__(self, base_path: Path):
+    # Rough scratch use per second of output (background parts + partial renders)
+    SCRATCH_BYTES_PER_SECOND = 3 * 1024 * 1024
+
+    def __init__(self, base_path: Path, clip_indexer=None):
         self.base_path = base_path
         self.file_manager = FileManager(base_path)
-        self.background_processor = HookBackgroundProcessor(base_path)
-        self.subtitle_processor = SubtitleProcessor()
+        self.background_processor = HookBackgroundProcessor(base_path, clip_indexer=clip_indexer)
+        self.subtitle_processor = SubtitleProcessor(Path(base_path) / 'cache' / 'subtitles')
+        self.media_probe = get_media_probe()
         self.temp_dir = base_path / 'temp'
         self.temp_dir.mkdir(exist_ok=True)
+        # Intermediates go to SCRATCH_DIRS when there is room, else to temp_dir
+        self.scratch = ScratchAllocator.from_env(self.temp_dir)
+        # 'single_pass': one filtergraph render, 'multi_stage': separate ffmpeg steps
+        self.render_mode = 'single_pass'
+        # Loudness target for both narrations, TARGET_LUFS= (empty) disables it
+        target_lufs = os.getenv('TARGET_LUFS', '-16').strip()
+        self.loudness = LoudnessNormalizer(base_path / 'cache', float(target_lufs)) if target_lufs else None
+        # Subtitles pre-rendered to an overlay track (SUBTITLE_PRERENDER=0 burns them with ass inline)
+        self.prerender_subtitles = os.getenv('SUBTITLE_PRERENDER', '1').strip() != '0'
+        self.subtitle_overlay = SubtitleOverlayRenderer(base_path / 'cache' / 'subtitle_overlays', fps=30)
+        self._overlay_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='subtitle-overlay')
+        # Long narrations render the main part as parallel GOP-aligned chunks
+        self.shard_workers = int(os.getenv('HOOK_SHARD_WORKERS', '4'))
+        self.shard_min_duration = float(os.getenv('HOOK_SHARD_MIN_SECONDS', '600'))
+        self.shard_min_chunk = float(os.getenv('HOOK_SHARD_MIN_CHUNK_SECONDS', '120'))
         
     def _safe_delete_file(self, file_path: Path, max_retries: int = 5, initial_delay: float = 0.5):
         """Safely delete a file with retries and exponential backoff
@@ -98,82 +127,37 @@ class HookVideoProcessor:
                 logging.error(f"Error checking file size: {size_err}")
                 return 0.0
             
-            cmd = [
-                'ffprobe', 
-                '-v', 'error', 
-                '-show_entries', 'format=duration', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                str(video_path)
-            ]
-            
-            logging.info(f"FFprobe command: {' '.join(cmd)}")
-            
-            try:
-                result = subprocess.run(
-                    cmd, 
-                    capture_output=True, 
-                    text=True, 
-                    encoding='utf-8', 
-                    errors='replace',
-                    check=False
-                )
-            except Exception as subprocess_err:
-                logging.error(f"Subprocess error: {subprocess_err}")
-                return 0.0
-            
-            if result.returncode != 0:
-                logging.error(f"FFprobe error for {video_path}")
-                logging.error(f"FFprobe stderr: {result.stderr}")
-                return 0.0
-            
-            output = result.stdout.strip()
-            if not output:
+            duration = self.media_probe.get_duration(video_path)
+            if duration <= 0:
                 logging.warning(f"No duration found for {video_path}")
-                return 0.0
-            
-            logging.info(f"FFprobe output: {output}")
-            
-            try:
-                duration = float(output)
-                return duration
-            except ValueError:
-                logging.error(f"Cannot convert duration to float: {output}")
-                return 0.0
+            return duration
         
         except Exception as e:
             logging.error(f"Unexpected error getting video duration for {video_path}: {str(e)}")
             return 0.0
 
     def get_video_size(self, video_path: str) -> tuple:
-        """Get video dimensions using ffprobe"""
-        try:
-            cmd = [
-                'ffprobe', 
-                '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height',
-                '-of', 'csv=s=x:p=0',
-                str(video_path)
-            ]
-            output = subprocess.check_output(cmd).decode('utf-8').strip()
-            width, height = map(int, output.split('x'))
-            return width, height
-        except Exception as e:
-            logging.error(f"Error getting video dimensions: {str(e)}")
+        """Get video dimensions"""
+        width, height = self.media_probe.get_size(Path(video_path))
+        if not width or not height:
+            logging.error(f"Error getting video dimensions: {video_path}")
             return 1920, 1080  # Default size if unable to detect
+        return width, height
 
     def check_gpu_support(self) -> bool:
         """Check if GPU encoding is supported"""
-        try:
-            result = subprocess.run(
-                ['ffmpeg', '-hide_banner', '-encoders'],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return 'h264_nvenc' in result.stdout
-        except Exception:
-            return False
+        if getattr(self, '_gpu_supported', None) is None:
+            try:
+                result = subprocess.run(
+                    ['ffmpeg', '-hide_banner', '-encoders'],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
+                self._gpu_supported = 'h264_nvenc' in result.stdout
+            except Exception:
+                self._gpu_supported = False
+        return self._gpu_supported
             
     def get_encoding_settings(self, is_vertical: bool = False) -> dict:
         """Get optimized encoding settings for hook videos"""
@@ -211,50 +195,75 @@ class HookVideoProcessor:
             
         return base_settings
 
-    def normalize_audio(self, input_path: Path, output_path: Path):
-        """Normalize audio to 24bit 34khz stereo"""
-        try:
-            cmd = [
-                'ffmpeg', '-y',
-                '-i', str(input_path),
-                '-acodec', 'pcm_s24le',  # 24-bit
-                '-ar', '34000',          # 34khz
-                '-ac', '2',              # stereo
-                str(output_path)
-            ]
-            subprocess.run(cmd, check=True)
-        except Exception as e:
-            logging.error(f"Error normalizing audio: {e}")
-            raise
+    def get_render_settings(self, is_vertical: bool = False) -> dict:
+        """Output parameters shared by the hook and main renders
+
+        Both parts are encoded with identical resolution, fps, GOP, profile,
+        pixel format and audio layout so they can be joined with stream copy.
+        """
+        width, height = (1080, 1920) if is_vertical else (1920, 1080)
+        encoding_settings = self.get_encoding_settings(is_vertical)
+        return {
+            'width': width,
+            'height': height,
+            'fps': 30,
+            'gop': 60,
+            'video_filter': f"scale={width}:{height},setsar=1,fps=30,format=yuv420p",
+            'video_codec': encoding_settings['video_codec'] + ['-pix_fmt', 'yuv420p'],
+            'audio_codec': ['-c:a', 'aac', '-b:a', '192k', '-ar', '48000', '-ac', '2']
+        }
+
+    def _segments_compatible(self, video_paths: List[Path]) -> bool:
+        """True when all segments share the stream parameters needed for concat copy"""
+        signatures = set()
+        for video_path in video_paths:
+            info = self.media_probe.probe(Path(video_path))
+            if not info or not info.has_video:
+                return False
+            signatures.add((
+                info.video_codec, info.width, info.height, info.fps, info.pix_fmt, info.profile,
+                info.audio_codec, info.audio_sample_rate, info.audio_channels
+            ))
+        if len(signatures) > 1:
+            logging.info(f"Segment parameters differ, re-encoding on concat: {signatures}")
+        return len(signatures) == 1
+
+    def get_audio_filter(self, audio_path: Optional[Path] = None) -> str:
+        """Audio normalization applied inside the render filtergraph
+
+        Converts narration straight to the output format (48kHz stereo float)
+        so no intermediate WAV is written and audio is resampled only once.
+        When audio_path is given, a linear loudnorm to the target loudness is
+        applied first (the measurement is cached per file content).
+        """
+        audio_filter = "aresample=48000,aformat=sample_fmts=fltp:channel_layouts=stereo"
+        if audio_path and self.loudness:
+            loudnorm = self.loudness.get_filter(Path(audio_path))
+            if loudnorm:
+                audio_filter = f"{loudnorm},{audio_filter}"
+        return audio_filter
 
     def get_audio_duration(self, audio_path: Path) -> float:
-        """Get audio duration in seconds using ffprobe"""
-        try:
-            cmd = [
-                'ffprobe', 
-                '-v', 'error', 
-                '-show_entries', 'format=duration', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                str(audio_path)
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return float(result.stdout.strip())
-        except Exception as e:
-            logging.error(f"Error getting audio duration: {e}")
-            return 0.0
+        """Get audio duration in seconds"""
+        duration = self.media_probe.get_duration(audio_path)
+        if duration <= 0:
+            logging.error(f"Error getting audio duration: {audio_path}")
+        return duration
 
     def _add_thumbnail_with_fade(self, video_path: Path, thumbnail_path: Path, 
                                audio_path: Path, output_path: Path, is_vertical: bool = False):
         """Add thumbnail with fade effect to video"""
         try:
             # Get encoding settings
-            encoding_settings = self.get_encoding_settings(is_vertical)
+            render_settings = self.get_render_settings(is_vertical)
             video_duration = self.get_video_duration(video_path)
             
             # Complex filter for overlay and fade effects
             filter_complex = [
-                "[0:v][1:v]overlay=0:0:enable='between(t,0,{})'".format(video_duration),
-                f"fade=t=in:st=0:d=0.5,fade=t=out:st={video_duration-0.5}:d=0.5[v]"
+                f"[0:v]{render_settings['video_filter']}[bg]",
+                "[bg][1:v]overlay=0:0:enable='between(t,0,{})',".format(video_duration) +
+                f"fade=t=in:st=0:d=0.5,fade=t=out:st={video_duration-0.5}:d=0.5[v]",
+                f"[2:a]{self.get_audio_filter(audio_path)}[a]"
             ]
 
             command = [
@@ -262,22 +271,23 @@ class HookVideoProcessor:
                 '-i', str(video_path),
                 '-i', str(thumbnail_path),
                 '-i', str(audio_path),
-                '-filter_complex', ','.join(filter_complex),
+                '-filter_complex', ';'.join(filter_complex),
                 '-map', '[v]',
-                '-map', '2:a'
+                '-map', '[a]'
             ]
 
             # Add encoding settings
-            command.extend(encoding_settings['video_codec'])
+            command.extend(render_settings['video_codec'])
 
             # Add audio codec
-            command.extend(['-c:a', 'aac'])
+            command.extend(render_settings['audio_codec'])
             command.append(str(output_path))
             
             # Log the command for debugging
             logging.info(f"Running FFmpeg command: {' '.join(command)}")
             
-            subprocess.run(command, check=True, capture_output=True, text=True)
+            run_ffmpeg(command, check=True, capture_output=True, text=True,
+                       duration=video_duration, stage='hook')
             
         except subprocess.CalledProcessError as e:
             logging.error(f"Error adding thumbnail with fade: {e}")
@@ -287,7 +297,8 @@ class HookVideoProcessor:
                 command = [c for c in command if not any(x in c.lower() for x in ['nvenc', 'tune', 'rc', 'bufsize'])]
                 # Add CPU encoder settings
                 command.extend(['-c:v', 'libx264', '-preset', 'medium'])
-                subprocess.run(command, check=True, capture_output=True, text=True)
+                run_ffmpeg(command, check=True, capture_output=True, text=True,
+                           duration=video_duration, stage='hook')
             except subprocess.CalledProcessError as e:
                 logging.error(f"Error adding thumbnail with fade (CPU fallback): {e}")
                 raise
@@ -295,9 +306,287 @@ class HookVideoProcessor:
             logging.error(f"Error adding thumbnail with fade: {e}")
             raise
 
+    def _prepare_subtitle(self, subtitle_path, subtitle_settings: dict, is_vertical: bool = False) -> Path:
+        """Convert SRT to ASS if needed and return the ASS path"""
+        if Path(subtitle_path).suffix.lower() == '.srt':
+            ass_path = self.subtitle_processor.convert_srt_to_ass(
+                Path(subtitle_path), 
+                subtitle_settings, 
+                0,  # No start offset needed
+                is_vertical
+            )
+            if not ass_path or not ass_path.exists():
+                logging.error(f"Failed to convert SRT to ASS: {subtitle_path}")
+                raise ValueError(f"Failed to convert SRT to ASS: {subtitle_path}")
+            subtitle_path = ass_path
+        
+        # Kiểm tra file ASS
+        if not os.path.exists(subtitle_path):
+            logging.error(f"Subtitle file not found: {subtitle_path}")
+            raise FileNotFoundError(f"Subtitle file not found: {subtitle_path}")
+        return Path(subtitle_path)
+
+    @staticmethod
+    def _escape_filter_path(path) -> str:
+        """Escape a path for use inside a filtergraph option"""
+        return str(path).replace("\\", "/").replace(":", "\\:")
+
+    def get_subtitle_overlay(self, ass_path: Path, duration: float, is_vertical: bool = False) -> Optional[Path]:
+        """Pre-rendered overlay of the subtitle, None to burn it with the ass filter"""
+        if not self.prerender_subtitles:
+            return None
+        render_settings = self.get_render_settings(is_vertical)
+        return self.subtitle_overlay.render(
+            ass_path, render_settings['width'], render_settings['height'], duration
+        )
+
+    def _build_single_pass_command(self, hook_input: List[str], main_input: List[str],
+                                   thumbnail_path: Path, hook_audio: Path, audio_path: Path,
+                                   ass_path: Path, hook_duration: float, audio_duration: float,
+                                   output_path: Path, is_vertical: bool = False,
+                                   subtitle_overlay: Optional[Path] = None) -> List[str]:
+        """Build one ffmpeg command rendering hook + main with a single encode
+
+        Inputs: 0 hook background, 1 main background, 2 thumbnail,
+        3 hook audio, 4 main audio, 5 pre-rendered subtitle overlay (optional).
+        """
+        render_settings = self.get_render_settings(is_vertical)
+        base_filter = render_settings['video_filter']
+        fade_out = max(hook_duration - 0.5, 0)
+        main_bg = f"[1:v]{base_filter},trim=duration={audio_duration:.6f},setpts=PTS-STARTPTS"
+        if subtitle_overlay:
+            main_video = f"{main_bg}[main_bg];[main_bg][5:v]overlay=0:0:eof_action=pass[main_v]"
+        else:
+            main_video = f"{main_bg},ass='{self._escape_filter_path(ass_path)}'[main_v]"
+
+        filter_complex = ";".join([
+            # Hook: background + thumbnail overlay + fade in/out
+            f"[0:v]{base_filter},trim=duration={hook_duration:.6f},setpts=PTS-STARTPTS[hook_bg]",
+            f"[hook_bg][2:v]overlay=0:0,fade=t=in:st=0:d=0.5,fade=t=out:st={fade_out:.6f}:d=0.5[hook_v]",
+            # Main: background + subtitle (overlay track or burn-in)
+            main_video,
+            # Audio padded/trimmed to the exact length of each part
+            f"[3:a]{self.get_audio_filter(hook_audio)},apad,atrim=duration={hook_duration:.6f},"
+            f"asetpts=PTS-STARTPTS[hook_a]",
+            f"[4:a]{self.get_audio_filter(audio_path)},apad,atrim=duration={audio_duration:.6f},"
+            f"asetpts=PTS-STARTPTS[main_a]",
+            "[hook_v][hook_a][main_v][main_a]concat=n=2:v=1:a=1[v][a]"
+        ])
+
+        cmd = ['ffmpeg', '-y']
+        cmd.extend(hook_input)
+        cmd.extend(main_input)
+        cmd.extend([
+            '-i', str(thumbnail_path),
+            '-i', str(hook_audio),
+            '-i', str(audio_path)
+        ])
+        if subtitle_overlay:
+            cmd.extend(['-i', str(subtitle_overlay)])
+        cmd.extend([
+            '-filter_complex', filter_complex,
+            '-map', '[v]',
+            '-map', '[a]'
+        ])
+        cmd.extend(render_settings['video_codec'])
+        cmd.extend(render_settings['audio_codec'])
+        if '-movflags' not in cmd:
+            cmd.extend(['-movflags', '+faststart'])
+        cmd.append(str(output_path))
+        return cmd
+
+    def _render_single_pass(self, hook_audio: Path, audio_path: Path, thumbnail_path: Path,
+                            subtitle_path: Path, output_path: Path, subtitle_settings: Dict,
+                            is_vertical: bool, seed: Optional[int], temp_dir: Path):
+        """Render the whole hook video with one filtergraph and one encode"""
+        hook_duration = self.get_audio_duration(hook_audio)
+        audio_duration = self.get_audio_duration(audio_path)
+        if hook_duration <= 0 or audio_duration <= 0:
+            raise ValueError(f"Invalid audio duration: hook={hook_duration}, main={audio_duration}")
+
+        ass_path = self._prepare_subtitle(subtitle_path, subtitle_settings, is_vertical)
+        # Subtitle overlay renders while the backgrounds are assembled
+        overlay_future = self._overlay_executor.submit(
+            contextvars.copy_context().run,
+            self.get_subtitle_overlay, ass_path, audio_duration, is_vertical
+        )
+        hook_input, main_input, _ = self.background_processor.prepare_background_inputs(
+            hook_duration, audio_duration, temp_dir, is_vertical, seed=seed
+        )
+        subtitle_overlay = overlay_future.result()
+
+        cmd = self._build_single_pass_command(
+            hook_input, main_input, thumbnail_path, hook_audio, audio_path, ass_path,
+            hook_duration, audio_duration, output_path, is_vertical, subtitle_overlay
+        )
+        logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
+        try:
+            run_ffmpeg(cmd, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                       duration=hook_duration + audio_duration, stage='render')
+        except subprocess.CalledProcessError as e:
+            logging.error(f"FFmpeg single-pass render error: {e.stderr}")
+            raise
+
+    def plan_shards(self, total_frames: int, gop: int, shards: int) -> List[Tuple[int, int]]:
+        """Split total_frames into at most `shards` chunks that start on a GOP boundary
+
+        Returns:
+            (first frame, frame count) of every chunk
+        """
+        shards = max(1, min(shards, math.ceil(total_frames / gop)))
+        chunk_frames = math.ceil(total_frames / shards / gop) * gop
+        chunks = []
+        start = 0
+        while start < total_frames:
+            count = min(chunk_frames, total_frames - start)
+            chunks.append((start, count))
+            start += count
+        return chunks
+
+    def _shard_count(self, audio_duration: float) -> int:
+        """Number of main-part chunks, 1 when the narration is too short to shard"""
+        if self.shard_workers <= 1 or audio_duration < self.shard_min_duration:
+            return 1
+        return max(1, min(self.shard_workers, int(audio_duration // max(self.shard_min_chunk, 1))))
+
+    def _render_hook_chunk(self, hook_input: List[str], thumbnail_path: Path, frames: int,
+                           output_path: Path, is_vertical: bool):
+        """Video-only hook part: background + thumbnail with fade, exactly `frames` frames"""
+        render_settings = self.get_render_settings(is_vertical)
+        duration = frames / render_settings['fps']
+        fade_out = max(duration - 0.5, 0)
+        cmd = ['ffmpeg', '-y']
+        cmd.extend(hook_input)
+        cmd.extend([
+            '-i', str(thumbnail_path),
+            '-filter_complex',
+            f"[0:v]{render_settings['video_filter']},setpts=PTS-STARTPTS,tpad=stop_mode=clone:stop_duration=1[hook_bg];"
+            f"[hook_bg][1:v]overlay=0:0,fade=t=in:st=0:d=0.5,fade=t=out:st={fade_out:.6f}:d=0.5[v]",
+            '-map', '[v]',
+            '-an',
+            '-frames:v', str(frames)
+        ])
+        cmd.extend(render_settings['video_codec'])
+        cmd.append(str(output_path))
+        logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
+        run_ffmpeg(cmd, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                   duration=duration, stage='hook')
+
+    def _render_main_chunk(self, main_input: List[str], start: float, frames: int, ass_path: Path,
+                           subtitle_overlay: Optional[Path], output_path: Path, is_vertical: bool):
+        """Video-only slice of the main part starting at `start` seconds"""
+        render_settings = self.get_render_settings(is_vertical)
+        duration = frames / render_settings['fps']
+        # Seek the background (and the overlay track) to the chunk start
+        cmd = ['ffmpeg', '-y', '-ss', f"{start:.6f}"]
+        cmd.extend(main_input)
+        # tpad keeps the frame count exact if the background ends a frame early
+        base = f"[0:v]{render_settings['video_filter']},setpts=PTS-STARTPTS,tpad=stop_mode=clone:stop_duration=1"
+        if subtitle_overlay:
+            cmd.extend(['-ss', f"{start:.6f}", '-i', str(subtitle_overlay)])
+            graph = f"{base}[bg];[1:v]setpts=PTS-STARTPTS[sub];[bg][sub]overlay=0:0:eof_action=pass[v]"
+        else:
+            chunk_ass = output_path.with_suffix('.ass')
+            self.subtitle_processor.shift_ass(ass_path, start, duration, chunk_ass)
+            graph = f"{base},ass='{self._escape_filter_path(chunk_ass)}'[v]"
+        cmd.extend([
+            '-filter_complex', graph,
+            '-map', '[v]',
+            '-an',
+            '-frames:v', str(frames)
+        ])
+        cmd.extend(render_settings['video_codec'])
+        cmd.append(str(output_path))
+        logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
+        run_ffmpeg(cmd, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                   duration=duration, stage=output_path.stem)
+
+    def _render_sharded(self, hook_audio: Path, audio_path: Path, thumbnail_path: Path,
+                        subtitle_path: Path, output_path: Path, subtitle_settings: Dict,
+                        is_vertical: bool, seed: Optional[int], temp_dir: Path):
+        """Render the main part as parallel video-only chunks and stitch them losslessly
+
+        The main timeline is split into GOP-aligned chunks; every chunk seeks
+        its slice of the background (and subtitle overlay or time-shifted
+        ASS) and is encoded on its own worker. The hook and the chunks are
+        joined with the concat demuxer and stream copy, and the audio of
+        both parts is encoded once over the stitched video.
+        """
+        render_settings = self.get_render_settings(is_vertical)
+        fps = render_settings['fps']
+        hook_duration = self.get_audio_duration(hook_audio)
+        audio_duration = self.get_audio_duration(audio_path)
+        if hook_duration <= 0 or audio_duration <= 0:
+            raise ValueError(f"Invalid audio duration: hook={hook_duration}, main={audio_duration}")
+        hook_frames = max(1, round(hook_duration * fps))
+        main_frames = max(1, math.ceil(audio_duration * fps))
+
+        ass_path = self._prepare_subtitle(subtitle_path, subtitle_settings, is_vertical)
+        overlay_future = self._overlay_executor.submit(
+            contextvars.copy_context().run,
+            self.get_subtitle_overlay, ass_path, main_frames / fps, is_vertical
+        )
+        hook_input, main_input, _ = self.background_processor.prepare_background_inputs(
+            hook_duration, audio_duration, temp_dir, is_vertical, seed=seed
+        )
+        subtitle_overlay = overlay_future.result()
+
+        chunks = self.plan_shards(main_frames, render_settings['gop'], self._shard_count(audio_duration))
+        logging.info(f"Rendering main part in {len(chunks)} chunks on {min(len(chunks), self.shard_workers)} workers")
+
+        hook_video = temp_dir / "hook_chunk.mp4"
+        chunk_paths = [temp_dir / f"main_chunk_{index:03d}.mp4" for index in range(len(chunks))]
+        with ThreadPoolExecutor(max_workers=self.shard_workers, thread_name_prefix='shard') as executor:
+            # Each chunk runs in a copy of this context so its progress is still reported
+            futures = [executor.submit(
+                contextvars.copy_context().run,
+                self._render_hook_chunk, hook_input, thumbnail_path, hook_frames, hook_video, is_vertical
+            )]
+            for (first_frame, frames), chunk_path in zip(chunks, chunk_paths):
+                futures.append(executor.submit(
+                    contextvars.copy_context().run,
+                    self._render_main_chunk, main_input, first_frame / fps, frames, ass_path,
+                    subtitle_overlay, chunk_path, is_vertical
+                ))
+            for future in futures:
+                future.result()
+
+        # Stitch the video losslessly, encode the audio of both parts once
+        list_path = temp_dir / "shards.txt"
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for video_path in [hook_video] + chunk_paths:
+                safe_path = str(video_path.absolute()).replace('\\', '/')
+                f.write(f"file '{safe_path}'\n")
+
+        hook_length = hook_frames / fps
+        main_length = main_frames / fps
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0', '-i', str(list_path),
+            '-i', str(hook_audio),
+            '-i', str(audio_path),
+            '-filter_complex',
+            f"[1:a]{self.get_audio_filter(hook_audio)},apad,atrim=duration={hook_length:.6f},asetpts=PTS-STARTPTS[hook_a];"
+            f"[2:a]{self.get_audio_filter(audio_path)},apad,atrim=duration={main_length:.6f},asetpts=PTS-STARTPTS[main_a];"
+            "[hook_a][main_a]concat=n=2:v=0:a=1[a]",
+            '-map', '0:v',
+            '-map', '[a]',
+            '-c:v', 'copy'
+        ]
+        cmd.extend(render_settings['audio_codec'])
+        cmd.extend(['-movflags', '+faststart', str(output_path)])
+        logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
+        try:
+            run_ffmpeg(cmd, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                       duration=hook_length + main_length, stage='audio')
+        except subprocess.CalledProcessError as e:
+            logging.error(f"FFmpeg shard stitch error: {e.stderr}")
+            raise
+
     def _process_video_with_subtitle(self, video_path: str, audio_path: str, 
                                    subtitle_path: str, output_path: str, 
-                                   subtitle_settings: dict, is_vertical: bool = False):
+                                   subtitle_settings: dict, is_vertical: bool = False,
+                                   subtitle_overlay: Optional[Path] = None):
         """Process video with subtitle
         
         Args:
@@ -307,28 +596,11 @@ class HookVideoProcessor:
             output_path (str): Path to output video
             subtitle_settings (dict): Subtitle settings
             is_vertical (bool): Whether the video is vertical
+            subtitle_overlay (Path, optional): Pre-rendered subtitle overlay, burns the ASS if None
         """
         try:
-            # Convert SRT to ASS if needed
-            if Path(subtitle_path).suffix.lower() == '.srt':
-                ass_path = self.subtitle_processor.convert_srt_to_ass(
-                    Path(subtitle_path), 
-                    subtitle_settings, 
-                    0,  # No start offset needed
-                    is_vertical
-                )
-                if not ass_path or not ass_path.exists():
-                    logging.error(f"Failed to convert SRT to ASS: {subtitle_path}")
-                    raise ValueError(f"Failed to convert SRT to ASS: {subtitle_path}")
-                subtitle_path = str(ass_path)
-            
-            # Kiểm tra file ASS
-            if not os.path.exists(subtitle_path):
-                logging.error(f"Subtitle file not found: {subtitle_path}")
-                raise FileNotFoundError(f"Subtitle file not found: {subtitle_path}")
-
-            # Chuẩn hóa đường dẫn subtitle
-            subtitle_path_str = str(subtitle_path).replace("\\", "/").replace(":", "\\:")
+            subtitle_path = self._prepare_subtitle(subtitle_path, subtitle_settings, is_vertical)
+            subtitle_path_str = self._escape_filter_path(subtitle_path)
 
             # Chuẩn bị lệnh FFmpeg
             cmd = [
@@ -336,31 +608,30 @@ class HookVideoProcessor:
                 '-i', str(video_path),
                 '-i', str(audio_path)
             ]
+            if subtitle_overlay:
+                cmd.extend(['-i', str(subtitle_overlay)])
 
-            # Sử dụng GPU cho encode cuối
-            vf_filter = 'scale=1080:1920,fps=30,setpts=PTS-STARTPTS' if is_vertical else 'scale=1920:1080,fps=30,setpts=PTS-STARTPTS'
+            # Cùng tham số encode với phần hook để nối bằng stream copy
+            render_settings = self.get_render_settings(is_vertical)
+            vf_filter = f"{render_settings['video_filter']},setpts=PTS-STARTPTS"
+            if subtitle_overlay:
+                video_graph = f'[0:v]{vf_filter}[bg];[bg][2:v]overlay=0:0:eof_action=pass[final]'
+            else:
+                video_graph = f'[0:v]{vf_filter},ass=\'{subtitle_path_str}\'[final]'
             cmd.extend([
                 '-filter_complex', 
-                f'[0:v]{vf_filter},ass=\'{subtitle_path_str}\'[final]',
+                f'{video_graph};'
+                f'[1:a]{self.get_audio_filter(audio_path)}[a]',
                 '-map', '[final]',
-                '-map', '1:a',
-                '-c:v', 'h264_nvenc',
-                '-preset', 'slow',
-                '-profile:v', 'high',
-                '-level', '4.2',
-                '-rc', 'vbr_hq',
-                '-cq', '19',
-                '-b:v', '0',
-                '-maxrate', '20M',
-                '-bufsize', '40M',
-                '-pix_fmt', 'yuv420p',
-                '-c:a', 'aac',
-                '-b:a', '192k',
-                str(output_path)
+                '-map', '[a]'
             ])
+            cmd.extend(render_settings['video_codec'])
+            cmd.extend(render_settings['audio_codec'])
+            cmd.append(str(output_path))
 
             logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            result = run_ffmpeg(cmd, check=True, capture_output=True, text=True,
+                                duration=self.get_audio_duration(audio_path), stage='main')
             logging.info(f"FFmpeg output: {result.stdout}")
             
             if not os.path.exists(output_path):
@@ -383,7 +654,7 @@ class HookVideoProcessor:
         """
         try:
             # Tạo file danh sách để nối video
-            concat_list_path = str(Path(self.temp_dir) / 'concat_list.txt')
+            concat_list_path = str(Path(self.temp_dir) / f'concat_list_{uuid.uuid4().hex[:8]}.txt')
             with open(concat_list_path, 'w') as f:
                 for video_path in video_paths:
                     f.write(f"file '{video_path}'\n")
@@ -402,7 +673,7 @@ class HookVideoProcessor:
             logging.info(f"FFmpeg concatenate command: {' '.join(cmd)}")
 
             # Chạy lệnh
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            result = run_ffmpeg(cmd, capture_output=True, text=True, check=True)
             
             # Xóa file danh sách tạm
             os.unlink(concat_list_path)
@@ -418,9 +689,8 @@ class HookVideoProcessor:
             raise
 
     def get_temp_filename(self, base_name: str, extension: str) -> str:
-        """Generate a unique temp filename with timestamp"""
-        timestamp = int(time.time())
-        return f"{base_name}_{timestamp}.{extension}"
+        """Generate a unique temp filename"""
+        return f"{base_name}_{uuid.uuid4().hex[:8]}.{extension}"
 
     def process_hook_video(
         self,
@@ -430,7 +700,9 @@ class HookVideoProcessor:
         subtitle_path: Path,
         output_path: Path,
         subtitle_settings: Dict,
-        is_vertical: bool = False
+        is_vertical: bool = False,
+        seed: Optional[int] = None,
+        render_mode: Optional[str] = None
     ) -> bool:
         """Process video with hook audio and background videos
         
@@ -442,66 +714,79 @@ class HookVideoProcessor:
             output_path: Path to output video
             subtitle_settings: Subtitle settings dict
             is_vertical: Whether the video is vertical
+            seed: Optional seed for reproducible background selection
+            render_mode: 'single_pass', 'sharded' or 'multi_stage' (default: self.render_mode,
+                single_pass switches to sharded for narrations of HOOK_SHARD_MIN_SECONDS or more)
+
+        Returns:
+            True once the video is written; failures raise
         """
+        render_mode = render_mode or self.render_mode
+        main_duration = self.get_audio_duration(audio_path)
+        if render_mode == 'single_pass' and self._shard_count(main_duration) > 1:
+            render_mode = 'sharded'
+        # Private directory for this job's intermediates, removed when it finishes
+        estimated_duration = self.get_audio_duration(hook_audio) + main_duration
+        workspace = self.scratch.allocate(estimated_duration * self.SCRATCH_BYTES_PER_SECOND)
         try:
             retry_count = 1
             retry_delay = 5
-            success = False
-            temp_files = []
+            fell_back = False
             
             for attempt in range(retry_count + 1):
                 try:
-                    temp_dir = self.temp_dir
+                    temp_dir = workspace.path
                     
-                    # Step 1: Normalize audio files
-                    hook_norm_wav = Path(temp_dir) / self.get_temp_filename("normalized_hook", "wav")
-                    main_norm_wav = Path(temp_dir) / self.get_temp_filename("normalized_main", "wav")
+                    if render_mode in ('single_pass', 'sharded'):
+                        render = self._render_sharded if render_mode == 'sharded' else self._render_single_pass
+                        try:
+                            render(
+                                hook_audio, audio_path, thumbnail_path, subtitle_path, output_path,
+                                subtitle_settings, is_vertical, seed, temp_dir
+                            )
+                            return True
+                        except JobCancelledError:
+                            raise
+                        except Exception as e:
+                            logging.warning(f"{render_mode} render failed, falling back to multi-stage: {e}")
+                            render_mode = 'multi_stage'
+                            # The fallback burns the subtitle inline in case the overlay was the problem
+                            fell_back = True
                     
-                    self.normalize_audio(hook_audio, hook_norm_wav)
-                    self.normalize_audio(audio_path, main_norm_wav)
+                    # Step 1: Get audio durations (audio is normalized inside each render graph)
+                    hook_duration = self.get_audio_duration(hook_audio)
+                    audio_duration = self.get_audio_duration(audio_path)
                     
-                    # Add to temp_files only if they exist
-                    if hook_norm_wav.exists():
-                        temp_files.append(hook_norm_wav)
-                    if main_norm_wav.exists():
-                        temp_files.append(main_norm_wav)
-                    
-                    # Step 2: Get audio durations
-                    hook_duration = self.get_audio_duration(hook_norm_wav)
-                    audio_duration = self.get_audio_duration(main_norm_wav)
-                    
-                    # Step 3: Process background videos
+                    # Step 2: Process background videos (subtitle overlay renders meanwhile)
+                    ass_path = self._prepare_subtitle(subtitle_path, subtitle_settings, is_vertical)
+                    overlay_future = None
+                    if not fell_back:
+                        overlay_future = self._overlay_executor.submit(
+                            contextvars.copy_context().run,
+                            self.get_subtitle_overlay, ass_path, audio_duration, is_vertical
+                        )
                     hook_bg, main_bg = self.background_processor.process_background_videos(
-                        hook_duration, audio_duration, temp_dir, is_vertical
+                        hook_duration, audio_duration, temp_dir, is_vertical, seed=seed
                     )
+                    subtitle_overlay = overlay_future.result() if overlay_future else None
                     
-                    # Add to temp_files only if they exist
-                    hook_bg_path = Path(hook_bg)
-                    main_bg_path = Path(main_bg)
-                    if hook_bg_path.exists():
-                        temp_files.append(hook_bg_path)
-                    if main_bg_path.exists():
-                        temp_files.append(main_bg_path)
-                    
-                    # Step 4: Add thumbnail with fade to hook background
-                    hook_with_thumb = Path(temp_dir) / self.get_temp_filename("hook_with_thumbnail", "mp4")
-                    self._add_thumbnail_with_fade(hook_bg, thumbnail_path, hook_norm_wav, hook_with_thumb, is_vertical)
-                    if hook_with_thumb.exists():
-                        temp_files.append(hook_with_thumb)
+                    # Step 3: Add thumbnail with fade to hook background
+                    hook_with_thumb = workspace.temp_file("hook_with_thumbnail", "mp4")
+                    self._add_thumbnail_with_fade(hook_bg, thumbnail_path, hook_audio, hook_with_thumb, is_vertical)
                     
-                    # Step 5: Process main part with subtitle
-                    main_with_sub = Path(temp_dir) / self.get_temp_filename("main_with_subtitle", "mp4")
+                    # Step 4: Process main part with subtitle
+                    main_with_sub = workspace.temp_file("main_with_subtitle", "mp4")
                     self._process_video_with_subtitle(
-                        main_bg, main_norm_wav, subtitle_path, main_with_sub, subtitle_settings, is_vertical
+                        main_bg, audio_path, ass_path, main_with_sub, subtitle_settings, is_vertical,
+                        subtitle_overlay
                     )
-                    if main_with_sub.exists():
-                        temp_files.append(main_with_sub)
                     
-                    # Step 6: Concatenate final video
-                    self._concatenate_videos([hook_with_thumb, main_with_sub], output_path, is_vertical)
-                    success = True
-                    break
+                    # Step 5: Concatenate final video
+                    self._concatenate_videos([hook_with_thumb, main_with_sub], output_path, is_vertical, temp_dir)
+                    return True
 
+                except JobCancelledError:
+                    raise
                 except Exception as e:
                     logging.error(f"Attempt {attempt + 1} failed: {e}")
                     if attempt < retry_count:
@@ -514,73 +799,72 @@ class HookVideoProcessor:
             logging.error(f"Error in video processing: {e}")
             raise
         finally:
-            # Log temp files before cleanup
-            logging.info(f"Cleaning up {len(temp_files)} temp files: {[str(f) for f in temp_files]}")
-            # Cleanup temp files
-            self._cleanup_temp_files(temp_files)
+            logging.info(f"Cleaning up job workspace {workspace.path}")
+            workspace.cleanup()
 
-    def _concatenate_videos(self, video_paths: List[Path], output_path: Path, is_vertical: bool = False):
-        """Concatenate multiple videos into one with re-encoding for smooth transitions"""
+    def _concatenate_videos(self, video_paths: List[Path], output_path: Path, is_vertical: bool = False,
+                            temp_dir: Optional[Path] = None):
+        """Concatenate the hook and main parts
+
+        The parts are rendered with identical settings, so they are normally
+        joined with the concat demuxer and stream copy. Re-encoding is only
+        used when their parameters differ or the copy fails.
+        """
+        temp_file = Path(temp_dir or self.temp_dir) / f"video_list_{uuid.uuid4().hex[:8]}.txt"
         try:
             # Create temp file for video list
-            temp_file = self.temp_dir / "video_list.txt"
             with open(temp_file, 'w') as f:
                 for video_path in video_paths:
                     # Convert Windows path to ffmpeg format
                     safe_path = str(video_path.absolute()).replace('\\', '/')
                     f.write(f"file '{safe_path}'\n")
             
+            if self._segments_compatible(video_paths):
+                cmd = [
+                    'ffmpeg', '-y',
+                    '-safe', '0',
+                    '-f', 'concat',
+                    '-i', str(temp_file),
+                    '-c', 'copy',
+                    '-movflags', '+faststart',
+                    str(output_path)
+                ]
+                logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
+                result = run_ffmpeg(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+                if result.returncode == 0:
+                    logging.info(f"Successfully concatenated videos (stream copy): {output_path}")
+                    return
+                logging.warning(f"Stream-copy concat failed, re-encoding: {result.stderr}")
+            
             # Get encoding settings
-            encoding_settings = self.get_encoding_settings(is_vertical)
+            render_settings = self.get_render_settings(is_vertical)
             
             # Prepare FFmpeg command with re-encoding
             cmd = [
                 'ffmpeg', '-y',
                 '-safe', '0',
                 '-f', 'concat',
-                '-i', str(temp_file)
+                '-i', str(temp_file),
+                '-vf', render_settings['video_filter']
             ]
-            
-            # Add hardware acceleration if available
-            cmd.extend(encoding_settings['hwaccel'])
-            
-            # Add video encoding settings
-            cmd.extend([
-                '-c:v', 'h264_nvenc',  # Use NVIDIA encoder
-                '-preset', 'p4',        # High quality preset
-                '-tune', 'hq',          # High quality tuning
-                '-rc', 'vbr',          # Variable bitrate
-                '-cq', '20',           # Constant quality factor
-                '-b:v', '4M',          # Target bitrate
-                '-maxrate', '6M',      # Maximum bitrate
-                '-bufsize', '8M',      # Buffer size
-                '-profile:v', 'high',  # High profile
-                '-g', '30',            # Keyframe interval
-                '-keyint_min', '30',   # Minimum keyframe interval
-            ])
-            
-            # Add audio encoding settings
-            cmd.extend([
-                '-c:a', 'aac',
-                '-b:a', '192k',
-                '-ar', '48000',
-                '-ac', '2'
-            ])
+            cmd.extend(render_settings['video_codec'])
+            cmd.extend(render_settings['audio_codec'])
             
             # Output path
             cmd.append(str(output_path))
             
             logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
-            subprocess.run(cmd, check=True)
+            run_ffmpeg(cmd, check=True, duration=sum(self.get_video_duration(path) for path in video_paths),
+                       stage='concat')
             logging.info(f"Successfully concatenated videos: {output_path}")
-            
+                    
+        except Exception as e:
+            logging.error(f"Error concatenating videos: {e}")
+            raise
+        finally:
             # Cleanup temp file
             if temp_file.exists():
                 try:
                     temp_file.unlink()
                 except Exception as e:
                     logging.warning(f"Error deleting {temp_file}: {e}")
-                    
-        except Exception as e:
-            logging.error(f"Error concatenating videos: {e}")
-            raise
@@ -0,0 +1,98 @@
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Set
+import psutil
+
+# Job priorities, lower rank first: urgent jobs get queue places and encoder slots before normal and batch jobs
+PRIORITIES = {'urgent': 0, 'normal': 1, 'batch': 2}
+
+class JobCancelledError(Exception):
+    """Raised inside a render job after it has been cancelled"""
+
+def kill_process_tree(pid: int, timeout: float = 5.0):
+    """Kill a process and all of its descendants, waiting up to timeout for them to exit"""
+    try:
+        parent = psutil.Process(pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=timeout)
+
+class JobHandle:
+    """Cancellation handle of one render job
+
+    While a job runs inside activate(), every ffmpeg started through
+    run_ffmpeg/run_ffmpeg_async is registered here. cancel() kills those
+    process trees; the ffmpeg call then raises JobCancelledError, which
+    releases its encoder slot and unwinds the job (removing its workspace).
+    Later ffmpeg calls of a cancelled job fail before starting. The job's
+    priority decides who gets the next free encoder slot.
+    """
+
+    def __init__(self, job_id: str, priority: str = 'normal'):
+        """
+        Args:
+            job_id: Task id of the job
+            priority: 'urgent', 'normal' or 'batch'
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {', '.join(PRIORITIES)}")
+        self.job_id = job_id
+        self.priority = priority
+        self._cancelled = threading.Event()
+        self._pids: Set[int] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def raise_if_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelledError(f"Job {self.job_id} was cancelled")
+
+    def attach(self, pid: int):
+        """Register a process started by this job (killed right away if the job is cancelled)"""
+        with self._lock:
+            self._pids.add(pid)
+        if self._cancelled.is_set():
+            kill_process_tree(pid)
+
+    def detach(self, pid: int):
+        with self._lock:
+            self._pids.discard(pid)
+
+    def cancel(self):
+        """Mark the job cancelled and kill its running process trees"""
+        self._cancelled.set()
+        with self._lock:
+            pids = list(self._pids)
+        for pid in pids:
+            kill_process_tree(pid)
+        logging.info(f"Cancelled job {self.job_id} ({len(pids)} running processes killed)")
+
+    @contextmanager
+    def activate(self) -> Iterator['JobHandle']:
+        """Attach ffmpeg processes started in this context to the job
+
+        Like report_progress(), the context only follows work handed to
+        other threads through contextvars.copy_context().run.
+        """
+        token = _current_job.set(self)
+        try:
+            yield self
+        finally:
+            _current_job.reset(token)
+
+_current_job: ContextVar[Optional[JobHandle]] = ContextVar('render_job', default=None)
+
+def current_job() -> Optional[JobHandle]:
+    """Handle of the job running in this context, None outside a job"""
+    return _current_job.get()
@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from .ffmpeg_runner import run_ffmpeg
+
+class LoudnessNormalizer:
+    """Two-pass EBU R128 loudness normalization with cached measurements
+
+    The first (analysis) pass runs ffmpeg's loudnorm filter once per input
+    and stores the measured loudness in a JSON cache keyed by the SHA-1 of
+    the file content, so re-running a batch with the same narration skips
+    the analysis. The second pass is a linear loudnorm filter that is
+    inserted into the final render graph.
+    """
+
+    HASH_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, cache_dir: Path, target_lufs: float = -16.0,
+                 true_peak: float = -1.5, loudness_range: float = 11.0):
+        """
+        Args:
+            cache_dir: Directory holding loudness.json
+            target_lufs: Integrated loudness target
+            true_peak: Maximum true peak in dBTP
+            loudness_range: Target loudness range in LU
+        """
+        self.cache_file = Path(cache_dir) / 'loudness.json'
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.target_lufs = target_lufs
+        self.true_peak = true_peak
+        self.loudness_range = loudness_range
+        self._lock = threading.Lock()
+        self._hashes: Dict[tuple, str] = {}
+        self._cache = self._read_cache()
+
+    def _read_cache(self) -> Dict:
+        try:
+            if self.cache_file.exists():
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read loudness cache {self.cache_file}: {e}")
+        return {}
+
+    def _write_cache(self):
+        temp_file = self.cache_file.with_suffix('.json.tmp')
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, indent=2)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            logging.warning(f"Could not write loudness cache {self.cache_file}: {e}")
+
+    def content_hash(self, path: Path) -> str:
+        """SHA-1 of the file content, memoized by (path, size, mtime)"""
+        path = Path(path).resolve()
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime)
+        with self._lock:
+            digest = self._hashes.get(key)
+        if digest:
+            return digest
+
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.HASH_BLOCK_SIZE), b''):
+                sha1.update(block)
+        digest = sha1.hexdigest()
+        with self._lock:
+            self._hashes[key] = digest
+        return digest
+
+    def _analyze(self, path: Path) -> Optional[Dict]:
+        """Run the loudnorm analysis pass and parse its JSON report"""
+        cmd = [
+            'ffmpeg', '-hide_banner', '-nostats',
+            '-i', str(path),
+            '-vn',
+            '-af', f'loudnorm=I={self.target_lufs}:TP={self.true_peak}:LRA={self.loudness_range}:print_format=json',
+            '-f', 'null', '-'
+        ]
+        result = run_ffmpeg(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            logging.error(f"Loudness analysis failed for {path}: {result.stderr}")
+            return None
+
+        match = re.search(r'\{[^{}]*"input_i"[^{}]*\}', result.stderr)
+        if not match:
+            logging.error(f"No loudnorm report in ffmpeg output for {path}")
+            return None
+        try:
+            report = json.loads(match.group(0))
+            measurement = {
+                'input_i': float(report['input_i']),
+                'input_tp': float(report['input_tp']),
+                'input_lra': float(report['input_lra']),
+                'input_thresh': float(report['input_thresh'])
+            }
+        except (KeyError, ValueError) as e:
+            logging.error(f"Invalid loudnorm report for {path}: {e}")
+            return None
+        if any(abs(value) == float('inf') for value in measurement.values()):
+            # Silent input, nothing to normalize
+            return None
+        return measurement
+
+    def measure(self, path: Path) -> Optional[Dict]:
+        """Measured loudness of an input, from the cache when possible"""
+        try:
+            digest = self.content_hash(path)
+        except OSError as e:
+            logging.error(f"Cannot hash {path} for loudness analysis: {e}")
+            return None
+
+        with self._lock:
+            cached = self._cache.get(digest)
+        if cached:
+            return cached
+
+        measurement = self._analyze(path)
+        if measurement is None:
+            return None
+        with self._lock:
+            self._cache[digest] = measurement
+            self._write_cache()
+        logging.info(f"Measured loudness of {path}: {measurement['input_i']} LUFS")
+        return measurement
+
+    def get_filter(self, path: Path) -> str:
+        """Linear loudnorm filter for the render graph, '' if the input cannot be measured"""
+        measurement = self.measure(path)
+        if not measurement:
+            return ''
+        return (
+            f"loudnorm=I={self.target_lufs}:TP={self.true_peak}:LRA={self.loudness_range}:"
+            f"measured_I={measurement['input_i']}:measured_TP={measurement['input_tp']}:"
+            f"measured_LRA={measurement['input_lra']}:measured_thresh={measurement['input_thresh']}:"
+            f"linear=true"
+        )
@@ -0,0 +1,284 @@
+import json
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+@dataclass(frozen=True)
+class MediaInfo:
+    """Metadata of a media file, collected with a single ffprobe call"""
+    path: str
+    size: int
+    mtime: float
+    duration: float
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    video_codec: Optional[str] = None
+    pix_fmt: Optional[str] = None
+    profile: Optional[str] = None
+    audio_codec: Optional[str] = None
+    audio_sample_rate: int = 0
+    audio_channels: int = 0
+    audio_layout: Optional[str] = None
+    keyframe_interval: float = 0.0
+
+    @property
+    def has_video(self) -> bool:
+        return self.width > 0 and self.height > 0
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_channels > 0
+
+    @property
+    def orientation(self) -> Optional[str]:
+        """'vertical' for 9:16 style clips, 'horizontal' otherwise, None for audio-only files"""
+        if not self.has_video:
+            return None
+        return 'vertical' if self.height > self.width else 'horizontal'
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Parse an ffprobe rational such as '30000/1001'"""
+    try:
+        if not rate:
+            return 0.0
+        if '/' in rate:
+            num, den = rate.split('/', 1)
+            return float(num) / float(den) if float(den) else 0.0
+        return float(rate)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+class MediaProbe:
+    """Shared ffprobe front-end
+
+    Every file is probed once with `-show_format -show_streams -of json`.
+    Results are kept in memory and keyed by (path, size, mtime), so a file
+    is probed again only after it was modified.
+    """
+
+    # Only the first seconds of packets are read to estimate the GOP length
+    KEYFRAME_SCAN_SECONDS = 10
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, MediaInfo]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return str(Path(path).resolve())
+
+    def get_cached(self, path: Path, stat=None) -> Optional[MediaInfo]:
+        """Return cached info if the file has not changed since it was probed"""
+        key = self._key(path)
+        try:
+            stat = stat or Path(key).stat()
+        except OSError:
+            return None
+        with self._lock:
+            info = self._cache.get(key)
+            if info and info.size == stat.st_size and info.mtime == stat.st_mtime:
+                self._cache.move_to_end(key)
+                return info
+        return None
+
+    def remember(self, info: MediaInfo):
+        """Put an already known record into the cache (e.g. loaded from disk)"""
+        with self._lock:
+            self._cache[info.path] = info
+            self._cache.move_to_end(info.path)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, path: Path):
+        with self._lock:
+            self._cache.pop(self._key(path), None)
+
+    def probe(self, path: Path) -> Optional[MediaInfo]:
+        """Probe a file, reusing the cached record when size and mtime match
+
+        Returns:
+            MediaInfo or None if the file is missing, empty or unreadable
+        """
+        key = self._key(path)
+        file_path = Path(key)
+        try:
+            stat = file_path.stat()
+        except OSError:
+            logging.error(f"Media file not found: {file_path}")
+            return None
+        if stat.st_size == 0:
+            logging.warning(f"Media file is empty: {file_path}")
+            return None
+
+        cached = self.get_cached(file_path, stat)
+        if cached:
+            return cached
+
+        data = self._run_ffprobe(file_path)
+        if data is None:
+            return None
+
+        info = self.parse(key, stat.st_size, stat.st_mtime, data)
+        self.remember(info)
+        return info
+
+    def get_duration(self, path: Path) -> float:
+        info = self.probe(path)
+        return info.duration if info else 0.0
+
+    def get_size(self, path: Path) -> Tuple[int, int]:
+        info = self.probe(path)
+        if info and info.has_video:
+            return info.width, info.height
+        return 0, 0
+
+    def get_keyframe_times(self, path: Path) -> List[float]:
+        """Timestamps of every keyframe of the first video stream
+
+        Reads packet flags only (no decoding), so it is cheap even for long files.
+        """
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            str(path)
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8',
+                                    errors='replace', check=True)
+        except Exception as e:
+            logging.error(f"Error reading keyframes of {path}: {e}")
+            return []
+
+        times = []
+        for line in result.stdout.splitlines():
+            parts = line.strip().split(',')
+            if len(parts) < 2 or 'K' not in parts[1]:
+                continue
+            try:
+                times.append(float(parts[0]))
+            except ValueError:
+                continue
+        return sorted(times)
+
+    def _run_ffprobe(self, file_path: Path) -> Optional[Dict]:
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-show_format',
+            '-show_streams',
+            '-show_entries', 'packet=stream_index,pts_time,flags',
+            '-read_intervals', f'%+{self.KEYFRAME_SCAN_SECONDS}',
+            '-of', 'json',
+            str(file_path)
+        ]
+        logging.debug(f"FFprobe command: {' '.join(cmd)}")
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                check=False
+            )
+        except Exception as e:
+            logging.error(f"Subprocess error probing {file_path}: {e}")
+            return None
+
+        if result.returncode != 0:
+            logging.error(f"FFprobe error for {file_path}: {result.stderr}")
+            return None
+
+        try:
+            return json.loads(result.stdout or '{}')
+        except json.JSONDecodeError as e:
+            logging.error(f"Cannot parse ffprobe output for {file_path}: {e}")
+            return None
+
+    @staticmethod
+    def parse(path: str, size: int, mtime: float, data: Dict) -> MediaInfo:
+        """Build a MediaInfo from ffprobe JSON output"""
+        streams = data.get('streams', [])
+        fmt = data.get('format', {})
+        video = next((s for s in streams if s.get('codec_type') == 'video'
+                      and not s.get('disposition', {}).get('attached_pic')), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+        try:
+            duration = float(fmt.get('duration') or 0.0)
+        except ValueError:
+            duration = 0.0
+        if duration <= 0:
+            for stream in (video, audio):
+                try:
+                    duration = float((stream or {}).get('duration') or 0.0)
+                except ValueError:
+                    duration = 0.0
+                if duration > 0:
+                    break
+
+        fields = {}
+        if video:
+            fps = _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate'))
+            fields.update(
+                width=int(video.get('width') or 0),
+                height=int(video.get('height') or 0),
+                fps=round(fps, 3),
+                video_codec=video.get('codec_name'),
+                pix_fmt=video.get('pix_fmt'),
+                profile=video.get('profile'),
+                keyframe_interval=MediaProbe._keyframe_interval(
+                    data.get('packets', []), video.get('index')
+                )
+            )
+        if audio:
+            fields.update(
+                audio_codec=audio.get('codec_name'),
+                audio_sample_rate=int(audio.get('sample_rate') or 0),
+                audio_channels=int(audio.get('channels') or 0),
+                audio_layout=audio.get('channel_layout')
+            )
+
+        return MediaInfo(path=path, size=size, mtime=mtime, duration=duration, **fields)
+
+    @staticmethod
+    def _keyframe_interval(packets: List[Dict], video_index: Optional[int]) -> float:
+        """Median distance in seconds between keyframes of the video stream"""
+        times = []
+        for packet in packets:
+            if packet.get('stream_index') != video_index or 'K' not in packet.get('flags', ''):
+                continue
+            try:
+                times.append(float(packet['pts_time']))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if len(times) < 2:
+            return 0.0
+        times.sort()
+        gaps = sorted(b - a for a, b in zip(times, times[1:]) if b > a)
+        if not gaps:
+            return 0.0
+        return round(gaps[len(gaps) // 2], 3)
+
+_shared_probe: Optional[MediaProbe] = None
+_shared_probe_lock = threading.Lock()
+
+def get_media_probe() -> MediaProbe:
+    """Process-wide MediaProbe shared by every processor"""
+    global _shared_probe
+    with _shared_probe_lock:
+        if _shared_probe is None:
+            _shared_probe = MediaProbe()
+        return _shared_probe
@@ -0,0 +1,194 @@
+import heapq
+import logging
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional
+from .job_control import PRIORITIES, JobHandle
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+class RenderQueue:
+    """Bounded priority job queue served by a fixed pool of worker threads
+
+    Render jobs are blocking (they wait on ffmpeg), so they run on dedicated
+    worker threads instead of the API event loop. Submissions beyond
+    max_queue waiting jobs are rejected so the server never accumulates an
+    unbounded backlog. Waiting jobs start by priority ('urgent' before
+    'normal' before 'batch'), in submission order within a priority.
+    Every job runs inside its own JobHandle so it can be cancelled, and its
+    priority also orders the job's waits for encoder slots.
+
+    urgent_workers extra threads only take urgent jobs, so an urgent job
+    starts right away even while every regular worker is busy with batch
+    work.
+    """
+
+    PRIORITIES = PRIORITIES
+
+    def __init__(self, workers: int = 1, max_queue: int = 20, name: str = 'render', urgent_workers: int = 1):
+        """
+        Args:
+            workers: Number of jobs rendered at the same time
+            max_queue: Maximum number of jobs waiting for a worker
+            name: Prefix of the worker thread names
+            urgent_workers: Additional workers reserved for urgent jobs
+        """
+        self.workers = max(1, workers)
+        self.urgent_workers = max(0, urgent_workers)
+        self.max_queue = max(0, max_queue)
+        self.name = name
+        # Heap of (priority, sequence, job_id, priority name, func, args, kwargs)
+        self._pending = []
+        self._sequence = itertools.count()
+        self._running: Dict[str, JobHandle] = {}
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    def start(self):
+        with self._condition:
+            if self._threads:
+                return
+            self._stopping = False
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            for index in range(self.urgent_workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(True,), name=f"{self.name}-urgent-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logging.info(
+            f"Render queue started with {self.workers} workers + {self.urgent_workers} urgent "
+            f"(max queue {self.max_queue})"
+        )
+
+    def stop(self, timeout: Optional[float] = None, cancel_running: bool = False) -> List[str]:
+        """Stop accepting jobs; workers exit after their current job
+
+        Args:
+            timeout: Seconds to wait for each worker
+            cancel_running: Cancel the running jobs instead of letting them finish
+
+        Returns:
+            Ids of the waiting jobs that were dropped without starting
+        """
+        with self._condition:
+            self._stopping = True
+            dropped = [job[2] for job in sorted(self._pending, key=lambda job: job[:2])]
+            self._pending = []
+            running = list(self._running.values())
+            self._condition.notify_all()
+        if cancel_running:
+            for handle in running:
+                handle.cancel()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logging.info(
+            f"Render queue stopped ({len(dropped)} waiting jobs dropped"
+            f"{f', {len(running)} running jobs cancelled' if cancel_running else ''})"
+        )
+        return dropped
+
+    def submit(self, job_id: str, func: Callable, *args, priority: str = 'normal', **kwargs) -> int:
+        """Queue a job
+
+        Args:
+            priority: 'urgent', 'normal' or 'batch'
+
+        Returns:
+            1-based position of the job in the queue
+
+        Raises:
+            ValueError: Unknown priority
+            QueueFullError: max_queue jobs are already waiting
+        """
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {', '.join(self.PRIORITIES)}")
+        with self._condition:
+            if self._stopping:
+                raise QueueFullError("Render queue is shutting down")
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError(f"Render queue is full ({self.max_queue} jobs waiting)")
+            heapq.heappush(self._pending, (
+                self.PRIORITIES[priority], next(self._sequence), job_id, priority, func, args, kwargs
+            ))
+            # Wake every worker: only some of them may take this priority
+            self._condition.notify_all()
+            return self._position(job_id)
+
+    def _position(self, job_id: str) -> Optional[int]:
+        for index, job in enumerate(sorted(self._pending, key=lambda job: job[:2])):
+            if job[2] == job_id:
+                return index + 1
+        return None
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based queue position, 0 while running, None if unknown or finished"""
+        with self._condition:
+            if job_id in self._running:
+                return 0
+            return self._position(job_id)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a job
+
+        Returns:
+            'queued' if the job was removed before it started, 'running' if
+            its ffmpeg processes were killed (the job then ends with
+            JobCancelledError), None if the job is unknown or finished
+        """
+        with self._condition:
+            for index, job in enumerate(self._pending):
+                if job[2] == job_id:
+                    self._pending.pop(index)
+                    heapq.heapify(self._pending)
+                    logging.info(f"Removed render job {job_id} from the queue")
+                    return 'queued'
+            handle = self._running.get(job_id)
+        if handle is None:
+            return None
+        handle.cancel()
+        return 'running'
+
+    def stats(self) -> Dict:
+        with self._condition:
+            queued_by_priority = {name: 0 for name in self.PRIORITIES}
+            for job in self._pending:
+                queued_by_priority[job[3]] += 1
+            return {
+                "workers": self.workers,
+                "urgent_workers": self.urgent_workers,
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "queued_by_priority": queued_by_priority,
+                "max_queue": self.max_queue
+            }
+
+    def _has_job(self, urgent_only: bool) -> bool:
+        if not self._pending:
+            return False
+        return not urgent_only or self._pending[0][0] == self.PRIORITIES['urgent']
+
+    def _worker(self, urgent_only: bool = False):
+        while True:
+            with self._condition:
+                while not self._has_job(urgent_only) and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                _, _, job_id, priority, func, args, kwargs = heapq.heappop(self._pending)
+                handle = JobHandle(job_id, priority)
+                self._running[job_id] = handle
+            try:
+                with handle.activate():
+                    func(*args, **kwargs)
+            except Exception as e:
+                logging.error(f"Render job {job_id} failed: {e}")
+            finally:
+                with self._condition:
+                    self._running.pop(job_id, None)
@@ -0,0 +1,144 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+from .workspace import JobWorkspace
+
+class ScratchAllocator:
+    """Chooses the volume that holds a job's intermediates
+
+    Scratch volumes (a tmpfs / RAM disk or a fast SSD, from SCRATCH_DIRS) are
+    tried in order; a volume is used when its free space minus the space
+    already promised to running jobs and a safety reserve can hold the job's
+    estimated intermediates. Otherwise the job falls back to the disk temp
+    directory. Per job the bytes its ffmpeg steps wrote into the workspace
+    (bytes_written, including intermediates deleted along the way) and the
+    size left at cleanup (final_bytes) are recorded.
+    """
+
+    HISTORY_SIZE = 100
+
+    def __init__(self, fallback_dir: Path, scratch_dirs: Optional[List[Path]] = None,
+                 reserve_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            fallback_dir: Disk temp directory used when no scratch volume fits
+            scratch_dirs: Preferred scratch volumes, fastest first
+            reserve_bytes: Free space always left on a scratch volume
+        """
+        self.fallback_dir = Path(fallback_dir)
+        self.fallback_dir.mkdir(parents=True, exist_ok=True)
+        self.scratch_dirs = []
+        for scratch_dir in scratch_dirs or []:
+            try:
+                Path(scratch_dir).mkdir(parents=True, exist_ok=True)
+                self.scratch_dirs.append(Path(scratch_dir))
+            except OSError as e:
+                logging.warning(f"Scratch directory {scratch_dir} is not usable: {e}")
+        self.reserve_bytes = reserve_bytes
+        self._lock = threading.Lock()
+        self._reserved: Dict[str, tuple] = {}
+        self._history = deque(maxlen=self.HISTORY_SIZE)
+        self._totals = {"jobs": 0, "bytes_written": 0, "final_bytes": 0, "fallbacks": 0}
+
+    @classmethod
+    def from_env(cls, fallback_dir: Path) -> 'ScratchAllocator':
+        """Allocator configured from the environment
+
+        SCRATCH_DIRS: scratch volumes separated by os.pathsep, fastest first
+            (e.g. /dev/shm/hookmaker or R:/scratch); empty uses fallback_dir only
+        SCRATCH_RESERVE_MB: free space kept on each scratch volume (default 512)
+        """
+        scratch_dirs = [Path(d.strip()) for d in os.getenv('SCRATCH_DIRS', '').split(os.pathsep) if d.strip()]
+        reserve_mb = int(os.getenv('SCRATCH_RESERVE_MB', '512'))
+        return cls(fallback_dir, scratch_dirs, reserve_mb * 1024 * 1024)
+
+    @property
+    def roots(self) -> List[Path]:
+        """Every directory that can hold workspaces"""
+        return self.scratch_dirs + [self.fallback_dir]
+
+    def _available(self, root: Path) -> int:
+        try:
+            free = shutil.disk_usage(root).free
+        except OSError:
+            return 0
+        promised = sum(size for volume, size in self._reserved.values() if volume == root)
+        return free - promised - self.reserve_bytes
+
+    def allocate(self, estimated_bytes: int = 0, job_id: Optional[str] = None) -> JobWorkspace:
+        """Create a workspace on the first scratch volume with enough room
+
+        Args:
+            estimated_bytes: Expected size of the job's intermediates
+            job_id: Workspace name (default: random id)
+        """
+        estimated_bytes = max(0, int(estimated_bytes))
+        with self._lock:
+            root = self.fallback_dir
+            for scratch_dir in self.scratch_dirs:
+                if self._available(scratch_dir) >= estimated_bytes:
+                    root = scratch_dir
+                    break
+            if self.scratch_dirs and root == self.fallback_dir:
+                self._totals["fallbacks"] += 1
+                logging.info(
+                    f"No scratch volume has {estimated_bytes / 1e6:.0f} MB free, "
+                    f"using {self.fallback_dir}"
+                )
+            workspace = JobWorkspace(root, job_id=job_id, on_cleanup=self._release)
+            self._reserved[workspace.job_id] = (root, estimated_bytes)
+        try:
+            return workspace.create()
+        except OSError:
+            with self._lock:
+                self._reserved.pop(workspace.job_id, None)
+            raise
+
+    def _release(self, workspace: JobWorkspace, final_bytes: int):
+        """Record the bytes the job wrote and left in its workspace and free its reservation"""
+        with self._lock:
+            _, estimated_bytes = self._reserved.pop(workspace.job_id, (workspace.root, 0))
+            self._totals["jobs"] += 1
+            self._totals["bytes_written"] += workspace.bytes_written
+            self._totals["final_bytes"] += final_bytes
+            self._history.append({
+                "job_id": workspace.job_id,
+                "volume": str(workspace.root),
+                "estimated_bytes": estimated_bytes,
+                "bytes_written": workspace.bytes_written,
+                "final_bytes": final_bytes,
+                "elapsed": round(time.time() - (workspace.created_at or time.time()), 1)
+            })
+        logging.info(
+            f"Job {workspace.job_id} wrote {workspace.bytes_written / 1e6:.1f} MB to its workspace on "
+            f"{workspace.root} ({final_bytes / 1e6:.1f} MB left at cleanup)"
+        )
+
+    def collect_orphans(self) -> int:
+        """Remove orphaned workspaces from every scratch volume and the fallback directory"""
+        return sum(JobWorkspace.collect_orphans(root) for root in self.roots)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            volumes = []
+            for root in self.roots:
+                try:
+                    free = shutil.disk_usage(root).free
+                except OSError:
+                    free = None
+                volumes.append({
+                    "path": str(root),
+                    "free_bytes": free,
+                    "reserved_bytes": sum(size for volume, size in self._reserved.values() if volume == root),
+                    "active_jobs": sum(1 for volume, _ in self._reserved.values() if volume == root)
+                })
+            return {
+                "volumes": volumes,
+                "totals": dict(self._totals),
+                "recent_jobs": list(self._history)
+            }
@@ -0,0 +1,109 @@
+import os
+import uuid
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from .ffmpeg_runner import run_ffmpeg
+from .job_control import JobCancelledError
+
+class SubtitleOverlayRenderer:
+    """Pre-renders an ASS subtitle into a transparent overlay video
+
+    libass rasterizes on a single thread, so burning subtitles with the ass
+    filter inside the final encode holds back the encoder. The overlay is
+    rendered once on a transparent canvas and encoded with QuickTime RLE
+    (argb), which only stores the lines that change between frames: frames
+    without text cost almost nothing and a subtitle line costs one frame
+    until it changes. Overlays are cached by the hash of the ASS content,
+    frame size, frame rate and duration, so the final render only composites
+    the overlay.
+    """
+
+    VERSION = 1
+    # Frames between RLE key frames, everything in between only stores changed lines
+    KEYFRAME_INTERVAL = 300
+
+    def __init__(self, cache_dir: Path, fps: int = 30):
+        """
+        Args:
+            cache_dir: Directory holding the rendered overlays
+            fps: Frame rate of the overlay, equal to the render frame rate
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.fps = fps
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @staticmethod
+    def _escape_filter_path(path) -> str:
+        return str(path).replace("\\", "/").replace(":", "\\:")
+
+    def cache_key(self, ass_path: Path, width: int, height: int, duration: float) -> str:
+        sha1 = hashlib.sha1()
+        with open(ass_path, 'rb') as f:
+            sha1.update(f.read())
+        sha1.update(f"{self.VERSION}:{width}x{height}:{self.fps}:{duration:.3f}".encode('utf-8'))
+        return sha1.hexdigest()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def build_command(self, ass_path: Path, width: int, height: int, duration: float,
+                      output_path: Path) -> list:
+        return [
+            'ffmpeg', '-y', '-hide_banner',
+            '-f', 'lavfi',
+            '-i', f"color=c=black@0.0:s={width}x{height}:r={self.fps}:d={duration:.3f},format=rgba",
+            '-vf', f"ass='{self._escape_filter_path(ass_path)}':alpha=1",
+            '-c:v', 'qtrle',
+            '-pix_fmt', 'argb',
+            '-g', str(self.KEYFRAME_INTERVAL),
+            '-an',
+            '-f', 'mov',
+            str(output_path)
+        ]
+
+    def render(self, ass_path: Path, width: int, height: int, duration: float) -> Optional[Path]:
+        """Overlay video for an ASS file, rendered on first use
+
+        Returns:
+            Path of the .mov overlay, None if it could not be rendered (the
+            caller then burns the subtitle with the ass filter)
+        """
+        try:
+            ass_path = Path(ass_path)
+            if duration <= 0 or width <= 0 or height <= 0:
+                return None
+            key = self.cache_key(ass_path, width, height, duration)
+            output_path = self.cache_dir / f"{key}.mov"
+
+            # One render per key; other jobs needing the same overlay wait for it
+            with self._key_lock(key):
+                if output_path.exists():
+                    logging.info(f"Using cached subtitle overlay: {output_path}")
+                    return output_path
+
+                temp_path = output_path.with_name(f"{key}.{uuid.uuid4().hex[:8]}.tmp")
+                cmd = self.build_command(ass_path, width, height, duration, temp_path)
+                logging.info(f"Rendering subtitle overlay: {' '.join(cmd)}")
+                try:
+                    result = run_ffmpeg(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                                        duration=duration, stage='subtitle_overlay')
+                    if result.returncode != 0 or not temp_path.exists():
+                        logging.warning(f"Subtitle overlay render failed: {result.stderr[-2000:]}")
+                        return None
+                    os.replace(temp_path, output_path)
+                finally:
+                    if temp_path.exists():
+                        temp_path.unlink()
+                return output_path
+
+        except JobCancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Could not pre-render subtitle overlay for {ass_path}: {e}")
+            return None
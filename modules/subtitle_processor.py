@@ -1,9 +1,13 @@
 import os
+import json
+import uuid
+import hashlib
 import pysubs2
 import logging
 from pathlib import Path
 from typing import Dict, Optional
 from .font_manager import FontManager
+from .ffmpeg_runner import run_ffmpeg
 import ffmpeg
 
 class ColorConverter:
@@ -74,15 +78,135 @@ class ColorConverter:
             return DEFAULT_COLORS['primary']
 
 class SubtitleProcessor:
-    def __init__(self):
-        """Initialize SubtitleProcessor"""
+    # Bump when the generated ASS changes for the same inputs
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        """Initialize SubtitleProcessor
+
+        Args:
+            cache_dir: Thư mục lưu file ASS đã tạo (mặc định: cache/subtitles)
+        """
         self.color_converter = ColorConverter()
         self.font_manager = FontManager()
+        self.cache_dir = Path(cache_dir) if cache_dir else Path(__file__).resolve().parent.parent / 'cache' / 'subtitles'
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def cache_key(self, input_path: Path, config: Optional[Dict] = None, start_offset: float = 0,
+                  is_vertical: bool = False) -> str:
+        """SHA-1 of the SRT content and every option that affects the generated ASS"""
+        sha1 = hashlib.sha1()
+        with open(input_path, 'rb') as f:
+            sha1.update(f.read())
+        options = {
+            'version': self.CACHE_VERSION,
+            'config': config or {},
+            'start_offset': round(float(start_offset), 3),
+            'is_vertical': bool(is_vertical)
+        }
+        sha1.update(json.dumps(options, sort_keys=True, default=str).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def build_ass(self, input_path: Path, config: Optional[Dict] = None, start_offset: float = 0,
+                  is_vertical: bool = False) -> Optional[pysubs2.SSAFile]:
+        """
+        Đọc SRT và áp dụng style, trả về subtitle ASS trong bộ nhớ
+        
+        Args:
+            input_path (Path): Đường dẫn file SRT
+            config (dict, optional): Cấu hình subtitle
+            start_offset (float): Offset in seconds to add to subtitle timing
+            is_vertical (bool): Whether the video is vertical
+        """
+        # Đọc subtitle
+        try:
+            subs = pysubs2.load(str(input_path), encoding='utf-8')
+            logging.info(f"Successfully loaded SRT file: {input_path}")
+        except Exception as e:
+            logging.error(f"Error loading subtitle file: {e}")
+            return None
+        
+        # Cấu hình mặc định cho video dọc
+        if is_vertical:
+            style = pysubs2.SSAStyle(
+                fontname="Arial",
+                fontsize=20,
+                primarycolor="&HFFFFFF&",  # Trắng
+                outlinecolor="&H000000&",  # Đen
+                backcolor="&H000000&",     # Đen
+                bold=0,
+                italic=0,
+                alignment=10,  # Middle-center cho video dọc (Legacy ASS)
+                marginv=20,   # Margin dọc
+                marginl=20,   # Margin trái
+                marginr=20    # Margin phải
+            )
+        else:
+            # Cấu hình cho video ngang
+            style = pysubs2.SSAStyle(
+                fontname="Arial",
+                fontsize=20,
+                primarycolor="&HFFFFFF&",  # Trắng
+                outlinecolor="&H000000&",  # Đen
+                backcolor="&H000000&",     # Đen
+                bold=0,
+                italic=0,
+                alignment=2,  # Bottom-center cho video ngang
+                marginv=10,   # Margin dọc
+                marginl=10,   # Margin trái
+                marginr=10    # Margin phải
+            )
+        
+        # Log cấu hình ban đầu
+        logging.info(f"Initial style alignment: {style.alignment}")
+        
+        # Cập nhật style từ config nếu có
+        if config:
+            logging.info(f"Applying config: {config}")
+            for key, value in config.items():
+                if hasattr(style, key):
+                    # Convert alignment từ string sang int nếu cần
+                    if key == 'alignment' and isinstance(value, str):
+                        value = int(value)
+                    old_value = getattr(style, key)
+                    setattr(style, key, value)
+                    logging.info(f"Updated {key}: {old_value} -> {value}")
+        
+        # Thêm style vào subtitle
+        subs.styles["Default"] = style
+        logging.info(f"Final style alignment: {style.alignment}")
+        
+        # Áp dụng style cho tất cả dòng
+        for line in subs:
+            line.style = "Default"
+            
+            # Xóa các tag ASS cũ nếu có
+            text = line.text
+            while '}{' in text:
+                text = text.replace('}{', '')
+            text = text.strip('{}')
+            
+            # Thêm alignment vào text
+            line.text = "{\\an%d}%s" % (style.alignment, text)
+            
+            logging.debug(f"Processed line: {line.text}")
+            
+            # Thêm offset nếu cần
+            if start_offset > 0:
+                line.start += start_offset * 1000  # Convert to ms
+                line.end += start_offset * 1000
+        
+        return subs
 
     def convert_srt_to_ass(self, input_path: Path, config: Optional[Dict] = None, start_offset: float = 0, is_vertical: bool = False) -> Optional[Path]:
         """
         Chuyển đổi subtitle từ SRT sang ASS
         
+        File ASS được lưu một lần trong cache_dir theo hash của nội dung SRT và
+        cấu hình, các lần render lại (hoặc retry) với cùng đầu vào dùng lại file
+        đã có. File được ghi qua file tạm rồi os.replace nên nhiều job dùng cùng
+        một SRT không ghi đè lẫn nhau.
+        
         Args:
             input_path (Path): Đường dẫn file SRT
             config (dict, optional): Cấu hình subtitle
@@ -93,104 +217,59 @@ class SubtitleProcessor:
             Path: Đường dẫn file ASS
         """
         try:
+            input_path = Path(input_path)
             if not input_path.exists():
                 logging.error(f"Input SRT file not found: {input_path}")
                 return None
-                
-            # Đọc subtitle
-            try:
-                subs = pysubs2.load(str(input_path), encoding='utf-8')
-                logging.info(f"Successfully loaded SRT file: {input_path}")
-            except Exception as e:
-                logging.error(f"Error loading subtitle file: {e}")
-                return None
-            
-            # Cấu hình mặc định cho video dọc
-            if is_vertical:
-                style = pysubs2.SSAStyle(
-                    fontname="Arial",
-                    fontsize=20,
-                    primarycolor="&HFFFFFF&",  # Trắng
-                    outlinecolor="&H000000&",  # Đen
-                    backcolor="&H000000&",     # Đen
-                    bold=0,
-                    italic=0,
-                    alignment=10,  # Middle-center cho video dọc (Legacy ASS)
-                    marginv=20,   # Margin dọc
-                    marginl=20,   # Margin trái
-                    marginr=20    # Margin phải
-                )
-            else:
-                # Cấu hình cho video ngang
-                style = pysubs2.SSAStyle(
-                    fontname="Arial",
-                    fontsize=20,
-                    primarycolor="&HFFFFFF&",  # Trắng
-                    outlinecolor="&H000000&",  # Đen
-                    backcolor="&H000000&",     # Đen
-                    bold=0,
-                    italic=0,
-                    alignment=2,  # Bottom-center cho video ngang
-                    marginv=10,   # Margin dọc
-                    marginl=10,   # Margin trái
-                    marginr=10    # Margin phải
-                )
-            
-            # Log cấu hình ban đầu
-            logging.info(f"Initial style alignment: {style.alignment}")
-            
-            # Cập nhật style từ config nếu có
-            if config:
-                logging.info(f"Applying config: {config}")
-                for key, value in config.items():
-                    if hasattr(style, key):
-                        # Convert alignment từ string sang int nếu cần
-                        if key == 'alignment' and isinstance(value, str):
-                            value = int(value)
-                        old_value = getattr(style, key)
-                        setattr(style, key, value)
-                        logging.info(f"Updated {key}: {old_value} -> {value}")
             
-            # Thêm style vào subtitle
-            subs.styles["Default"] = style
-            logging.info(f"Final style alignment: {style.alignment}")
+            output_path = self.cache_dir / f"{self.cache_key(input_path, config, start_offset, is_vertical)}.ass"
+            if output_path.exists():
+                logging.info(f"Using cached ASS file for {input_path}: {output_path}")
+                return output_path
             
-            # Áp dụng style cho tất cả dòng
-            for line in subs:
-                line.style = "Default"
-                
-                # Xóa các tag ASS cũ nếu có
-                text = line.text
-                while '}{' in text:
-                    text = text.replace('}{', '')
-                text = text.strip('{}')
-                
-                # Thêm alignment vào text
-                line.text = "{\\an%d}%s" % (style.alignment, text)
-                
-                logging.debug(f"Processed line: {line.text}")
-                
-                # Thêm offset nếu cần
-                if start_offset > 0:
-                    line.start += start_offset * 1000  # Convert to ms
-                    line.end += start_offset * 1000
+            subs = self.build_ass(input_path, config, start_offset, is_vertical)
+            if subs is None:
+                return None
             
-            # Lưu file ASS
-            output_path = input_path.with_suffix('.ass')
-            subs.save(str(output_path))
+            # Lưu file ASS (ghi file tạm rồi đổi tên)
+            temp_path = output_path.with_name(f"{output_path.stem}.{uuid.uuid4().hex[:8]}.tmp")
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(subs.to_string('ass'))
+                os.replace(temp_path, output_path)
+            finally:
+                if temp_path.exists():
+                    temp_path.unlink()
             logging.info(f"Successfully saved ASS file: {output_path}")
             
-            # Kiểm tra file đã được tạo
-            if not output_path.exists():
-                logging.error(f"Failed to create ASS file: {output_path}")
-                return None
-                
             return output_path
             
         except Exception as e:
             logging.error(f"Error converting SRT to ASS: {str(e)}")
             return None
 
+    def shift_ass(self, ass_path: Path, offset: float, duration: float, output_path: Path) -> Path:
+        """
+        Cắt một đoạn của file ASS: giữ các dòng nằm trong [offset, offset + duration)
+        và dời thời gian về 0, dùng cho render theo từng đoạn
+        
+        Args:
+            ass_path (Path): File ASS gốc
+            offset (float): Thời điểm bắt đầu đoạn (giây)
+            duration (float): Độ dài đoạn (giây)
+            output_path (Path): File ASS của đoạn
+        """
+        subs = pysubs2.load(str(ass_path), encoding='utf-8')
+        start_ms = int(round(offset * 1000))
+        end_ms = int(round((offset + duration) * 1000))
+        # Dòng cắt ngang ranh giới được giữ ở cả hai đoạn, phần ngoài đoạn không hiển thị
+        subs.events = [line for line in subs.events if line.end > start_ms and line.start < end_ms]
+        for line in subs.events:
+            line.start = max(line.start - start_ms, 0)
+            line.end = line.end - start_ms
+        subs.save(str(output_path), encoding='utf-8', format_='ass')
+        return Path(output_path)
+
     def create_ass_subtitle(self, srt_path: str, video_path: str, output_path: str, 
                           subtitle_settings: dict, start_offset: float = 0, is_vertical: bool = False):
         """Create ASS subtitle from SRT and apply to video
@@ -247,7 +326,7 @@ class SubtitleProcessor:
                 )
 
             # Run ffmpeg command
-            stream.run(capture_stdout=True, capture_stderr=True)
+            run_ffmpeg(stream.compile(), check=True, capture_output=True)
 
         except Exception as e:
             logging.error(f"Error creating ASS subtitle: {e}")
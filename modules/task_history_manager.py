@@ -3,11 +3,17 @@ import logging
 from pathlib import Path
 from datetime import datetime, timedelta
 import os
+import threading
 
 class TaskHistoryManager:
     def __init__(self, base_path):
         self.history_file = Path(base_path) / "task_history.json"
         self.max_history_days = 30  # Giữ lịch sử trong 30 ngày
+        # Các render worker ghi history đồng thời
+        self._lock = threading.RLock()
+        # Tiến độ render chỉ giữ trong bộ nhớ, không ghi file mỗi lần cập nhật
+        self._progress = {}
+        self._progress_lock = threading.Lock()
         
         # Tạo file mới nếu chưa tồn tại hoặc bị lỗi
         self._initialize_history_file()
@@ -52,39 +58,69 @@ class TaskHistoryManager:
             logging.error(f"Error creating new history file: {e}")
             raise
     
-    def save_task(self, task_id: str, task_data: dict):
-        """Lưu thông tin task vào file history"""
-        try:
-            # Đọc history hiện tại
-            history = self._read_history()
-            
-            # Thêm timestamp
-            task_data['saved_at'] = datetime.now().isoformat()
-            
-            # Lưu task
-            history[task_id] = task_data
-            
-            # Xóa các task quá cũ
-            self._cleanup_old_tasks(history)
-            
-            # Ghi lại file
-            self._write_history(history)
-            
-        except Exception as e:
-            logging.error(f"Error saving task history: {e}")
-            # Nếu có lỗi, thử khởi tạo lại file và lưu
+    def save_task(self, task_id: str, task_data: dict, merge: bool = False):
+        """Lưu thông tin task vào file history
+        
+        Args:
+            merge: Gộp task_data vào bản ghi hiện có thay vì ghi đè
+        """
+        with self._lock:
             try:
-                self._initialize_history_file()
-                history = {task_id: task_data}
+                # Đọc history hiện tại
+                history = self._read_history()
+                
+                if merge:
+                    task_data = {**history.get(task_id, {}), **task_data}
+                
+                # Thêm timestamp
+                task_data['saved_at'] = datetime.now().isoformat()
+                
+                # Lưu task
+                history[task_id] = task_data
+                
+                # Xóa các task quá cũ
+                self._cleanup_old_tasks(history)
+                
+                # Ghi lại file
                 self._write_history(history)
-            except Exception as e2:
-                logging.error(f"Failed to recover and save task: {e2}")
+                
+            except Exception as e:
+                logging.error(f"Error saving task history: {e}")
+                # Nếu có lỗi, thử khởi tạo lại file và lưu
+                try:
+                    self._initialize_history_file()
+                    history = {task_id: task_data}
+                    self._write_history(history)
+                except Exception as e2:
+                    logging.error(f"Failed to recover and save task: {e2}")
+    
+    def update_task(self, task_id: str, updates: dict):
+        """Cập nhật một phần thông tin task, giữ nguyên các trường khác"""
+        self.save_task(task_id, dict(updates), merge=True)
+    
+    def set_progress(self, task_id: str, progress: dict):
+        """Cập nhật tiến độ render đang chạy (chỉ trong bộ nhớ, get_task trả về trong render_progress)"""
+        with self._progress_lock:
+            self._progress[task_id] = progress
+    
+    def clear_progress(self, task_id: str):
+        """Xóa tiến độ khi task kết thúc"""
+        with self._progress_lock:
+            self._progress.pop(task_id, None)
     
     def get_task(self, task_id: str) -> dict:
-        """Lấy thông tin task từ history"""
+        """Lấy thông tin task từ history, kèm tiến độ render nếu task đang chạy"""
         try:
-            history = self._read_history()
-            return history.get(task_id, {"status": "not_found"})
+            with self._lock:
+                history = self._read_history()
+            task = history.get(task_id)
+            if task is None:
+                return {"status": "not_found"}
+            with self._progress_lock:
+                progress = self._progress.get(task_id)
+            if progress is not None:
+                task["render_progress"] = progress
+            return task
         except Exception as e:
             logging.error(f"Error reading task history: {e}")
             return {"status": "not_found"}
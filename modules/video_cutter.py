@@ -1,14 +1,35 @@
+import os
 import subprocess
 from pathlib import Path
 import logging
-from typing import List, Dict
-import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 import random
+from .media_probe import get_media_probe
+from .ffmpeg_runner import run_ffmpeg
 
 class VideoCutter:
+    # Chuỗi filter chuẩn hóa về 1920x1080, 30fps
+    STANDARD_FILTER = ("scale=1920:1080:force_original_aspect_ratio=decrease,"
+                       "pad=1920:1080:(ow-iw)/2:(oh-ih)/2,fps=30")
+    # Audio chuẩn của mọi file cut (đường copy và đường encode giống nhau để concat -c copy được)
+    AUDIO_ARGS = ["-c:a", "aac", "-ar", "48000", "-ac", "2"]
+
     def __init__(self, cut_dir: Path):
         self.cut_dir = Path(cut_dir)
         self.cut_dir.mkdir(parents=True, exist_ok=True)
+        self.media_probe = get_media_probe()
+
+    @staticmethod
+    def _encoder_args(gpu_enabled: bool) -> List[str]:
+        """Tham số encode dùng chung cho chuẩn hóa và cắt video"""
+        return [
+            "-c:v", "h264_nvenc" if gpu_enabled else "libx264",
+            "-preset", "p7" if gpu_enabled else "medium",
+            "-rc:v", "vbr_hq" if gpu_enabled else "vbr",
+            "-cq:v", "18",
+            "-profile:v", "high",
+        ]
 
     def standardize_video(self, input_path: Path, output_path: Path, gpu_enabled: bool = True) -> bool:
         """Chuẩn hóa video về 1920x1080, 30fps"""
@@ -35,13 +56,9 @@ class VideoCutter:
             
             cmd.extend([
                 "-i", str(input_path),
-                "-vf", "scale=1920:1080:force_original_aspect_ratio=decrease,"
-                       "pad=1920:1080:(ow-iw)/2:(oh-ih)/2,fps=30",
-                "-c:v", "h264_nvenc" if gpu_enabled else "libx264",
-                "-preset", "p7" if gpu_enabled else "medium",
-                "-rc:v", "vbr_hq" if gpu_enabled else "vbr",
-                "-cq:v", "18",
-                "-profile:v", "high",
+                "-vf", self.STANDARD_FILTER,
+                *self._encoder_args(gpu_enabled),
+                *self.AUDIO_ARGS,
                 str(output_path)
             ])
             
@@ -50,7 +67,7 @@ class VideoCutter:
             
             try:
                 # Chạy với capture_output để lấy error message
-                result = subprocess.run(
+                result = run_ffmpeg(
                     cmd, 
                     capture_output=True,
                     text=True,
@@ -90,20 +107,21 @@ class VideoCutter:
 
     def get_video_duration(self, video_path: Path) -> float:
         """Lấy thời lượng của video"""
-        cmd = [
-            "ffprobe", "-v", "error", "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1", str(video_path)
-        ]
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return float(result.stdout.strip())
-        except Exception as e:
-            logging.error(f"Error getting video duration: {e}")
-            raise
+        duration = self.media_probe.get_duration(video_path)
+        if duration <= 0:
+            logging.error(f"Error getting video duration: {video_path}")
+            raise ValueError(f"Could not read duration of {video_path}")
+        return duration
 
     def cut_video(self, input_path: Path, start_time: float, duration: float, 
-                 output_path: Path, gpu_enabled: bool = True) -> bool:
-        """Cắt một đoạn video từ input"""
+                 output_path: Path, gpu_enabled: bool = True,
+                 video_filter: Optional[str] = None) -> bool:
+        """Cắt một đoạn video từ input
+
+        Args:
+            video_filter: Filter áp dụng khi encode (vd. STANDARD_FILTER để
+                chuẩn hóa và cắt trong cùng một lần encode)
+        """
         try:
             # Kiểm tra file input
             input_path = Path(input_path).resolve()
@@ -130,11 +148,12 @@ class VideoCutter:
                 "-ss", str(start_time),
                 "-t", str(duration),
                 "-i", str(input_path),
-                "-c:v", "h264_nvenc" if gpu_enabled else "libx264",
-                "-preset", "p7" if gpu_enabled else "medium",
-                "-rc:v", "vbr_hq" if gpu_enabled else "vbr",
-                "-cq:v", "18",
-                "-profile:v", "high",
+            ])
+            if video_filter:
+                cmd.extend(["-vf", video_filter])
+            cmd.extend([
+                *self._encoder_args(gpu_enabled),
+                *self.AUDIO_ARGS,
                 str(output_path)
             ])
             
@@ -143,7 +162,7 @@ class VideoCutter:
             
             try:
                 # Chạy với capture_output để lấy error message
-                result = subprocess.run(
+                result = run_ffmpeg(
                     cmd, 
                     capture_output=True,
                     text=True,
@@ -156,7 +175,7 @@ class VideoCutter:
                     logging.error(f"FFmpeg error: {result.stderr}")
                     if gpu_enabled:
                         logging.warning("GPU encoding failed, falling back to CPU")
-                        return self.cut_video(input_path, start_time, duration, output_path, False)
+                        return self.cut_video(input_path, start_time, duration, output_path, False, video_filter)
                     return False
                 
                 # Kiểm tra file output
@@ -170,7 +189,7 @@ class VideoCutter:
                 logging.error(f"FFmpeg process error: {str(e)}")
                 if gpu_enabled:
                     logging.warning("GPU encoding failed, falling back to CPU")
-                    return self.cut_video(input_path, start_time, duration, output_path, False)
+                    return self.cut_video(input_path, start_time, duration, output_path, False, video_filter)
                 return False
                 
             except Exception as e:
@@ -181,9 +200,205 @@ class VideoCutter:
             logging.error(f"Error cutting video: {str(e)}")
             return False
 
+    @staticmethod
+    def plan_segments(duration: float, min_duration: float, max_duration: float) -> List[Tuple[float, float]]:
+        """Chia thời lượng thành các đoạn (start, duration) có độ dài ngẫu nhiên"""
+        segments = []
+        current_time = 0.0
+        while current_time < duration:
+            segment_duration = random.uniform(min_duration, max_duration)
+            if current_time + segment_duration > duration:
+                segment_duration = duration - current_time
+            segments.append((current_time, segment_duration))
+            current_time += segment_duration
+        return segments
+
+    @staticmethod
+    def is_conforming(info) -> bool:
+        """Video đã đúng chuẩn 1920x1080, 30fps, H.264 yuv420p thì không cần encode lại
+
+        Chỉ xét luồng video; audio chưa đúng chuẩn (xem audio_conforms) được
+        encode lại riêng trên đường copy.
+        """
+        return bool(
+            info
+            and info.video_codec == "h264"
+            and info.width == 1920
+            and info.height == 1080
+            and abs(info.fps - 30) < 0.01
+            and info.pix_fmt == "yuv420p"
+        )
+
+    @staticmethod
+    def audio_conforms(info) -> bool:
+        """Audio đã là AAC 48kHz stereo (hoặc không có audio) thì copy được"""
+        return bool(info) and (not info.has_audio or (
+            info.audio_codec == "aac"
+            and info.audio_sample_rate == 48000
+            and info.audio_channels == 2
+            and info.audio_layout in (None, "", "stereo")
+        ))
+
+    @staticmethod
+    def plan_keyframe_segments(keyframes: List[float], duration: float, min_duration: float,
+                               max_duration: float) -> List[Tuple[float, float]]:
+        """Chọn điểm cắt ngẫu nhiên rồi dời về keyframe gần nhất
+
+        Mỗi đoạn bắt đầu tại một keyframe nên có thể cắt bằng -c copy.
+        """
+        segments = []
+        current_time = 0.0
+        candidates = [k for k in keyframes if 0 < k < duration]
+        while current_time < duration:
+            target = current_time + random.uniform(min_duration, max_duration)
+            if target >= duration:
+                segments.append((current_time, duration - current_time))
+                break
+            later = [k for k in candidates if k > current_time]
+            if not later:
+                segments.append((current_time, duration - current_time))
+                break
+            in_range = [k for k in later if min_duration <= k - current_time <= max_duration]
+            cut = min(in_range or later, key=lambda k: abs(k - target))
+            segments.append((current_time, cut - current_time))
+            current_time = cut
+        return segments
+
+    def split_segments_copy(self, input_path: Path, segments: List[Tuple[float, float]], stem: str,
+                            copy_audio: bool = True) -> List[Path]:
+        """Cắt các đoạn bằng stream copy (điểm cắt phải nằm trên keyframe)
+
+        Args:
+            copy_audio: False thì encode lại audio theo AUDIO_ARGS, video vẫn copy
+        """
+        input_path = Path(input_path).resolve()
+        # Lùi 1ms để segment muxer chắc chắn cắt đúng tại keyframe đó
+        cut_times = ",".join(f"{max(start - 0.001, 0):.6f}" for start, _ in segments[1:])
+        pattern = self.cut_dir / f"cut_%04d_{stem.replace('%', '%%')}.mp4"
+
+        cmd = ["ffmpeg", "-y", "-i", str(input_path), "-map", "0:v:0", "-map", "0:a?"]
+        cmd.extend(["-c", "copy"] if copy_audio else ["-c:v", "copy", *self.AUDIO_ARGS])
+        if cut_times:
+            cmd.extend(["-segment_times", cut_times])
+        else:
+            cmd.extend(["-segment_time", str(segments[0][1] + 1)])
+        cmd.extend([
+            "-f", "segment",
+            "-reset_timestamps", "1",
+            str(pattern)
+        ])
+
+        logging.info(f"FFmpeg command: {' '.join(cmd)}")
+        result = run_ffmpeg(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            logging.error(f"FFmpeg error: {result.stderr}")
+            return []
+
+        return [
+            path for path in (self._segment_output_path(i, stem) for i in range(len(segments)))
+            if path.exists()
+        ]
+
+    def _process_conforming_video(self, input_path: Path, duration: float,
+                                  min_duration: float, max_duration: float,
+                                  copy_audio: bool = True) -> List[Path]:
+        """Fast path: cắt video đã chuẩn bằng -c copy tại các keyframe"""
+        keyframes = self.media_probe.get_keyframe_times(input_path)
+        if len(keyframes) < 2:
+            logging.info(f"Not enough keyframes in {input_path}, using re-encode path")
+            return []
+        segments = self.plan_keyframe_segments(keyframes, duration, min_duration, max_duration)
+        logging.info(f"Stream-copy cutting {len(segments)} keyframe-aligned segments from {input_path}")
+        return self.split_segments_copy(input_path, segments, input_path.stem, copy_audio)
+
+    def _segment_output_path(self, index: int, stem: str) -> Path:
+        return self.cut_dir / f"cut_{index:04d}_{stem}.mp4"
+
+    def split_segments(self, input_path: Path, segments: List[Tuple[float, float]], stem: str,
+                       gpu_enabled: bool = True, video_filter: Optional[str] = None) -> List[Path]:
+        """Cắt toàn bộ các đoạn trong một lần chạy ffmpeg
+
+        Dùng segment muxer, ép keyframe tại các điểm cắt để mỗi file bắt đầu
+        đúng vị trí đã chọn. Nếu có video_filter, video được chuẩn hóa ngay
+        trong lần encode này.
+
+        Returns:
+            List[Path]: Các file segment đã tạo
+        """
+        input_path = Path(input_path).resolve()
+        cut_times = ",".join(f"{start:.3f}" for start, _ in segments[1:])
+        # '%' trong tên file phải được escape cho segment muxer
+        pattern = self.cut_dir / f"cut_%04d_{stem.replace('%', '%%')}.mp4"
+
+        cmd = ["ffmpeg", "-y"]
+        if gpu_enabled:
+            cmd.extend(["-hwaccel", "cuda"])
+        cmd.extend(["-i", str(input_path), "-map", "0:v:0", "-map", "0:a?"])
+        if video_filter:
+            cmd.extend(["-vf", video_filter])
+        cmd.extend(self._encoder_args(gpu_enabled))
+        if gpu_enabled:
+            cmd.extend(["-forced-idr", "1"])
+        if cut_times:
+            cmd.extend(["-force_key_frames", cut_times, "-segment_times", cut_times])
+        else:
+            cmd.extend(["-segment_time", str(segments[0][1] + 1)])
+        cmd.extend([
+            *self.AUDIO_ARGS,
+            "-f", "segment",
+            "-reset_timestamps", "1",
+            str(pattern)
+        ])
+
+        logging.info(f"FFmpeg command: {' '.join(cmd)}")
+        result = run_ffmpeg(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            logging.error(f"FFmpeg error: {result.stderr}")
+            if gpu_enabled:
+                logging.warning("GPU encoding failed, falling back to CPU")
+                return self.split_segments(input_path, segments, stem, False, video_filter)
+            return []
+
+        return [
+            path for path in (self._segment_output_path(i, stem) for i in range(len(segments)))
+            if path.exists()
+        ]
+
+    def cut_segments_parallel(self, input_path: Path, segments: List[Tuple[float, float]], stem: str,
+                              max_workers: Optional[int] = None,
+                              video_filter: Optional[str] = None) -> List[Path]:
+        """Cắt các đoạn song song bằng nhiều tiến trình ffmpeg"""
+        max_workers = max_workers or min(4, os.cpu_count() or 1)
+
+        def cut(item):
+            index, (start, duration) = item
+            output_path = self._segment_output_path(index, stem)
+            ok = self.cut_video(input_path, start, duration, output_path, video_filter=video_filter)
+            return output_path if ok else None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(cut, enumerate(segments)))
+
+        failed = sum(1 for r in results if r is None)
+        if failed:
+            logging.error(f"Failed to cut {failed}/{len(segments)} segments")
+        return [r for r in results if r is not None]
+
     def process_raw_video(self, input_path: Path, min_duration: float = 4.0, 
-                         max_duration: float = 7.0) -> List[Path]:
-        """Xử lý video raw: chuẩn hóa và cắt thành các đoạn nhỏ"""
+                         max_duration: float = 7.0, cut_mode: str = "segment",
+                         max_workers: Optional[int] = None, one_pass: bool = True,
+                         allow_stream_copy: bool = True) -> List[Path]:
+        """Xử lý video raw: chuẩn hóa và cắt thành các đoạn nhỏ
+
+        Args:
+            cut_mode: "segment" (một lệnh ffmpeg cho mọi đoạn), "pool" (nhiều
+                ffmpeg song song) hoặc "sequential" (cắt lần lượt như cũ)
+            max_workers: Số tiến trình ffmpeg tối đa cho chế độ "pool"
+            one_pass: Chuẩn hóa và cắt trong cùng một lần encode, không tạo
+                file std_* trung gian
+            allow_stream_copy: Video đã đúng chuẩn 1920x1080/30fps/H.264 được
+                cắt bằng -c copy tại keyframe, không encode lại
+        """
         try:
             # Kiểm tra file input
             input_path = Path(input_path).resolve()
@@ -196,53 +411,65 @@ class VideoCutter:
             logging.info(f"Min duration: {min_duration}s")
             logging.info(f"Max duration: {max_duration}s")
             
-            # Chuẩn hóa video trước
-            std_path = self.cut_dir / f"std_{input_path.name}"
-            logging.info(f"Standardizing to: {std_path}")
+            if allow_stream_copy:
+                info = self.media_probe.probe(input_path)
+                if self.is_conforming(info):
+                    cut_files = self._process_conforming_video(
+                        input_path, info.duration, min_duration, max_duration,
+                        copy_audio=self.audio_conforms(info)
+                    )
+                    if cut_files:
+                        logging.info(f"Successfully created {len(cut_files)} segments (stream copy)")
+                        return cut_files
+                    logging.warning("Stream-copy cutting failed, falling back to re-encode")
             
-            if not self.standardize_video(input_path, std_path):
-                raise ValueError("Failed to standardize video")
+            if one_pass:
+                # Cắt trực tiếp từ file raw, filter chuẩn hóa chạy trong lần encode cắt
+                source_path = input_path
+                video_filter = self.STANDARD_FILTER
+                std_path = None
+            else:
+                # Chuẩn hóa video trước
+                std_path = self.cut_dir / f"std_{input_path.name}"
+                logging.info(f"Standardizing to: {std_path}")
+                
+                if not self.standardize_video(input_path, std_path):
+                    raise ValueError("Failed to standardize video")
+                source_path = std_path
+                video_filter = None
 
             # Lấy thời lượng video
             try:
-                duration = self.get_video_duration(std_path)
+                duration = self.get_video_duration(source_path)
                 logging.info(f"Video duration: {duration}s")
             except Exception as e:
-                std_path.unlink(missing_ok=True)
+                if std_path:
+                    std_path.unlink(missing_ok=True)
                 raise ValueError(f"Failed to get video duration: {str(e)}")
 
-            cut_files = []
-            current_time = 0.0
-
-            while current_time < duration:
-                try:
-                    # Random độ dài đoạn cắt
-                    segment_duration = random.uniform(min_duration, max_duration)
-                    if current_time + segment_duration > duration:
-                        segment_duration = duration - current_time
-
-                    # Tạo file output cho segment
-                    output_path = self.cut_dir / f"cut_{len(cut_files):04d}_{input_path.stem}.mp4"
-                    logging.info(f"Cutting segment {len(cut_files)+1}:")
-                    logging.info(f"Start time: {current_time}s")
-                    logging.info(f"Duration: {segment_duration}s")
-                    logging.info(f"Output: {output_path}")
-                    
-                    # Cắt segment
-                    if self.cut_video(std_path, current_time, segment_duration, output_path):
+            segments = self.plan_segments(duration, min_duration, max_duration)
+            logging.info(f"Cutting {len(segments)} segments (mode: {cut_mode}, one pass: {one_pass})")
+
+            if cut_mode == "segment":
+                cut_files = self.split_segments(source_path, segments, input_path.stem, video_filter=video_filter)
+            elif cut_mode == "pool":
+                cut_files = self.cut_segments_parallel(
+                    source_path, segments, input_path.stem, max_workers, video_filter=video_filter
+                )
+            else:
+                cut_files = []
+                for index, (start_time, segment_duration) in enumerate(segments):
+                    output_path = self._segment_output_path(index, input_path.stem)
+                    logging.info(f"Cutting segment {index + 1}: start {start_time}s, duration {segment_duration}s")
+                    if self.cut_video(source_path, start_time, segment_duration, output_path,
+                                      video_filter=video_filter):
                         cut_files.append(output_path)
-                        logging.info(f"Successfully cut segment {len(cut_files)}")
                     else:
-                        logging.error(f"Failed to cut segment at {current_time}s")
-                    
-                    current_time += segment_duration
-
-                except Exception as e:
-                    logging.error(f"Error cutting segment: {str(e)}")
-                    continue
+                        logging.error(f"Failed to cut segment at {start_time}s")
 
             # Xóa file chuẩn hóa tạm
-            std_path.unlink(missing_ok=True)
+            if std_path:
+                std_path.unlink(missing_ok=True)
             
             # Kiểm tra kết quả
             if not cut_files:
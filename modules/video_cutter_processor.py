@@ -1,48 +1,176 @@
+import os
+import time
 import logging
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional
 from .video_cutter import VideoCutter
 from .file_manager import FileManager
 
+def _process_raw_video_worker(cut_dir: str, raw_video: str, min_duration: float,
+                              max_duration: float) -> List[str]:
+    """Chạy trong tiến trình con: cắt một raw video (phải là hàm module-level để pickle được)"""
+    cutter = VideoCutter(Path(cut_dir))
+    segments = cutter.process_raw_video(Path(raw_video), min_duration=min_duration, max_duration=max_duration)
+    return [str(segment) for segment in segments]
+
 class VideoCutterProcessor:
-    def __init__(self, raw_dir: Path, cut_dir: Path):
-        """Khởi tạo processor để cắt video từ raw thành các segment"""
+    # Số thread CPU mà một lần encode 1080p dùng hiệu quả
+    THREADS_PER_ENCODE = 4
+    # Tốc độ encode ước lượng (số giây video / giây thực) cho dry-run
+    ESTIMATED_SPEED_GPU = 8.0
+    ESTIMATED_SPEED_CPU = 1.5
+
+    def __init__(self, raw_dir: Path, cut_dir: Path, max_workers: Optional[int] = None,
+                 encoder_sessions: Optional[int] = None):
+        """Khởi tạo processor để cắt video từ raw thành các segment
+
+        Args:
+            max_workers: Số raw video xử lý đồng thời (mặc định tính theo CPU và GPU)
+            encoder_sessions: Số phiên NVENC tối đa của card (mặc định env NVENC_SESSIONS hoặc 3)
+        """
         self.raw_dir = Path(raw_dir)
         self.cut_dir = Path(cut_dir)
         self.file_manager = FileManager(raw_dir=self.raw_dir, cut_dir=self.cut_dir)
         self.video_cutter = VideoCutter(self.cut_dir)
+        self.max_workers = max_workers
+        self.encoder_sessions = encoder_sessions or int(os.getenv("NVENC_SESSIONS", "3"))
+        self._gpu_supported: Optional[bool] = None
+
+    def check_gpu_support(self) -> bool:
+        """Check if GPU encoding is supported"""
+        if self._gpu_supported is None:
+            try:
+                result = subprocess.run(
+                    ['ffmpeg', '-hide_banner', '-encoders'],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
+                self._gpu_supported = 'h264_nvenc' in result.stdout
+            except Exception:
+                self._gpu_supported = False
+        return self._gpu_supported
+
+    def get_pool_size(self, file_count: int) -> int:
+        """Số worker: giới hạn bởi số CPU và số phiên encoder GPU"""
+        if self.max_workers:
+            size = self.max_workers
+        else:
+            size = max(1, (os.cpu_count() or 1) // self.THREADS_PER_ENCODE)
+            if self.check_gpu_support():
+                size = min(size, self.encoder_sessions)
+        return max(1, min(size, file_count))
+
+    def plan(self, min_duration: float = 4.0, max_duration: float = 7.0) -> Dict:
+        """Dry-run: ước lượng số segment và thời gian xử lý mà không encode"""
+        raw_videos = self.file_manager.get_raw_videos()
+        average_segment = (min_duration + max_duration) / 2
+        files = []
+        total_duration = 0.0
+        for raw_video in raw_videos:
+            duration = self.video_cutter.media_probe.get_duration(raw_video)
+            total_duration += duration
+            files.append({
+                "file": str(raw_video),
+                "duration": round(duration, 2),
+                "estimated_segments": int(duration // average_segment) + (1 if duration % average_segment else 0)
+            })
+
+        workers = self.get_pool_size(len(raw_videos)) if raw_videos else 0
+        speed = self.ESTIMATED_SPEED_GPU if self.check_gpu_support() else self.ESTIMATED_SPEED_CPU
+        estimated_runtime = total_duration / (speed * workers) if workers else 0.0
+        return {
+            "files": files,
+            "total_files": len(files),
+            "total_duration": round(total_duration, 2),
+            "estimated_segments": sum(f["estimated_segments"] for f in files),
+            "workers": workers,
+            "estimated_runtime": round(estimated_runtime, 1)
+        }
+
+    def process_raw_videos(self, min_duration: float = 4.0, max_duration: float = 7.0,
+                           dry_run: bool = False,
+                           progress_callback: Optional[Callable[[Dict], None]] = None):
+        """Xử lý tất cả video raw: chuẩn hóa và cắt thành các segment
+
+        Các raw video được xử lý song song trong một process pool. Lỗi của
+        một file không ảnh hưởng đến các file khác.
+
+        Args:
+            dry_run: Chỉ trả về kế hoạch (xem plan()), không encode
+            progress_callback: Nhận dict tiến độ sau mỗi file hoàn thành
+
+        Returns:
+            List[Path] các segment đã tạo, hoặc dict kế hoạch nếu dry_run
+        """
+        if dry_run:
+            plan = self.plan(min_duration, max_duration)
+            logging.info(
+                f"Dry run: {plan['total_files']} files, ~{plan['estimated_segments']} segments, "
+                f"~{plan['estimated_runtime']}s with {plan['workers']} workers"
+            )
+            return plan
 
-    def process_raw_videos(self, min_duration: float = 4.0, max_duration: float = 7.0) -> List[Path]:
-        """Xử lý tất cả video raw: chuẩn hóa và cắt thành các segment"""
         try:
             # Lấy danh sách raw videos
             raw_videos = self.file_manager.get_raw_videos()
             if not raw_videos:
                 raise ValueError("No raw videos found in raw directory")
 
-            logging.info(f"Found {len(raw_videos)} raw videos to process")
+            workers = self.get_pool_size(len(raw_videos))
+            logging.info(f"Found {len(raw_videos)} raw videos to process with {workers} workers")
             processed_segments = []
+            failed = []
+            started = time.time()
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(
+                        _process_raw_video_worker, str(self.cut_dir), str(raw_video),
+                        min_duration, max_duration
+                    ): raw_video
+                    for raw_video in raw_videos
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    raw_video = futures[future]
+                    error = None
+                    segments = []
+                    try:
+                        segments = [Path(p) for p in future.result()]
+                        processed_segments.extend(segments)
+                        logging.info(f"Created {len(segments)} segments from {raw_video}")
+                    except Exception as e:
+                        error = str(e)
+                        failed.append(raw_video)
+                        logging.error(f"Error processing raw video {raw_video}: {e}")
 
-            # Xử lý từng raw video
-            for raw_video in raw_videos:
-                try:
-                    logging.info(f"Processing raw video: {raw_video}")
-                    segments = self.video_cutter.process_raw_video(
-                        raw_video,
-                        min_duration=min_duration,
-                        max_duration=max_duration
-                    )
-                    processed_segments.extend(segments)
-                    logging.info(f"Created {len(segments)} segments from {raw_video}")
-                except Exception as e:
-                    logging.error(f"Error processing raw video {raw_video}: {e}")
-                    continue
+                    progress = {
+                        "processed": done,
+                        "total": len(raw_videos),
+                        "failed": len(failed),
+                        "segments": len(processed_segments),
+                        "current_video": raw_video.name,
+                        "current_segments": len(segments),
+                        "error": error,
+                        "elapsed": round(time.time() - started, 1)
+                    }
+                    logging.info(f"Progress: {done}/{len(raw_videos)} files, {len(processed_segments)} segments")
+                    if progress_callback:
+                        try:
+                            progress_callback(progress)
+                        except Exception as e:
+                            logging.warning(f"Progress callback error: {e}")
 
             # Kiểm tra kết quả
             if not processed_segments:
                 raise ValueError("No segments were created from raw videos")
 
-            logging.info(f"Successfully created {len(processed_segments)} segments from {len(raw_videos)} raw videos")
+            logging.info(
+                f"Successfully created {len(processed_segments)} segments from {len(raw_videos)} raw videos "
+                f"({len(failed)} failed) in {time.time() - started:.1f}s"
+            )
             return processed_segments
 
         except Exception as e:
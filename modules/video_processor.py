@@ -2,19 +2,42 @@ import os
 from pathlib import Path
 import logging
 import subprocess
-import random
 import time
-from typing import Dict, List, Optional
+import asyncio
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from .file_manager import FileManager
 from .video_cutter import VideoCutter
 from .subtitle_processor import SubtitleProcessor
+from .media_probe import get_media_probe
+from .clip_catalog import get_clip_catalog
+from .clip_selector import ClipSelector
+from .ffmpeg_runner import run_ffmpeg, run_ffmpeg_async
+from .scratch import ScratchAllocator
+from .subtitle_overlay import SubtitleOverlayRenderer
+from .job_control import JobCancelledError
 
 class VideoProcessor:
-    def __init__(self, base_path: Path):
+    # Rough scratch use per second of output (cut clip + temp_concat.mp4)
+    SCRATCH_BYTES_PER_SECOND = 2 * 1024 * 1024
+
+    def __init__(self, base_path: Path, clip_indexer=None):
         self.base_path = base_path
+        self.clip_indexer = clip_indexer
         self.file_manager = FileManager(base_path)
         self.video_cutter = VideoCutter(base_path)
-        self.subtitle_processor = SubtitleProcessor()
+        self.subtitle_processor = SubtitleProcessor(Path(base_path) / 'cache' / 'subtitles')
+        self.media_probe = get_media_probe()
+        self.catalog = get_clip_catalog(Path(base_path) / 'cache' / 'clip_catalog.db')
+        self.clip_selector = ClipSelector(fps=30)
+        self.render_mode = 'single_pass'
+        # Intermediates go to SCRATCH_DIRS when there is room, else to temp/
+        self.scratch = ScratchAllocator.from_env(Path(base_path) / 'temp')
+        # Subtitles pre-rendered to an overlay track (SUBTITLE_PRERENDER=0 burns them with ass inline)
+        self.prerender_subtitles = os.getenv('SUBTITLE_PRERENDER', '1').strip() != '0'
+        self.subtitle_overlay = SubtitleOverlayRenderer(Path(base_path) / 'cache' / 'subtitle_overlays', fps=30)
+        self._overlay_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='subtitle-overlay')
         
     def _safe_delete_file(self, file_path: Path, max_retries: int = 3, initial_delay: float = 0.5):
         """Safely delete a file with retries and exponential backoff"""
@@ -69,69 +92,30 @@ class VideoProcessor:
                 logging.error(f"Error checking file size: {size_err}")
                 return 0.0
             
-            cmd = [
-                'ffprobe', 
-                '-v', 'error', 
-                '-show_entries', 'format=duration', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                str(video_path)
-            ]
-            
-            logging.info(f"FFprobe command: {' '.join(cmd)}")
-            
-            try:
-                result = subprocess.run(
-                    cmd, 
-                    capture_output=True, 
-                    text=True, 
-                    encoding='utf-8', 
-                    errors='replace',
-                    check=False
-                )
-            except Exception as subprocess_err:
-                logging.error(f"Subprocess error: {subprocess_err}")
-                return 0.0
-            
-            if result.returncode != 0:
-                logging.error(f"FFprobe error for {video_path}")
-                logging.error(f"FFprobe stderr: {result.stderr}")
-                return 0.0
-            
-            output = result.stdout.strip()
-            if not output:
+            duration = self.media_probe.get_duration(video_path)
+            if duration <= 0:
                 logging.warning(f"No duration found for {video_path}")
-                return 0.0
-            
-            logging.info(f"FFprobe output: {output}")
-            
-            try:
-                duration = float(output)
-                return duration
-            except ValueError:
-                logging.error(f"Cannot convert duration to float: {output}")
-                return 0.0
+            return duration
         
         except Exception as e:
             logging.error(f"Unexpected error getting video duration for {video_path}: {str(e)}")
             return 0.0
 
+    def get_clip_durations(self, clip_dir: Path) -> Dict[Path, float]:
+        """Get durations of all usable clips, preferring the background indexer"""
+        if self.clip_indexer and self.clip_indexer.watches(clip_dir) and self.clip_indexer.is_ready(clip_dir):
+            durations = self.clip_indexer.get_durations(clip_dir)
+            if durations:
+                return durations
+        return self.catalog.sync_directory(clip_dir)
+
     def get_video_size(self, video_path: str) -> tuple:
-        """Get video dimensions using ffprobe"""
-        try:
-            cmd = [
-                'ffprobe', 
-                '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height',
-                '-of', 'csv=s=x:p=0',
-                str(video_path)
-            ]
-            output = subprocess.check_output(cmd).decode('utf-8').strip()
-            width, height = map(int, output.split('x'))
-            return width, height
-        except Exception as e:
-            logging.error(f"Error getting video dimensions: {str(e)}")
+        """Get video dimensions"""
+        width, height = self.media_probe.get_size(Path(video_path))
+        if not width or not height:
+            logging.error(f"Error getting video dimensions: {video_path}")
             return 1920, 1080  # Default size if unable to detect
+        return width, height
 
     def check_gpu_support(self) -> bool:
         """Check if GPU encoding is supported"""
@@ -169,6 +153,262 @@ class VideoProcessor:
                 ]
             }
 
+    def _write_concat_file(self, concat_file: Path, videos: List[Path], trim_duration: Optional[float] = None):
+        """Write a concat demuxer list, optionally ending the last clip at trim_duration"""
+        with open(concat_file, 'w', encoding='utf-8') as f:
+            for index, video in enumerate(videos):
+                f.write(f"file '{Path(video).absolute()}'\n")
+                if trim_duration is not None and index == len(videos) - 1:
+                    f.write(f"outpoint {trim_duration:.3f}\n")
+
+    def _build_final_command(
+        self,
+        video_input: List[str],
+        audio_path: Path,
+        subtitle_path: Path,
+        overlay1_path: Optional[Path],
+        overlay2_path: Optional[Path],
+        output_path: Path,
+        encoding_settings: dict,
+        subtitle_overlay: Optional[Path] = None
+    ) -> List[str]:
+        """Build the ffmpeg command that adds overlays, subtitles and audio
+
+        Args:
+            video_input: Input arguments of the background video (input 0)
+            subtitle_overlay: Pre-rendered subtitle overlay, the ASS is burned in if None
+        """
+        cmd = ['ffmpeg', '-y']
+        cmd.extend(encoding_settings['hwaccel'])
+        cmd.extend(video_input)
+        cmd.extend(['-i', str(audio_path)])
+
+        overlay_inputs = []
+        for overlay_path in (overlay1_path, overlay2_path):
+            if overlay_path:
+                cmd.extend(['-i', str(overlay_path)])
+                overlay_inputs.append(len(overlay_inputs) + 2)
+
+        filter_complex = ["[0:v]null[base]"]
+        last_output = "base"
+        for index, input_index in enumerate(overlay_inputs, 1):
+            filter_complex.append(f"[{last_output}][{input_index}:v]overlay=(W-w)/2:(H-h)/2[ov{index}]")
+            last_output = f"ov{index}"
+
+        # Thêm subtitle ở layer cuối cùng
+        if subtitle_overlay:
+            cmd.extend(['-i', str(subtitle_overlay)])
+            subtitle_input = len(overlay_inputs) + 2
+            filter_complex.append(f"[{last_output}][{subtitle_input}:v]overlay=0:0:eof_action=pass[final]")
+        else:
+            # Chuẩn hóa đường dẫn subtitle
+            subtitle_path_str = str(subtitle_path).replace("\\", "/").replace(":", "\\:")
+            filter_complex.append(f"[{last_output}]ass='{subtitle_path_str}'[final]")
+
+        cmd.extend([
+            '-filter_complex', ';'.join(filter_complex),
+            '-map', '[final]',
+            '-map', '1:a'
+        ])
+        cmd.extend(encoding_settings['video_codec'])
+        cmd.extend([
+            '-c:a', 'aac',
+            '-b:a', '192k'
+        ])
+        cmd.append(str(output_path))
+        return cmd
+
+    def _start_subtitle_overlay(self, subtitle_path: Path, reference_video: Path,
+                                duration: float) -> Optional[Future]:
+        """Start pre-rendering the subtitle overlay at the size of the background clips"""
+        if not self.prerender_subtitles or Path(subtitle_path).suffix.lower() != '.ass':
+            return None
+        width, height = self.media_probe.get_size(reference_video)
+        if not width or not height:
+            return None
+        # In a copy of this context so the overlay ffmpeg belongs to the job and reports progress
+        return self._overlay_executor.submit(
+            contextvars.copy_context().run,
+            self.subtitle_overlay.render, subtitle_path, width, height, duration
+        )
+
+    def _single_pass_command(self, videos: List[Path], trim_duration: Optional[float], audio_path: Path,
+                             subtitle_path: Path, overlay1_path: Optional[Path], overlay2_path: Optional[Path],
+                             output_path: Path, encoding_settings: dict, temp_dir: Path,
+                             subtitle_overlay: Optional[Path] = None) -> List[str]:
+        """Decode the selected clips straight into the overlay/ass/audio filtergraph, one encode"""
+        concat_file = temp_dir / 'concat.txt'
+        self._write_concat_file(concat_file, videos, trim_duration)
+
+        cmd = self._build_final_command(
+            ['-f', 'concat', '-safe', '0', '-i', str(concat_file)],
+            audio_path, subtitle_path, overlay1_path, overlay2_path, output_path, encoding_settings,
+            subtitle_overlay
+        )
+        logging.info(f"FFmpeg command (single pass): {' '.join(cmd)}")
+        return cmd
+
+    def _two_pass_background_commands(self, videos: List[Path], trim_duration: Optional[float],
+                                      encoding_settings: dict, temp_dir: Path) -> Tuple[List[Tuple[List[str], Optional[str]]], Path]:
+        """Commands of the first pass of the original render path
+
+        Returns:
+            ([(cmd, stage), ...], temp_concat.mp4 path); stage is None for
+            steps without progress reporting
+        """
+        videos = list(videos)
+        steps = []
+        if trim_duration is not None:
+            # Cut the last clip to fit
+            last_video = videos[-1]
+            cut_video_path = temp_dir / f"cut_{len(videos) - 1:04d}.mp4"
+
+            cut_cmd = [
+                'ffmpeg', '-y',
+                '-i', str(last_video),
+                '-t', str(trim_duration),
+                '-c', 'copy',
+                str(cut_video_path)
+            ]
+            steps.append((cut_cmd, None))
+            videos[-1] = cut_video_path
+            logging.info(f"Partially selected video: {last_video} (Cut duration: {trim_duration:.2f}s)")
+
+        # Create concat file
+        concat_file = temp_dir / 'concat.txt'
+        self._write_concat_file(concat_file, videos)
+
+        # Concatenate videos
+        temp_video = temp_dir / 'temp_concat.mp4'
+
+        concat_cmd = ['ffmpeg', '-y']
+        concat_cmd.extend(encoding_settings['hwaccel'])
+        concat_cmd.extend([
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', str(concat_file)
+        ])
+        concat_cmd.extend(encoding_settings['video_codec'])
+        concat_cmd.append(str(temp_video))
+        steps.append((concat_cmd, 'concat'))
+        return steps, temp_video
+
+    def _render_single_pass(self, videos: List[Path], trim_duration: Optional[float], audio_path: Path,
+                            subtitle_path: Path, overlay1_path: Optional[Path], overlay2_path: Optional[Path],
+                            output_path: Path, encoding_settings: dict, temp_dir: Path,
+                            overlay_future: Optional[Future] = None):
+        cmd = self._single_pass_command(
+            videos, trim_duration, audio_path, subtitle_path, overlay1_path, overlay2_path,
+            output_path, encoding_settings, temp_dir,
+            overlay_future.result() if overlay_future else None
+        )
+        run_ffmpeg(cmd, check=True, duration=self.media_probe.get_duration(audio_path), stage='render')
+
+    def _render_two_pass(self, videos: List[Path], trim_duration: Optional[float], audio_path: Path,
+                         subtitle_path: Path, overlay1_path: Optional[Path], overlay2_path: Optional[Path],
+                         output_path: Path, encoding_settings: dict, temp_dir: Path,
+                         overlay_future: Optional[Future] = None):
+        """Original render path: encode the concat to temp_concat.mp4, then encode the final video"""
+        audio_duration = self.media_probe.get_duration(audio_path)
+        steps, temp_video = self._two_pass_background_commands(videos, trim_duration, encoding_settings, temp_dir)
+        for step_cmd, stage in steps:
+            run_ffmpeg(step_cmd, check=True, duration=audio_duration if stage else None, stage=stage)
+
+        cmd = self._build_final_command(
+            ['-i', str(temp_video)],
+            audio_path, subtitle_path, overlay1_path, overlay2_path, output_path, encoding_settings,
+            overlay_future.result() if overlay_future else None
+        )
+        logging.info(f"FFmpeg command: {' '.join(cmd)}")
+        run_ffmpeg(cmd, check=True, duration=audio_duration, stage='render')
+
+    def _prepare_job(
+        self,
+        audio_path: Path,
+        subtitle_path: Path,
+        overlay1_path: Optional[Path] = None,
+        overlay2_path: Optional[Path] = None,
+        subtitle_config: Optional[Dict] = None,
+        output_name: Optional[str] = None,
+        seed: Optional[int] = None
+    ) -> Dict:
+        """Validate the inputs and pick the background clips of a render
+
+        Returns:
+            Dict with the render arguments shared by process_video and
+            process_video_async (inputs, selected_videos, trim_duration,
+            audio_duration, output_path, encoding_settings)
+        """
+        audio_path = Path(audio_path)
+        subtitle_path = Path(subtitle_path)
+        
+        if not audio_path.exists():
+            raise FileNotFoundError(f"Audio file not found: {audio_path}")
+        if not subtitle_path.exists():
+            raise FileNotFoundError(f"Subtitle file not found: {subtitle_path}")
+        
+        if subtitle_path.suffix.lower() == '.srt':
+            subtitle_path = self.subtitle_processor.convert_srt_to_ass(
+                subtitle_path, 
+                subtitle_config or {}
+            )
+        
+        if overlay1_path and not Path(overlay1_path).exists():
+            logging.warning(f"Overlay1 file not found: {overlay1_path}")
+            overlay1_path = None
+        
+        if overlay2_path and not Path(overlay2_path).exists():
+            logging.warning(f"Overlay2 file not found: {overlay2_path}")
+            overlay2_path = None
+        
+        self.base_path.joinpath('temp').mkdir(parents=True, exist_ok=True)
+        self.base_path.joinpath('final').mkdir(parents=True, exist_ok=True)
+        
+        audio_duration = self.get_video_duration(audio_path)
+        
+        clip_durations = self.get_clip_durations(self.file_manager.cut_dir)
+        cut_videos = list(clip_durations.keys())
+        if not cut_videos:
+            raise ValueError("No cut videos available. Please run video cutter first.")
+        
+        selection = self.clip_selector.select(
+            clip_durations,
+            audio_duration,
+            use_counts=self.catalog.get_use_counts(cut_videos),
+            seed=seed
+        )
+        if not selection.clips:
+            raise ValueError("Could not find suitable videos for the audio duration")
+        
+        used_clips = list(selection.clips)
+        selected_videos = list(selection.clips)
+        logging.info(f"Selected {len(selected_videos)} videos (Total: {selection.total_duration:.2f}s, Target: {audio_duration:.2f}s)")
+        
+        # Length the last clip has to be cut to, None if the selection fits exactly
+        trim_duration = None
+        if selection.needs_trim:
+            trim_duration = selection.durations[-1] - selection.overshoot
+        
+        self.catalog.mark_used(used_clips)
+        
+        if output_name:
+            output_path = self.base_path / 'final' / output_name
+        else:
+            output_path = self.base_path / 'final' / f"{audio_path.stem}_final.mp4"
+        output_path.parent.mkdir(exist_ok=True)
+        
+        return {
+            'audio_path': audio_path,
+            'subtitle_path': subtitle_path,
+            'overlay1_path': overlay1_path,
+            'overlay2_path': overlay2_path,
+            'selected_videos': selected_videos,
+            'trim_duration': trim_duration,
+            'audio_duration': audio_duration,
+            'output_path': output_path,
+            'encoding_settings': self.get_encoding_settings()
+        }
+
     def process_video(
         self,
         audio_path: Path,
@@ -176,185 +416,137 @@ class VideoProcessor:
         overlay1_path: Optional[Path] = None,
         overlay2_path: Optional[Path] = None,
         subtitle_config: Optional[Dict] = None,
-        output_name: Optional[str] = None
+        output_name: Optional[str] = None,
+        seed: Optional[int] = None,
+        render_mode: Optional[str] = None
     ):
-        temp_files = []
+        """Render the final video from cut clips, audio, subtitles and overlays
+
+        Args:
+            render_mode: 'single_pass' (one encode, default) or 'two_pass'
+                (concat to temp_concat.mp4 first). Single-pass falls back to
+                two-pass if ffmpeg fails.
+        """
+        workspace = None
         try:
-            audio_path = Path(audio_path)
-            subtitle_path = Path(subtitle_path)
-            
-            if not audio_path.exists():
-                raise FileNotFoundError(f"Audio file not found: {audio_path}")
-            if not subtitle_path.exists():
-                raise FileNotFoundError(f"Subtitle file not found: {subtitle_path}")
-            
-            if subtitle_path.suffix.lower() == '.srt':
-                subtitle_path = self.subtitle_processor.convert_srt_to_ass(
-                    subtitle_path, 
-                    subtitle_config or {}
-                )
-            
-            if overlay1_path and not Path(overlay1_path).exists():
-                logging.warning(f"Overlay1 file not found: {overlay1_path}")
-                overlay1_path = None
-            
-            if overlay2_path and not Path(overlay2_path).exists():
-                logging.warning(f"Overlay2 file not found: {overlay2_path}")
-                overlay2_path = None
-            
-            self.base_path.joinpath('temp').mkdir(parents=True, exist_ok=True)
-            self.base_path.joinpath('final').mkdir(parents=True, exist_ok=True)
-            
-            audio_duration = self.get_video_duration(audio_path)
-            
-            cut_videos = self.file_manager.get_cut_videos()
-            if not cut_videos:
-                raise ValueError("No cut videos available. Please run video cutter first.")
-            
-            selected_videos = []
-            current_duration = 0
-            available_videos = cut_videos.copy()
-            
-            while current_duration < audio_duration and available_videos:
-                video = random.choice(available_videos)
-                available_videos.remove(video)
-                
-                video_duration = self.get_video_duration(video)
-                
-                if video_duration <= 0:
-                    logging.warning(f"Skipping video with zero duration: {video}")
-                    continue
-                
-                if current_duration + video_duration > audio_duration:
-                    cut_duration = audio_duration - current_duration
-                    
-                    cut_video_path = self.base_path / 'temp' / f"cut_{len(selected_videos):04d}.mp4"
-                    temp_files.append(cut_video_path)
-                    
-                    cut_cmd = [
-                        'ffmpeg', '-y', 
-                        '-i', str(video), 
-                        '-t', str(cut_duration),
-                        '-c', 'copy',
-                        str(cut_video_path)
-                    ]
-                    
-                    subprocess.run(cut_cmd, check=True)
-                    
-                    selected_videos.append(cut_video_path)
-                    current_duration += cut_duration
-                    logging.info(f"Partially selected video: {video} (Cut duration: {cut_duration:.2f}s, Total: {current_duration:.2f}s)")
-                    break
-                else:
-                    selected_videos.append(video)
-                    current_duration += video_duration
-                    logging.info(f"Selected video: {video} (Duration: {video_duration:.2f}s, Total: {current_duration:.2f}s)")
-                
-                if current_duration < audio_duration and not available_videos:
-                    logging.warning(f"Reusing cut videos to reach target duration. Current: {current_duration:.2f}s, Target: {audio_duration:.2f}s")
-                    available_videos = [v for v in cut_videos if v not in selected_videos]
-                    if not available_videos:
-                        available_videos = cut_videos.copy()
-            
-            if not selected_videos:
-                raise ValueError("Could not find suitable videos for the audio duration")
-            
-            # Create concat file
-            concat_file = self.base_path / 'temp' / 'concat.txt'
-            temp_files.append(concat_file)
-            
-            with open(concat_file, 'w', encoding='utf-8') as f:
-                for video in selected_videos:
-                    f.write(f"file '{video.absolute()}'\n")
-            
-            # Concatenate videos
-            temp_video = self.base_path / 'temp' / 'temp_concat.mp4'
-            temp_files.append(temp_video)
-            
-            encoding_settings = self.get_encoding_settings()
-            
-            concat_cmd = [
-                'ffmpeg', '-y'
-            ]
-            concat_cmd.extend(encoding_settings['hwaccel'])
-            concat_cmd.extend([
-                '-f', 'concat',
-                '-safe', '0',
-                '-i', str(concat_file)
-            ])
-            concat_cmd.extend(encoding_settings['video_codec'])
-            concat_cmd.append(str(temp_video))
-            
-            subprocess.run(concat_cmd, check=True)
-            
-            # Add audio, subtitle and overlays
-            if output_name:
-                output_path = self.base_path / 'final' / output_name
-            else:
-                output_path = self.base_path / 'final' / f"{audio_path.stem}_final.mp4"
-            output_path.parent.mkdir(exist_ok=True)
-
-            # Build FFmpeg command
-            cmd = ['ffmpeg', '-y']
-            cmd.extend(encoding_settings['hwaccel'])
-            cmd.extend([
-                '-i', str(temp_video),
-                '-i', str(audio_path)
-            ])
-
-            input_files = 2
-            if overlay1_path:
-                cmd.extend(['-i', str(overlay1_path)])
-                input_files += 1
-            if overlay2_path:
-                cmd.extend(['-i', str(overlay2_path)])
-                input_files += 1
-
-            filter_complex = []
-            
-            filter_complex.append("[0:v]null[base]")
-            last_output = "base"
-            
-            if overlay1_path:
-                filter_complex.append(f"[{last_output}][{input_files-2}:v]overlay=(W-w)/2:(H-h)/2[ov1]")
-                last_output = "ov1"
-            
-            if overlay2_path:
-                filter_complex.append(f"[{last_output}][{input_files-1}:v]overlay=(W-w)/2:(H-h)/2[ov2]")
-                last_output = "ov2"
+            job = self._prepare_job(
+                audio_path, subtitle_path, overlay1_path, overlay2_path,
+                subtitle_config, output_name, seed
+            )
+            render_args = (
+                job['selected_videos'], job['trim_duration'], job['audio_path'], job['subtitle_path'],
+                job['overlay1_path'], job['overlay2_path'], job['output_path'], job['encoding_settings']
+            )
+            render_mode = render_mode or self.render_mode
+            # Private directory for this job's intermediates
+            workspace = self.scratch.allocate(job['audio_duration'] * self.SCRATCH_BYTES_PER_SECOND)
             
-            # Chuẩn hóa đường dẫn subtitle
-            subtitle_path_str = str(subtitle_path).replace("\\", "/").replace(":", "\\:")
+            # Subtitle overlay renders while the background is assembled
+            overlay_future = self._start_subtitle_overlay(
+                job['subtitle_path'], job['selected_videos'][0], job['audio_duration']
+            )
             
-            # Thêm subtitle ở layer cuối cùng
-            filter_complex.append(f"[{last_output}]ass='{subtitle_path_str}'[final]")
-            last_output = "final"
+            if render_mode == 'single_pass':
+                try:
+                    self._render_single_pass(*render_args, workspace.path, overlay_future)
+                except subprocess.CalledProcessError as e:
+                    logging.warning(f"Single-pass render failed ({e}), falling back to two-pass render")
+                    render_mode = 'two_pass'
+                    # The fallback burns the subtitle inline in case the overlay was the problem
+                    overlay_future = None
+            
+            if render_mode == 'two_pass':
+                self._render_two_pass(*render_args, workspace.path, overlay_future)
 
-            cmd.extend([
-                '-filter_complex', ';'.join(filter_complex),
-                '-map', f'[{last_output}]',
-                '-map', '1:a'
-            ])
-            cmd.extend(encoding_settings['video_codec'])
-            cmd.extend([
-                '-c:a', 'aac',
-                '-b:a', '192k'
-            ])
-            cmd.append(str(output_path))
+            return job['output_path']
 
-            # Log FFmpeg command
-            logging.info(f"FFmpeg command: {' '.join(cmd)}")
+        except Exception as e:
+            logging.error(f"Error processing video: {str(e)}")
+            raise
+        finally:
+            if workspace:
+                # Give ffmpeg some time to release file handles
+                time.sleep(0.5)
+                workspace.cleanup()
 
-            subprocess.run(cmd, check=True)
+    async def process_video_async(
+        self,
+        audio_path: Path,
+        subtitle_path: Path,
+        overlay1_path: Optional[Path] = None,
+        overlay2_path: Optional[Path] = None,
+        subtitle_config: Optional[Dict] = None,
+        output_name: Optional[str] = None,
+        seed: Optional[int] = None,
+        render_mode: Optional[str] = None,
+        timeout: Optional[float] = None
+    ):
+        """process_video for the API event loop
 
-            # Give ffmpeg some time to release file handles
-            time.sleep(0.5)
+        Clip selection and probing run in a worker thread and ffmpeg runs as
+        an asyncio subprocess, so the server keeps answering while it renders.
+        Cancelling the task kills the running ffmpeg and removes the workspace.
 
-            # Clean up temp files
-            self._cleanup_temp_files(temp_files)
+        Args:
+            timeout: Limit in seconds for each ffmpeg step (None: no limit)
+        """
+        workspace = None
+        try:
+            job = await asyncio.to_thread(
+                self._prepare_job, audio_path, subtitle_path, overlay1_path, overlay2_path,
+                subtitle_config, output_name, seed
+            )
+            render_args = (
+                job['selected_videos'], job['trim_duration'], job['audio_path'], job['subtitle_path'],
+                job['overlay1_path'], job['overlay2_path'], job['output_path'], job['encoding_settings']
+            )
+            audio_duration = job['audio_duration']
+            render_mode = render_mode or self.render_mode
+            workspace = await asyncio.to_thread(
+                self.scratch.allocate, audio_duration * self.SCRATCH_BYTES_PER_SECOND
+            )
+            
+            overlay_future = await asyncio.to_thread(
+                self._start_subtitle_overlay, job['subtitle_path'], job['selected_videos'][0], audio_duration
+            )
+            
+            if render_mode == 'single_pass':
+                subtitle_overlay = await asyncio.wrap_future(overlay_future) if overlay_future else None
+                cmd = self._single_pass_command(*render_args, workspace.path, subtitle_overlay)
+                try:
+                    await run_ffmpeg_async(cmd, timeout=timeout, check=True, duration=audio_duration, stage='render')
+                except subprocess.CalledProcessError as e:
+                    logging.warning(f"Single-pass render failed ({e}), falling back to two-pass render")
+                    render_mode = 'two_pass'
+                    overlay_future = None
+            
+            if render_mode == 'two_pass':
+                steps, temp_video = self._two_pass_background_commands(
+                    job['selected_videos'], job['trim_duration'], job['encoding_settings'], workspace.path
+                )
+                for step_cmd, stage in steps:
+                    await run_ffmpeg_async(
+                        step_cmd, timeout=timeout, check=True,
+                        duration=audio_duration if stage else None, stage=stage
+                    )
+                cmd = self._build_final_command(
+                    ['-i', str(temp_video)],
+                    *render_args[2:],
+                    await asyncio.wrap_future(overlay_future) if overlay_future else None
+                )
+                logging.info(f"FFmpeg command: {' '.join(cmd)}")
+                await run_ffmpeg_async(cmd, timeout=timeout, check=True, duration=audio_duration, stage='render')
 
-            return output_path
+            return job['output_path']
 
+        except (asyncio.CancelledError, JobCancelledError):
+            logging.info(f"Video render cancelled: {audio_path}")
+            raise
         except Exception as e:
             logging.error(f"Error processing video: {str(e)}")
             raise
+        finally:
+            if workspace:
+                # Give ffmpeg some time to release file handles
+                await asyncio.sleep(0.5)
+                await asyncio.to_thread(workspace.cleanup)
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+import weakref
+from pathlib import Path
+from typing import Callable, Optional
+import psutil
+
+class JobWorkspace:
+    """Private scratch directory of one render job
+
+    Every job writes its intermediates (concat lists, cut clips, partial
+    renders) into <root>/jobs/<job_id>, so concurrent jobs never share a file
+    name. The directory records the owning process in an .owner file and is
+    removed when the job finishes; directories left behind by a crashed
+    process are removed by collect_orphans().
+
+    Outputs of ffmpeg steps written into the workspace are added to
+    bytes_written as they are produced (see record_output), so the count
+    includes intermediates the job deletes before it finishes.
+    """
+
+    JOBS_DIR = 'jobs'
+    OWNER_FILE = '.owner'
+
+    # Created workspaces of this process by directory, for record_output()
+    _active = weakref.WeakValueDictionary()
+    _active_lock = threading.Lock()
+
+    def __init__(self, root: Path, job_id: Optional[str] = None, keep: bool = False,
+                 on_cleanup: Optional[Callable[['JobWorkspace', int], None]] = None):
+        """
+        Args:
+            root: Temp root, the workspace is created in root/jobs
+            job_id: Directory name (default: random id)
+            keep: Leave the directory in place on exit (for debugging)
+            on_cleanup: Called as on_cleanup(workspace, size_bytes) before removal
+        """
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.root = Path(root)
+        self.path = self.root / self.JOBS_DIR / self.job_id
+        self.keep = keep
+        self.on_cleanup = on_cleanup
+        self.created_at: Optional[float] = None
+        self.bytes_written = 0
+
+    def create(self) -> 'JobWorkspace':
+        self.path.mkdir(parents=True, exist_ok=True)
+        process = psutil.Process()
+        self.created_at = time.time()
+        owner = {
+            'pid': process.pid,
+            'create_time': process.create_time(),
+            'created': self.created_at
+        }
+        with open(self.path / self.OWNER_FILE, 'w', encoding='utf-8') as f:
+            json.dump(owner, f)
+        with self._active_lock:
+            self._active[os.path.abspath(self.path)] = self
+        logging.debug(f"Created job workspace {self.path}")
+        return self
+
+    @classmethod
+    def record_output(cls, file_path) -> bool:
+        """Add the size of a file just written to bytes_written of the workspace holding it
+
+        Returns:
+            False if the file is not in a workspace of this process or does not exist
+        """
+        directory = os.path.dirname(os.path.abspath(str(file_path)))
+        with cls._active_lock:
+            workspace = None
+            while workspace is None:
+                workspace = cls._active.get(directory)
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    break
+                directory = parent
+            if workspace is None:
+                return False
+            try:
+                workspace.bytes_written += os.path.getsize(file_path)
+            except OSError:
+                return False
+        return True
+
+    def file(self, name: str) -> Path:
+        """Path of a file inside the workspace"""
+        return self.path / name
+
+    def temp_file(self, base_name: str, extension: str) -> Path:
+        """Unique file path inside the workspace"""
+        return self.path / f"{base_name}_{uuid.uuid4().hex[:8]}.{extension}"
+
+    def size(self) -> int:
+        """Total size in bytes of the files in the workspace"""
+        total = 0
+        for file_path in self.path.rglob('*'):
+            try:
+                if file_path.is_file() and file_path.name != self.OWNER_FILE:
+                    total += file_path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def cleanup(self):
+        """Remove the workspace; files still locked are left for collect_orphans"""
+        with self._active_lock:
+            self._active.pop(os.path.abspath(self.path), None)
+        if not self.path.exists():
+            return
+        if self.on_cleanup:
+            try:
+                self.on_cleanup(self, self.size())
+            except Exception as e:
+                logging.warning(f"Workspace cleanup callback error: {e}")
+            self.on_cleanup = None
+        if self.keep:
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self.path.exists():
+            logging.warning(f"Could not fully remove job workspace {self.path}")
+        else:
+            logging.debug(f"Removed job workspace {self.path}")
+
+    def __enter__(self) -> 'JobWorkspace':
+        return self.create()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+    @staticmethod
+    def _owner_alive(owner: dict) -> bool:
+        """Whether the process that created a workspace is still running"""
+        try:
+            process = psutil.Process(int(owner['pid']))
+            # A reused pid belongs to a process started later
+            return abs(process.create_time() - float(owner['create_time'])) < 1.0
+        except (psutil.NoSuchProcess, psutil.AccessDenied, KeyError, TypeError, ValueError):
+            return False
+
+    @classmethod
+    def collect_orphans(cls, root: Path, max_age: float = 24 * 3600) -> int:
+        """Remove workspaces whose owner process is gone or that are older than max_age
+
+        Directories without a readable .owner file are only removed once they
+        are older than max_age, in case they are being created right now.
+
+        Returns:
+            Number of workspaces removed
+        """
+        jobs_dir = Path(root) / cls.JOBS_DIR
+        if not jobs_dir.exists():
+            return 0
+
+        removed = 0
+        now = time.time()
+        for path in jobs_dir.iterdir():
+            if not path.is_dir():
+                continue
+            age = 0.0
+            owner = None
+            try:
+                age = now - path.stat().st_mtime
+                owner_file = path / cls.OWNER_FILE
+                if owner_file.exists():
+                    with open(owner_file, 'r', encoding='utf-8') as f:
+                        owner = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                owner = None
+
+            if owner is not None:
+                orphaned = not cls._owner_alive(owner) or age > max_age
+            else:
+                orphaned = age > max_age
+            if not orphaned:
+                continue
+
+            shutil.rmtree(path, ignore_errors=True)
+            if not path.exists():
+                removed += 1
+                logging.info(f"Removed orphaned job workspace {path}")
+
+        return removed